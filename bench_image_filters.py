@@ -0,0 +1,106 @@
+"""
+Бенчмарк локальных фильтров фото (generators.image_filters) и смены формата
+
+Прогоняет каждую локальную функцию редактирования на синтетических фото
+разного размера и печатает время на мегапиксель. Для сравнения берется среднее
+время генерации фото моделью (этап generate_photo) из журнала стоимости
+(src.ledger), если он уже накопил данные.
+
+Использование:
+    python bench_image_filters.py [--sizes 1280x720,1920x1080,4000x3000] [--runs 3] [--hours 168]
+"""
+import argparse
+import io
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).parent
+sys.path.insert(0, str(ROOT))
+
+REFRAME_FUNCTIONS = {"format_16_9": "16:9", "format_9_16": "9:16", "format_1_1": "1:1"}
+
+
+def synthetic_photo(width: int, height: int) -> bytes:
+    """JPEG с градиентом, деталями и шумом - похож на фото по нагрузке на фильтры"""
+    import numpy as np
+    from PIL import Image
+
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    base = np.stack([x / width * 200, y / height * 200, (x + y) / (width + height) * 255], axis=2)
+    stripes = 40 * np.sin(x / 7.0)[..., None] * (y > height / 2)[..., None]
+    noise = rng.normal(0, 12, (height, width, 3))
+    array = np.clip(base + stripes + noise, 0, 255).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(array, "RGB").save(buffer, "JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def measure(func, runs: int) -> float:
+    """Лучшее время из runs запусков, с"""
+    best = float("inf")
+    for _ in range(runs):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def ai_reference(hours: float):
+    """Среднее время генерации фото моделью из журнала (None - данных нет)"""
+    try:
+        from src.ledger import ledger
+        rows = ledger.query_totals("stage", since=time.time() - hours * 3600)
+    except Exception as e:
+        print(f"⚠️ Журнал стоимости недоступен: {e}")
+        return None
+    for row in rows:
+        if row["key"] == "generate_photo" and row["calls"]:
+            return row["avg_wall_time"], row["calls"]
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Время локальных фильтров фото на мегапиксель")
+    parser.add_argument("--sizes", default="1280x720,1920x1080,4000x3000", help="Размеры фото через запятую")
+    parser.add_argument("--runs", type=int, default=3, help="Запусков на замер (берется лучший)")
+    parser.add_argument("--hours", type=float, default=168.0, help="Период журнала для сравнения с AI")
+    args = parser.parse_args()
+
+    from generators import media_jobs
+    from generators.image_filters import FILTERS
+
+    sizes = [tuple(int(v) for v in size.split("x")) for size in args.sizes.split(",")]
+    functions = list(FILTERS) + list(REFRAME_FUNCTIONS)
+
+    print(f"📊 Локальное редактирование, лучший из {args.runs} запусков (ms на мегапиксель / ms всего)")
+    print(f"{'function':<18}" + "".join(f"{f'{w}x{h}':>22}" for w, h in sizes))
+    with tempfile.TemporaryDirectory() as tmp:
+        output = str(Path(tmp) / "out.jpg")
+        photos = {(w, h): synthetic_photo(w, h) for w, h in sizes}
+        worst_per_mp = 0.0
+        for function in functions:
+            cells = []
+            for (w, h), photo in photos.items():
+                if function in REFRAME_FUNCTIONS:
+                    seconds = measure(lambda: media_jobs.reframe_image(photo, REFRAME_FUNCTIONS[function], output), args.runs)
+                else:
+                    seconds = measure(lambda: media_jobs.filter_image(photo, function, output), args.runs)
+                per_mp = seconds * 1000 / (w * h / 1e6)
+                worst_per_mp = max(worst_per_mp, per_mp)
+                cells.append(f"{per_mp:>9.0f} / {seconds * 1000:>8.0f}")
+            print(f"{function:<18}" + "".join(f"{cell:>22}" for cell in cells))
+
+    reference = ai_reference(args.hours)
+    if reference:
+        avg_wall_time, calls = reference
+        print(f"\n🤖 Модель (generate_photo): в среднем {avg_wall_time:.1f} с на фото ({calls} вызовов)")
+    else:
+        print("\n🤖 Модель: в журнале нет вызовов generate_photo за период (обычно 30-60 с на фото)")
+    print(f"⚡ Локально: не больше {worst_per_mp:.0f} ms на мегапиксель")
+
+
+if __name__ == "__main__":
+    main()
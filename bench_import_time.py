@@ -0,0 +1,113 @@
+"""
+Бенчмарк времени старта бота (python -X importtime)
+
+Запускает импорт src.main и регистрацию роутеров в отдельном процессе,
+разбирает вывод -X importtime и проверяет бюджет:
+- собственные модули проекта укладываются в --budget-ms;
+- тяжелые SDK (moviepy, openai, replicate, Gemini, numpy, Pillow) не
+  импортируются при старте - они должны загружаться лениво.
+
+Использование:
+    python bench_import_time.py [--budget-ms 150] [--runs 3]
+
+Код возврата 1 - бюджет превышен (можно подключить в CI).
+"""
+import argparse
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parent
+
+STARTUP_CODE = "import src.main; src.main.register_routers()"
+
+PROJECT_PACKAGES = {"src", "generators", "integrations", "models", "data"}
+
+# Эти модули не должны попадать в импорт при старте
+HEAVY_MODULES = [
+    "moviepy",
+    "openai",
+    "replicate",
+    "google.generativeai",
+    "numpy",
+    "PIL",
+    "requests",
+]
+
+
+def run_importtime() -> list:
+    """Запускает старт бота с -X importtime и возвращает записи (модуль, self_us, cumulative_us)"""
+    env = dict(os.environ)
+    # Bot() проверяет формат токена - для замера подойдет фиктивный
+    env.setdefault("BOT_TOKEN", "123456:benchmark")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", STARTUP_CODE],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        print(result.stderr[-2000:])
+        raise SystemExit("❌ Не удалось импортировать src.main")
+
+    records = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        self_us = int(parts[0].strip())
+        cumulative_us = int(parts[1].strip())
+        name = parts[2].strip()
+        records.append((name, self_us, cumulative_us))
+    return records
+
+
+def analyze(records: list) -> dict:
+    """Считает итоговые метрики по одному запуску"""
+    project_us = sum(
+        self_us for name, self_us, _ in records
+        if name.split(".")[0] in PROJECT_PACKAGES
+    )
+    total_us = sum(self_us for _, self_us, _ in records)
+    imported = {name for name, _, _ in records}
+    heavy = [
+        module for module in HEAVY_MODULES
+        if any(name == module or name.startswith(module + ".") for name in imported)
+    ]
+    return {"project_ms": project_us / 1000, "total_ms": total_us / 1000, "heavy": heavy, "records": records}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бюджет времени импорта при старте бота")
+    parser.add_argument("--budget-ms", type=float, default=150.0, help="Бюджет на собственные модули проекта")
+    parser.add_argument("--runs", type=int, default=3, help="Количество запусков (берется лучший)")
+    parser.add_argument("--top", type=int, default=15, help="Сколько самых медленных модулей показать")
+    args = parser.parse_args()
+
+    runs = [analyze(run_importtime()) for _ in range(max(1, args.runs))]
+    best = min(runs, key=lambda r: r["project_ms"])
+
+    print(f"📊 Время импорта при старте (лучший из {len(runs)} запусков)")
+    print(f"   Всего: {best['total_ms']:.0f} ms")
+    print(f"   Модули проекта: {best['project_ms']:.0f} ms (бюджет {args.budget_ms:.0f} ms)")
+    print("\n🐢 Самые медленные импорты (cumulative):")
+    for name, _, cumulative_us in sorted(best["records"], key=lambda r: r[2], reverse=True)[:args.top]:
+        print(f"   {cumulative_us / 1000:8.1f} ms  {name}")
+
+    failed = False
+    if best["heavy"]:
+        print(f"\n❌ Тяжелые модули импортируются при старте: {', '.join(best['heavy'])}")
+        failed = True
+    if best["project_ms"] > args.budget_ms:
+        print(f"\n❌ Бюджет превышен: {best['project_ms']:.0f} ms > {args.budget_ms:.0f} ms")
+        failed = True
+
+    if failed:
+        sys.exit(1)
+    print("\n✅ Бюджет соблюден")
+
+
+if __name__ == "__main__":
+    main()
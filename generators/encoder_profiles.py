@@ -0,0 +1,95 @@
+"""
+Профили кодирования итогового видео
+
+Кодируем программным libx264, поэтому профили одинаково работают на любом
+сервере без GPU. Профиль задает пресет скорости и CRF, а поправки по
+соотношению сторон - потолок битрейта (вертикальное видео смотрят с телефона).
+"""
+import logging
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+# Профили: чем быстрее пресет, тем хуже сжатие при том же CRF
+ENCODER_PROFILES = {
+    "preview": {
+        "preset": "ultrafast",
+        "crf": 32,
+        "audio_bitrate": "64k",
+        "max_height": 480,
+    },
+    "draft": {
+        "preset": "veryfast",
+        "crf": 27,
+        "audio_bitrate": "96k",
+        "max_height": 720,
+    },
+    "final": {
+        "preset": "medium",
+        "crf": 21,
+        "audio_bitrate": "160k",
+        "max_height": None,
+    },
+    "premium": {
+        "preset": "slow",
+        "crf": 18,
+        "audio_bitrate": "192k",
+        "max_height": None,
+    },
+}
+
+# Поправки по соотношению сторон: CRF и потолок битрейта (для финальных профилей)
+ASPECT_RATIO_TUNING = {
+    "16:9": {"crf_offset": 0, "maxrate": "8M"},
+    "9:16": {"crf_offset": 1, "maxrate": "6M"},
+    "1:1": {"crf_offset": 1, "maxrate": "5M"},
+}
+
+DEFAULT_PROFILE = "final"
+
+
+# Кадр сегментов склейки по соотношению сторон (высота - не больше max_height профиля)
+SEGMENT_FRAME_SIZES = {
+    "16:9": (1920, 1080),
+    "9:16": (1080, 1920),
+    "1:1": (1080, 1080),
+}
+SEGMENT_AUDIO_RATE = 48000
+
+
+def get_segment_params(profile: str = DEFAULT_PROFILE, aspect_ratio: Optional[str] = None, fps: int = 30) -> Dict:
+    """
+    Параметры нормализованного сегмента сцены
+
+    Все сегменты одной склейки кодируются с одинаковыми размером кадра, FPS,
+    кодеками и аудио (стерео 48 кГц), поэтому их можно соединить копированием
+    потоков без перекодирования.
+
+    Returns:
+        Словарь для media_jobs.normalize_segment (он же входит в ключ сегмента)
+    """
+    if profile not in ENCODER_PROFILES:
+        logger.warning(f"⚠️ Неизвестный профиль кодирования '{profile}', использую {DEFAULT_PROFILE}")
+        profile = DEFAULT_PROFILE
+
+    settings = ENCODER_PROFILES[profile]
+    tuning = ASPECT_RATIO_TUNING.get(aspect_ratio or "", {"crf_offset": 0, "maxrate": None})
+    width, height = SEGMENT_FRAME_SIZES.get(aspect_ratio or "", SEGMENT_FRAME_SIZES["16:9"])
+    if settings["max_height"] and height > settings["max_height"]:
+        width = round(width * settings["max_height"] / height / 2) * 2
+        height = settings["max_height"]
+
+    params = {
+        "width": width,
+        "height": height,
+        "fps": fps,
+        "preset": settings["preset"],
+        "crf": settings["crf"] + tuning["crf_offset"],
+        "audio_bitrate": settings["audio_bitrate"],
+        "audio_rate": SEGMENT_AUDIO_RATE,
+        "maxrate": None,
+    }
+    if tuning["maxrate"] and settings["max_height"] is None:
+        params["maxrate"] = tuning["maxrate"]
+    return params
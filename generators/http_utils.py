@@ -0,0 +1,61 @@
+"""Общий HTTP пул для генераторов"""
+import sys
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import AsyncIterator, Optional
+
+import aiohttp
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.retry_policy import RetryPolicy, HTTPStatusError
+
+# Для неидемпотентных запросов повторяются только ответы, при которых сервер
+# точно не выполнил запрос
+REJECTED_STATUSES = {429, 503}
+
+
+@asynccontextmanager
+async def http_session(shared: Optional[aiohttp.ClientSession] = None) -> AsyncIterator[aiohttp.ClientSession]:
+    """
+    Возвращает общую keep-alive сессию, а если ее нет - временную
+
+    Args:
+        shared: Сессия из реестра клиентов (src.clients)
+    """
+    if shared is not None and not shared.closed:
+        yield shared
+    else:
+        async with aiohttp.ClientSession() as session:
+            yield session
+
+
+@asynccontextmanager
+async def retrying_request(
+    session: aiohttp.ClientSession,
+    method: str,
+    url: str,
+    policy: RetryPolicy,
+    **kwargs
+) -> AsyncIterator[aiohttp.ClientResponse]:
+    """
+    HTTP запрос с повторами по политике (429 и 5xx, сетевые ошибки)
+
+    Используется как session.get(...): async with retrying_request(...) as resp.
+    Если повторы исчерпаны, пробрасывается HTTPStatusError последнего ответа.
+    """
+    idempotent = method.upper() in ("GET", "HEAD", "PUT", "DELETE", "OPTIONS")
+
+    async def attempt() -> aiohttp.ClientResponse:
+        resp = await session.request(method, url, **kwargs)
+        if resp.status in REJECTED_STATUSES or (idempotent and resp.status >= 500):
+            text = await resp.text()
+            resp.release()
+            raise HTTPStatusError(resp.status, text)
+        return resp
+
+    resp = await policy.run(attempt)
+    try:
+        yield resp
+    finally:
+        resp.release()
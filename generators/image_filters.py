@@ -0,0 +1,134 @@
+"""
+Локальные фильтры фото (Pillow + NumPy) - быстрый уровень редактирования
+
+Базовые технические функции не требуют генеративной модели:
+    upscale         - увеличение Lanczos + легкая нерезкая маска;
+    denoise         - медианный, затем билатеральный фильтр;
+    sharpen         - нерезкая маска (unsharp mask);
+    enhance_general - автоуровни, баланс белого (серый мир) и нерезкая маска.
+Цветовые операции векторизованы на NumPy, свертки - встроенные фильтры Pillow.
+Функции чистые (PIL.Image -> PIL.Image), запускаются в пуле процессов через
+media_jobs.filter_image.
+"""
+from typing import Callable, Dict
+
+# Длинная сторона после увеличения: больше Telegram все равно не покажет
+UPSCALE_MAX_SIDE = 4096
+
+
+def _to_array(image):
+    import numpy as np
+    return np.asarray(image.convert("RGB"), dtype=np.float32)
+
+
+def _from_array(array):
+    import numpy as np
+    from PIL import Image
+    return Image.fromarray(np.clip(array, 0, 255).astype(np.uint8), "RGB")
+
+
+def unsharp_mask(image, radius: float = 2.0, amount: float = 0.8, threshold: int = 3):
+    """Нерезкая маска: image + amount * (image - blur), мелкие различия не трогаем"""
+    import numpy as np
+    from PIL import ImageFilter
+
+    original = _to_array(image)
+    blurred = _to_array(image.convert("RGB").filter(ImageFilter.GaussianBlur(radius)))
+    detail = original - blurred
+    mask = np.abs(detail) >= threshold
+    return _from_array(original + amount * detail * mask)
+
+
+def auto_levels(image, clip_percent: float = 0.5):
+    """Растягивает каждый канал между перцентилями clip_percent и 100 - clip_percent"""
+    import numpy as np
+
+    array = _to_array(image)
+    low = np.percentile(array, clip_percent, axis=(0, 1))
+    high = np.percentile(array, 100 - clip_percent, axis=(0, 1))
+    scale = 255.0 / np.maximum(high - low, 1.0)
+    return _from_array((array - low) * scale)
+
+
+def white_balance(image, strength: float = 0.7):
+    """Баланс белого по гипотезе серого мира (strength - доля коррекции)"""
+    import numpy as np
+
+    array = _to_array(image)
+    means = array.reshape(-1, 3).mean(axis=0)
+    gains = means.mean() / np.maximum(means, 1.0)
+    gains = 1.0 + strength * (gains - 1.0)
+    return _from_array(array * gains)
+
+
+def bilateral_denoise(image, radius: int = 2, sigma_color: float = 20.0, sigma_space: float = 2.0):
+    """
+    Билатеральный фильтр: усреднение соседей с весом по расстоянию и по разнице яркости
+
+    Векторизован по сдвигам окна (2 * radius + 1)^2: края не размываются,
+    а время растет линейно с числом пикселей. Вес по разнице считается
+    по яркости (один канал вместо трех).
+    """
+    import numpy as np
+
+    array = _to_array(image)
+    luma = array @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    height, width, _ = array.shape
+    pad = ((radius, radius), (radius, radius))
+    padded = np.pad(array, pad + ((0, 0),), mode="reflect")
+    padded_luma = np.pad(luma, pad, mode="reflect")
+    total = np.zeros_like(array)
+    weights = np.zeros((height, width), dtype=np.float32)
+    range_scale = np.float32(-1.0 / (2 * sigma_color ** 2))
+
+    for dy in range(-radius, radius + 1):
+        for dx in range(-radius, radius + 1):
+            rows = slice(radius + dy, radius + dy + height)
+            cols = slice(radius + dx, radius + dx + width)
+            spatial = np.float32(np.exp(-(dx * dx + dy * dy) / (2 * sigma_space ** 2)))
+            difference = padded_luma[rows, cols] - luma
+            weight = spatial * np.exp(difference * difference * range_scale)
+            total += padded[rows, cols] * weight[..., None]
+            weights += weight
+    return _from_array(total / weights[..., None])
+
+
+def median_denoise(image, size: int = 3):
+    """Медианный фильтр (импульсный шум, JPEG-артефакты)"""
+    from PIL import ImageFilter
+    return image.convert("RGB").filter(ImageFilter.MedianFilter(size))
+
+
+def upscale(image, factor: float = 2.0):
+    """Увеличение Lanczos (не больше UPSCALE_MAX_SIDE) с легкой резкостью"""
+    from PIL import Image
+
+    width, height = image.size
+    factor = min(factor, UPSCALE_MAX_SIDE / max(width, height))
+    if factor <= 1.0:
+        return unsharp_mask(image, radius=1.0, amount=0.5)
+    size = (round(width * factor), round(height * factor))
+    return unsharp_mask(image.convert("RGB").resize(size, Image.LANCZOS), radius=1.5, amount=0.5)
+
+
+def denoise(image):
+    """Шумоподавление: медиана убирает выбросы, билатеральный фильтр - зерно"""
+    return bilateral_denoise(median_denoise(image, 3))
+
+
+def sharpen(image):
+    return unsharp_mask(image, radius=2.0, amount=1.0)
+
+
+def enhance_general(image):
+    """Общее улучшение: уровни, баланс белого, резкость"""
+    return unsharp_mask(white_balance(auto_levels(image)), radius=1.5, amount=0.6)
+
+
+# Функции редактирования photo_handler, у которых есть локальная реализация
+FILTERS: Dict[str, Callable] = {
+    "upscale": upscale,
+    "denoise": denoise,
+    "sharpen": sharpen,
+    "enhance_general": enhance_general,
+}
@@ -4,16 +4,17 @@ import logging
 import sys
 from pathlib import Path
 import aiohttp
-import requests
-import replicate
-from typing import Optional, Dict, Tuple
+from typing import Optional, Dict, List, Tuple
 
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from aiogram import Bot
-from PIL import Image
-import io
-from src.config import IMGBB_API_KEY, REPLICATE_API_TOKEN
+from src.config import IMGBB_API_KEY, REPLICATE_API_TOKEN, ALBUM_UPLOAD_CONCURRENCY
+from generators.http_utils import http_session
+from generators import media_jobs
+from generators.media_pool import media_pool
+from src.metrics import instrument_stage, record_transfer
+from src.retry_policy import REPLICATE_UPLOAD, IMGBB_UPLOAD, HTTPStatusError
 
 logger = logging.getLogger(__name__)
 
@@ -35,14 +36,20 @@ class ImageUploader:
         "1:1": (1, 1)
     }
     
-    def __init__(self, imgbb_api_key: str = IMGBB_API_KEY, replicate_token: str = REPLICATE_API_TOKEN):
+    def __init__(
+        self,
+        imgbb_api_key: str = IMGBB_API_KEY,
+        replicate_token: str = REPLICATE_API_TOKEN,
+        replicate_client=None,
+        http_session: Optional[aiohttp.ClientSession] = None
+    ):
         self.imgbb_api_key = imgbb_api_key
         self.imgbb_url = "https://api.imgbb.com/1/upload"
         self.replicate_token = replicate_token
         
-        # Инициализируем Replicate клиент
-        if self.replicate_token:
-            replicate.api_token = self.replicate_token
+        # Общие клиенты из src.clients; без них Replicate клиент создается при первой загрузке
+        self.replicate_client = replicate_client
+        self.http_session = http_session
     
     async def download_telegram_photo(self, bot: Bot, file_id: str) -> Optional[bytes]:
         """
@@ -60,11 +67,12 @@ class ImageUploader:
             file_path = file.file_path
             
             # Скачиваем файл
-            async with aiohttp.ClientSession() as session:
+            async with http_session(self.http_session) as session:
                 url = f"https://api.telegram.org/file/bot{bot.token}/{file_path}"
                 async with session.get(url) as response:
                     if response.status == 200:
                         photo_bytes = await response.read()
+                        record_transfer("download", "telegram", len(photo_bytes))
                         logger.info(f"✅ Фото скачано с Telegram ({len(photo_bytes)} bytes)")
                         return photo_bytes
                     else:
@@ -75,9 +83,9 @@ class ImageUploader:
             logger.error(f"❌ Ошибка при скачивании фото с Telegram: {e}")
             return None
     
-    def validate_photo_quality(self, image_bytes: bytes) -> Dict[str, any]:
+    async def validate_photo_quality(self, image_bytes: bytes) -> Dict[str, any]:
         """
-        Проверяет качество фото перед загрузкой
+        Проверяет качество фото перед загрузкой (декодирование - в пуле процессов)
         
         Args:
             image_bytes: Bytes изображения
@@ -97,9 +105,9 @@ class ImageUploader:
         warnings = []
         
         try:
-            # Открываем изображение
-            image = Image.open(io.BytesIO(image_bytes))
-            width, height = image.size
+            # Декодируем изображение вне event loop
+            info = await media_pool.run(media_jobs.analyze_image, image_bytes, task_name="validate_photo")
+            width, height = info["width"], info["height"]
             file_size_mb = len(image_bytes) / (1024 * 1024)
             
             logger.info(f"📊 Анализ фото: {width}x{height}px, {file_size_mb:.2f}MB")
@@ -190,19 +198,22 @@ class ImageUploader:
         try:
             import io
             
-            # Создаем file-like объект из bytes
-            file_obj = io.BytesIO(image_bytes)
-            file_obj.name = "image.jpg"
+            if self.replicate_client is None:
+                from replicate import Client
+                self.replicate_client = Client(api_token=self.replicate_token)
             
-            # Загружаем через Replicate Files API
-            loop = asyncio.get_event_loop()
-            file_response = await loop.run_in_executor(
-                None,
-                lambda: replicate.files.create(file_obj)
-            )
+            def upload():
+                # Создаем file-like объект из bytes (заново на каждую попытку)
+                file_obj = io.BytesIO(image_bytes)
+                file_obj.name = "image.jpg"
+                return self.replicate_client.files.create(file_obj)
+            
+            # Загружаем через Replicate Files API (повторы - по политике REPLICATE_UPLOAD)
+            file_response = await REPLICATE_UPLOAD.run(lambda: asyncio.to_thread(upload))
             
             # Получаем URL загруженного файла (правильный метод)
             file_url = file_response.urls.get("get")  # Метод get() требует ключ "get"
+            record_transfer("upload", "replicate", len(image_bytes))
             logger.info(f"✅ Изображение загружено на Replicate: {file_url}")
             return file_url
             
@@ -226,6 +237,8 @@ class ImageUploader:
             return None
         
         try:
+            import requests
+            
             files = {
                 'image': (f'{image_name}.jpg', image_bytes, 'image/jpeg')
             }
@@ -234,17 +247,21 @@ class ImageUploader:
                 'name': image_name
             }
             
-            # Синхронный запрос через loop.run_in_executor
-            loop = asyncio.get_event_loop()
-            response = await loop.run_in_executor(
-                None,
-                lambda: requests.post(self.imgbb_url, files=files, data=data, timeout=60)  # ⏱️ Увеличен timeout
-            )
+            def post():
+                response = requests.post(self.imgbb_url, files=files, data=data, timeout=60)  # ⏱️ Увеличен timeout
+                if response.status_code == 429 or response.status_code >= 500:
+                    # Временная ошибка - повторит политика IMGBB_UPLOAD
+                    raise HTTPStatusError(response.status_code, response.text)
+                return response
+            
+            # Синхронный запрос в потоке
+            response = await IMGBB_UPLOAD.run(lambda: asyncio.to_thread(post))
             
             if response.status_code == 200:
                 result = response.json()
                 if result.get("success"):
                     image_url = result["data"]["url"]
+                    record_transfer("upload", "imgbb", len(image_bytes))
                     logger.info(f"✅ Изображение загружено на ImgBB: {image_url}")
                     return image_url
                 else:
@@ -259,6 +276,7 @@ class ImageUploader:
             logger.error(f"❌ Ошибка при загрузке на ImgBB: {e}")
             return None
     
+    @instrument_stage("process_telegram_photo")
     async def process_telegram_photo(self, bot: Bot, file_id: str, photo_name: str = "photo") -> Optional[str]:
         """
         Скачивает фото с Telegram и загружает на Replicate (или ImgBB как fallback)
@@ -301,4 +319,34 @@ class ImageUploader:
                 
         except Exception as e:
             logger.error(f"❌ Ошибка при обработке фото: {e}")
-            return None
\ No newline at end of file
+            return None
+
+    async def process_telegram_photos(
+        self,
+        bot: Bot,
+        file_ids: List[str],
+        photo_names: Optional[List[str]] = None,
+        concurrency: int = ALBUM_UPLOAD_CONCURRENCY
+    ) -> List[Optional[str]]:
+        """
+        Скачивает и загружает несколько фото параллельно (например, альбом)
+        
+        Args:
+            bot: Aiogram Bot instance
+            file_ids: Telegram file_id фото
+            photo_names: Имена фото для ImgBB (по умолчанию photo_1, photo_2...)
+            concurrency: Максимум одновременных загрузок
+            
+        Returns:
+            URL каждого фото в порядке file_ids (None для фото, которые не загрузились)
+        """
+        names = photo_names or [f"photo_{i}" for i in range(1, len(file_ids) + 1)]
+        limit = asyncio.Semaphore(concurrency)
+        
+        async def process(file_id: str, name: str) -> Optional[str]:
+            async with limit:
+                return await self.process_telegram_photo(bot, file_id, photo_name=name)
+        
+        urls = await asyncio.gather(*(process(file_id, name) for file_id, name in zip(file_ids, names)))
+        logger.info(f"✅ Загружено фото: {sum(1 for url in urls if url)}/{len(file_ids)}")
+        return list(urls)
@@ -0,0 +1,169 @@
+"""
+Локальная интерполяция кадров между двумя фото (NumPy)
+
+    dissolve - векторизованный кросс-фейд: (1 - t) * A + t * B;
+    flow     - плотный оптический поток A -> B (пирамидальный Lucas-Kanade),
+               кадр t собирается из A, сдвинутого на t * поток, и B, сдвинутого
+               на (1 - t) * поток, смешанных с весами (1 - t) и t.
+Результат детерминирован и не требует запросов к модели. Функции работают
+с массивами float32 (H, W, 3) и вызываются из пула процессов через
+media_jobs.interpolate_frames.
+"""
+from typing import List
+
+# Сторона, на которой считается поток: для переходов между сценами хватает
+FLOW_MAX_SIDE = 384
+FLOW_LEVELS = 3
+FLOW_ITERATIONS = 3
+FLOW_WINDOW = 7
+
+
+def cross_dissolve(start, end, t: float):
+    """Кросс-фейд двух кадров одинакового размера"""
+    return start * (1.0 - t) + end * t
+
+
+def _box_filter(array, size: int):
+    """Сумма по окну size x size (интегральное изображение, края - повтором)"""
+    import numpy as np
+
+    radius = size // 2
+    padded = np.pad(array, radius, mode="edge")
+    integral = np.pad(padded.cumsum(axis=0).cumsum(axis=1), ((1, 0), (1, 0)))
+    return (
+        integral[size:, size:] - integral[:-size, size:]
+        - integral[size:, :-size] + integral[:-size, :-size]
+    )
+
+
+def _sample(image, map_x, map_y):
+    """Билинейная выборка image (H, W[, C]) в точках (map_x, map_y)"""
+    import numpy as np
+
+    height, width = image.shape[:2]
+    x = np.clip(map_x, 0, width - 1.001)
+    y = np.clip(map_y, 0, height - 1.001)
+    x0 = x.astype(np.int32)
+    y0 = y.astype(np.int32)
+    fx = (x - x0).astype(np.float32)[..., None]
+    fy = (y - y0).astype(np.float32)[..., None]
+    # Выборка по плоскому индексу заметно быстрее двумерной
+    flat = image.reshape(height * width, -1)
+    index = y0 * width + x0
+
+    def take(offset):
+        return np.take(flat, index + offset, axis=0)
+
+    top = take(0) * (1 - fx) + take(1) * fx
+    bottom = take(width) * (1 - fx) + take(width + 1) * fx
+    result = top * (1 - fy) + bottom * fy
+    return result if image.ndim == 3 else result[..., 0]
+
+
+def _downsample(gray):
+    """Уменьшение в 2 раза усреднением блоков 2x2"""
+    height, width = gray.shape[0] // 2 * 2, gray.shape[1] // 2 * 2
+    gray = gray[:height, :width]
+    return (gray[0::2, 0::2] + gray[1::2, 0::2] + gray[0::2, 1::2] + gray[1::2, 1::2]) / 4
+
+
+def _upsample_flow(flow, shape):
+    """Увеличение поля потока до shape с умножением векторов"""
+    import numpy as np
+
+    height, width = shape
+    ys = np.minimum((np.arange(height) * flow.shape[0] / height).astype(np.int32), flow.shape[0] - 1)
+    xs = np.minimum((np.arange(width) * flow.shape[1] / width).astype(np.int32), flow.shape[1] - 1)
+    scale = np.array([width / flow.shape[1], height / flow.shape[0]], dtype=np.float32)
+    return flow[ys][:, xs] * scale
+
+
+def dense_flow(start_gray, end_gray, levels: int = FLOW_LEVELS, iterations: int = FLOW_ITERATIONS,
+               window: int = FLOW_WINDOW):
+    """
+    Плотный оптический поток start -> end (пирамидальный Lucas-Kanade)
+
+    Returns:
+        Массив (H, W, 2): смещение (dx, dy) каждого пикселя start
+    """
+    import numpy as np
+
+    pyramid = [(start_gray, end_gray)]
+    for _ in range(levels - 1):
+        a, b = pyramid[-1]
+        if min(a.shape) < 2 * window:
+            break
+        pyramid.append((_downsample(a), _downsample(b)))
+
+    flow = np.zeros(pyramid[-1][0].shape + (2,), dtype=np.float32)
+    for a, b in reversed(pyramid):
+        if flow.shape[:2] != a.shape:
+            flow = _upsample_flow(flow, a.shape)
+        gy, gx = np.gradient(a)
+        sxx = _box_filter(gx * gx, window)
+        syy = _box_filter(gy * gy, window)
+        sxy = _box_filter(gx * gy, window)
+        determinant = sxx * syy - sxy * sxy
+        # Однотонные области (без текстуры) не двигаем
+        valid = determinant > 1e-2
+        determinant = np.where(valid, determinant, 1.0)
+        grid_y, grid_x = np.mgrid[0:a.shape[0], 0:a.shape[1]].astype(np.float32)
+
+        for _ in range(iterations):
+            warped = _sample(b, grid_x + flow[..., 0], grid_y + flow[..., 1])
+            diff = warped - a
+            sxt = _box_filter(gx * diff, window)
+            syt = _box_filter(gy * diff, window)
+            du = (-syy * sxt + sxy * syt) / determinant
+            dv = (sxy * sxt - sxx * syt) / determinant
+            flow[..., 0] += np.where(valid, du, 0.0)
+            flow[..., 1] += np.where(valid, dv, 0.0)
+    return flow
+
+
+def _gray(image):
+    import numpy as np
+    return image @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+
+def flow_frames(start, end, times: List[float]):
+    """Промежуточные кадры с компенсацией движения по оптическому потоку"""
+    import numpy as np
+    from PIL import Image
+
+    height, width = start.shape[:2]
+    scale = min(1.0, FLOW_MAX_SIDE / max(height, width))
+    small_size = (max(1, round(width * scale)), max(1, round(height * scale)))
+
+    def small_gray(image):
+        pil = Image.fromarray(np.clip(image, 0, 255).astype(np.uint8), "RGB").resize(small_size, Image.BILINEAR)
+        return _gray(np.asarray(pil, dtype=np.float32))
+
+    flow = dense_flow(small_gray(start), small_gray(end))
+    flow = _upsample_flow(flow, (height, width))
+    grid_y, grid_x = np.mgrid[0:height, 0:width].astype(np.float32)
+
+    frames = []
+    for t in times:
+        # Поток задан в координатах start: используем его как приближение для кадра t
+        from_start = _sample(start, grid_x - t * flow[..., 0], grid_y - t * flow[..., 1])
+        from_end = _sample(end, grid_x + (1 - t) * flow[..., 0], grid_y + (1 - t) * flow[..., 1])
+        frames.append(cross_dissolve(from_start, from_end, t))
+    return frames
+
+
+def interpolate(start, end, num_frames: int, method: str = "flow"):
+    """
+    Промежуточные кадры между start и end (без самих start и end)
+
+    Args:
+        start, end: float32 массивы (H, W, 3) одинакового размера
+        num_frames: Количество промежуточных кадров
+        method: flow или dissolve
+    """
+    times = [(i + 1) / (num_frames + 1) for i in range(num_frames)]
+    if method == "flow":
+        return flow_frames(start, end, times)
+    if method == "dissolve":
+        return [cross_dissolve(start, end, t) for t in times]
+    raise ValueError(f"Неизвестный способ интерполяции: {method}")
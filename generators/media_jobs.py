@@ -0,0 +1,344 @@
+"""
+Задачи для пула процессов медиа
+
+Все функции верхнего уровня (их можно передать в ProcessPoolExecutor) и
+импортируют тяжёлые библиотеки внутри себя, чтобы воркеры стартовали быстро.
+Логирование в воркерах не настроено, поэтому функции возвращают результат
+словарём, а логирует уже вызывающая сторона.
+"""
+import io
+import os
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+# Файл-маркер отмены или несколько: появление любого прерывает кодирование
+CancelMarker = Union[str, List[str]]
+
+
+class EncodeCancelled(Exception):
+    """Кодирование прервано: задача генерации отменена"""
+
+
+def analyze_image(image_bytes: bytes) -> Dict:
+    """Декодирует изображение и возвращает его размеры"""
+    from PIL import Image
+
+    image = Image.open(io.BytesIO(image_bytes))
+    width, height = image.size
+    # Полное декодирование ловит битые/обрезанные файлы ещё до загрузки в облако
+    image.load()
+    return {"width": width, "height": height, "mode": image.mode}
+
+
+def reframe_image(image_bytes: bytes, aspect_ratio: str, output_path: str,
+                  mode: str = "auto", min_keep: float = 0.6) -> Dict:
+    """
+    Меняет соотношение сторон фото локально (generators.reframe) и сохраняет JPEG
+
+    Returns:
+        {"output_path", "width", "height", "mode"}
+    """
+    from PIL import Image, ImageOps
+    from generators.reframe import reframe
+
+    # EXIF-поворот применяем до расчета окна, иначе формат перепутается
+    image = ImageOps.exif_transpose(Image.open(io.BytesIO(image_bytes)))
+    result, applied = reframe(image, aspect_ratio, mode=mode, min_keep=min_keep)
+    Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+    result.convert("RGB").save(output_path, "JPEG", quality=92)
+    width, height = result.size
+    return {"output_path": output_path, "width": width, "height": height, "mode": applied}
+
+
+def filter_image(image_bytes: bytes, function: str, output_path: str) -> Dict:
+    """
+    Применяет локальный фильтр (generators.image_filters.FILTERS) и сохраняет JPEG
+
+    Returns:
+        {"output_path", "width", "height"}
+    """
+    from PIL import Image, ImageOps
+    from generators.image_filters import FILTERS
+
+    image = ImageOps.exif_transpose(Image.open(io.BytesIO(image_bytes)))
+    result = FILTERS[function](image)
+    Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+    result.convert("RGB").save(output_path, "JPEG", quality=95)
+    width, height = result.size
+    return {"output_path": output_path, "width": width, "height": height}
+
+
+def interpolate_frames(start_bytes: bytes, end_bytes: bytes, num_frames: int, output_dir: str,
+                       method: str = "flow") -> Dict:
+    """
+    Строит промежуточные кадры между двумя фото (generators.interpolation)
+
+    Финальное фото приводится к размеру начального. В output_dir пишутся
+    frame_000.jpg (начало), промежуточные кадры и последний кадр (конец).
+
+    Returns:
+        {"frame_paths": [...], "width", "height", "method"}
+    """
+    import numpy as np
+    from PIL import Image, ImageOps
+    from generators.interpolation import interpolate
+
+    start = ImageOps.exif_transpose(Image.open(io.BytesIO(start_bytes))).convert("RGB")
+    end = ImageOps.exif_transpose(Image.open(io.BytesIO(end_bytes))).convert("RGB")
+    end = ImageOps.fit(end, start.size, Image.LANCZOS)
+
+    start_array = np.asarray(start, dtype=np.float32)
+    end_array = np.asarray(end, dtype=np.float32)
+    frames = [start_array] + interpolate(start_array, end_array, num_frames, method) + [end_array]
+
+    output = Path(output_dir)
+    output.mkdir(parents=True, exist_ok=True)
+    frame_paths = []
+    for index, frame in enumerate(frames):
+        path = output / f"frame_{index:03d}.jpg"
+        Image.fromarray(np.clip(frame, 0, 255).astype(np.uint8), "RGB").save(path, "JPEG", quality=92)
+        frame_paths.append(str(path))
+    return {"frame_paths": frame_paths, "width": start.size[0], "height": start.size[1], "method": method}
+
+
+def extract_frame(video_path: str, frame_time: float, frame_path: str) -> Dict:
+    """
+    Сохраняет кадр видео в файл
+
+    Args:
+        video_path: Путь к видео
+        frame_time: Время кадра в секундах (отрицательное - от конца видео)
+        frame_path: Куда сохранить кадр
+    """
+    from moviepy.editor import VideoFileClip
+    from PIL import Image
+
+    video = VideoFileClip(video_path)
+    try:
+        t = video.duration + frame_time if frame_time < 0 else frame_time
+        t = max(0.0, min(t, video.duration))
+        frame = video.get_frame(t)
+        # MoviePy уже возвращает uint8 RGB
+        Image.fromarray(frame.astype("uint8")).save(frame_path)
+    finally:
+        video.close()
+
+    return {"frame_path": frame_path}
+
+
+def _ffmpeg() -> str:
+    """Путь к ffmpeg из imageio-ffmpeg (его же использует MoviePy)"""
+    from imageio_ffmpeg import get_ffmpeg_exe
+    return get_ffmpeg_exe()
+
+
+def _run_ffmpeg(command: List[str], output_path: str, cancel_marker: Optional[CancelMarker] = None,
+                check_interval: float = 0.5):
+    """
+    Запускает ffmpeg с записью во временный файл и атомарной заменой output_path
+
+    Появление cancel_marker останавливает процесс (EncodeCancelled).
+    """
+    import subprocess
+
+    markers = [cancel_marker] if isinstance(cancel_marker, str) else list(cancel_marker or [])
+    cancelled = next((marker for marker in markers if os.path.exists(marker)), None)
+    if cancelled:
+        # Задача ждала в очереди пула, а ее уже отменили
+        raise EncodeCancelled(f"Кодирование отменено ({cancelled})")
+    temp_path = f"{output_path}.{os.getpid()}.part.mp4"
+    process = subprocess.Popen(
+        command + [temp_path], stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+    )
+    try:
+        while True:
+            try:
+                _, stderr = process.communicate(timeout=check_interval)
+                break
+            except subprocess.TimeoutExpired:
+                cancelled = next((marker for marker in markers if os.path.exists(marker)), None)
+                if cancelled:
+                    process.kill()
+                    process.wait()
+                    raise EncodeCancelled(f"Кодирование отменено ({cancelled})")
+        if process.returncode != 0:
+            message = stderr.decode("utf-8", "replace").strip().splitlines()
+            raise RuntimeError(f"ffmpeg: {message[-1] if message else process.returncode}")
+        os.replace(temp_path, output_path)
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        Path(temp_path).unlink(missing_ok=True)
+
+
+def probe_clip(path: str) -> Dict:
+    """
+    Длительность клипа и наличие звука (по заголовку, без декодирования)
+
+    Returns:
+        {"duration", "has_audio"}
+    """
+    import re
+    import subprocess
+
+    probe = subprocess.run([_ffmpeg(), "-hide_banner", "-i", path], capture_output=True, text=True)
+    match = re.search(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)", probe.stderr)
+    if not match or "Video:" not in probe.stderr:
+        raise ValueError(f"Не видео: {Path(path).name}")
+    hours, minutes, seconds = match.groups()
+    duration = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    return {"duration": duration, "has_audio": "Audio:" in probe.stderr}
+
+
+def _video_filter(params: Dict) -> str:
+    """Кадр вписывается в размер сегмента с черными полями, общие FPS и формат пикселей"""
+    width, height = params["width"], params["height"]
+    return (
+        f"scale={width}:{height}:force_original_aspect_ratio=decrease,"
+        f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2:color=black,setsar=1,"
+        f"fps={params['fps']},format=yuv420p"
+    )
+
+
+def _audio_filter(params: Dict) -> str:
+    return f"aformat=sample_fmts=fltp:sample_rates={params['audio_rate']}:channel_layouts=stereo,apad"
+
+
+def _silence(params: Dict) -> List[str]:
+    return ["-f", "lavfi", "-i", f"anullsrc=r={params['audio_rate']}:cl=stereo"]
+
+
+def _encode_options(params: Dict) -> List[str]:
+    """Кодеки сегмента: одинаковые у всех сегментов, иначе склейка копированием невозможна"""
+    options = ["-c:v", "libx264", "-preset", params["preset"], "-crf", str(params["crf"])]
+    if params.get("maxrate"):
+        maxrate = params["maxrate"]
+        options += ["-maxrate", maxrate, "-bufsize", f"{int(maxrate[:-1]) * 2}{maxrate[-1]}"]
+    return options + [
+        "-c:a", "aac", "-b:a", params["audio_bitrate"],
+        "-ar", str(params["audio_rate"]), "-ac", "2",
+        "-f", "mp4",
+    ]
+
+
+def normalize_segment(clip_path: str, segment_path: str, params: Dict, start: float = 0.0,
+                      duration: Optional[float] = None, has_audio: Optional[bool] = None,
+                      cancel_marker: Optional[CancelMarker] = None) -> Dict:
+    """
+    Кодирует отрезок клипа сцены в нормализованный сегмент (encoder_profiles.get_segment_params)
+
+    Args:
+        clip_path: Клип сцены
+        segment_path: Куда записать сегмент
+        params: Параметры сегмента
+        start, duration: Отрезок клипа (без duration - до конца)
+        has_audio: Есть ли в клипе звук (None - определить); клипы без звука
+            получают тишину, чтобы у всех сегментов был одинаковый набор потоков
+        cancel_marker: Файл (или файлы), появление которого прерывает кодирование (EncodeCancelled)
+
+    Returns:
+        {"segment_path", "has_audio"}
+    """
+    if has_audio is None or duration is None:
+        info = probe_clip(clip_path)
+        has_audio = info["has_audio"] if has_audio is None else has_audio
+        duration = info["duration"] - start if duration is None else duration
+
+    command = [_ffmpeg(), "-hide_banner", "-loglevel", "error", "-y"]
+    if start > 0:
+        command += ["-ss", f"{start:.3f}"]
+    command += ["-i", clip_path]
+    if has_audio:
+        audio = ["-map", "0:a:0", "-af", _audio_filter(params)]
+    else:
+        command += _silence(params)
+        audio = ["-map", "1:a:0"]
+    # Длительность задается на выходе: звук дополнен тишиной и обрезается вместе с видео
+    command += ["-map", "0:v:0", *audio, "-vf", _video_filter(params), "-t", f"{duration:.3f}"]
+    command += _encode_options(params)
+
+    _run_ffmpeg(command, segment_path, cancel_marker)
+    return {"segment_path": segment_path, "has_audio": has_audio}
+
+
+def transition_segment(clip_a: str, clip_b: str, segment_path: str, params: Dict,
+                       transition: str = "fade", a_start: float = 0.0, a_duration: float = 0.5,
+                       b_duration: float = 0.5, a_has_audio: bool = True, b_has_audio: bool = True,
+                       cancel_marker: Optional[CancelMarker] = None) -> Dict:
+    """
+    Сегмент перехода: хвост клипа A (a_duration секунд с a_start) и начало
+    клипа B (b_duration секунд); они смешиваются на последних min(a_duration,
+    b_duration) секундах хвоста (ffmpeg xfade, звук - acrossfade)
+
+    Args:
+        clip_a, clip_b: Соседние клипы
+        segment_path: Куда записать сегмент
+        params: Параметры сегмента
+        transition: Переход xfade (fade, dissolve, wipeleft, slideleft...)
+        a_start, a_duration: Хвост клипа A
+        b_duration: Начало клипа B
+        a_has_audio, b_has_audio: Есть ли звук в клипах
+
+    Returns:
+        {"segment_path", "duration"}
+    """
+    overlap = min(a_duration, b_duration)
+    duration = a_duration + b_duration - overlap
+    command = [
+        _ffmpeg(), "-hide_banner", "-loglevel", "error", "-y",
+        "-ss", f"{a_start:.3f}", "-t", f"{a_duration:.3f}", "-i", clip_a,
+        "-t", f"{b_duration:.3f}", "-i", clip_b,
+    ]
+    # Тишина для клипов без звука - дополнительными входами после клипов
+    audio_sources = []
+    next_input = 2
+    for index, has_audio in enumerate((a_has_audio, b_has_audio)):
+        if has_audio:
+            audio_sources.append(f"[{index}:a]")
+        else:
+            audio_sources.append(f"[{next_input}:a]")
+            command += _silence(params)
+            next_input += 1
+
+    video_filter = _video_filter(params)
+    graph = ";".join([
+        f"[0:v]{video_filter}[v0]",
+        f"[1:v]{video_filter}[v1]",
+        f"[v0][v1]xfade=transition={transition}:duration={overlap:.3f}"
+        f":offset={a_duration - overlap:.3f},format=yuv420p[v]",
+        f"{audio_sources[0]}{_audio_filter(params)},atrim=0:{a_duration:.3f}[a0]",
+        f"{audio_sources[1]}{_audio_filter(params)},atrim=0:{b_duration:.3f}[a1]",
+        f"[a0][a1]acrossfade=d={overlap:.3f}[a]",
+    ])
+    command += ["-filter_complex", graph, "-map", "[v]", "-map", "[a]", "-t", f"{duration:.3f}"]
+    command += _encode_options(params)
+
+    _run_ffmpeg(command, segment_path, cancel_marker)
+    return {"segment_path": segment_path, "duration": duration}
+
+
+def concat_segments(segment_paths: List[str], output_path: str,
+                    cancel_marker: Optional[CancelMarker] = None) -> Dict:
+    """
+    Склеивает нормализованные сегменты копированием потоков (без перекодирования)
+
+    Returns:
+        {"output_path", "segments"}
+    """
+    import tempfile
+
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False, encoding="utf-8") as listing:
+        for path in segment_paths:
+            escaped = str(Path(path).resolve()).replace("'", "'\\''")
+            listing.write(f"file '{escaped}'\n")
+    try:
+        command = [
+            _ffmpeg(), "-hide_banner", "-loglevel", "error", "-y",
+            "-f", "concat", "-safe", "0", "-i", listing.name,
+            "-c", "copy", "-movflags", "+faststart", "-f", "mp4",
+        ]
+        _run_ffmpeg(command, output_path, cancel_marker)
+    finally:
+        os.unlink(listing.name)
+    return {"output_path": output_path, "segments": len(segment_paths)}
@@ -0,0 +1,145 @@
+"""
+Пул процессов для CPU-тяжёлой обработки медиа
+
+MoviePy и Pillow выполняют покадровую работу в Python и держат GIL, поэтому
+в потоке они тормозят event loop бота для всех пользователей. Здесь такие
+задачи уходят в отдельные процессы, а очередь ограничена, чтобы пиковая
+нагрузка не копила бесконечный backlog.
+"""
+import asyncio
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.config import MEDIA_POOL_WORKERS, MEDIA_POOL_QUEUE_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+def _run_timed(func: Callable, submitted_at: float, args: tuple, kwargs: dict) -> Dict:
+    """Выполняет задачу в воркере и замеряет ожидание и CPU"""
+    started_at = time.time()
+    cpu_start = time.process_time()
+    children_start = os.times()
+    result = func(*args, **kwargs)
+    children_end = os.times()
+    cpu_time = time.process_time() - cpu_start
+    # CPU дочерних процессов (ffmpeg, запущенный MoviePy)
+    children_cpu = (
+        (children_end.children_user - children_start.children_user)
+        + (children_end.children_system - children_start.children_system)
+    )
+    return {
+        "result": result,
+        "queue_wait": max(0.0, started_at - submitted_at),
+        "cpu_time": cpu_time + children_cpu,
+        "run_time": time.time() - started_at,
+        "pid": os.getpid(),
+    }
+
+
+class MediaProcessPool:
+    """Ограниченный пул процессов для кодирования видео и обработки изображений"""
+
+    def __init__(self, max_workers: int = MEDIA_POOL_WORKERS, max_queue: int = MEDIA_POOL_QUEUE_SIZE):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor: Optional[ProcessPoolExecutor] = None
+        # Одновременно в пуле: выполняются + ждут в очереди
+        self._slots = asyncio.Semaphore(max_workers + max_queue)
+        self._in_flight = 0
+        self.stats: Dict[str, Dict[str, float]] = {}
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        """Создает пул при первом использовании"""
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            logger.info(f"⚙️ Пул медиа-процессов запущен: {self.max_workers} воркеров, очередь {self.max_queue}")
+        return self._executor
+
+    async def run(self, func: Callable, *args, task_name: str = "media", **kwargs) -> Any:
+        """
+        Выполняет функцию в пуле процессов
+
+        Args:
+            func: Функция верхнего уровня модуля (должна сериализоваться pickle)
+            task_name: Имя задачи для статистики
+            *args, **kwargs: Аргументы функции
+
+        Returns:
+            Результат функции (исключения пробрасываются вызывающему)
+        """
+        submitted_at = time.time()
+
+        async with self._slots:
+            self._in_flight += 1
+            try:
+                loop = asyncio.get_running_loop()
+                try:
+                    report = await loop.run_in_executor(
+                        self._get_executor(),
+                        _run_timed, func, submitted_at, args, kwargs
+                    )
+                except BrokenProcessPool:
+                    # Воркер упал (например, OOM) - пересоздаем пул для следующих задач
+                    logger.error(f"❌ Пул медиа-процессов сломан на задаче {task_name}, пересоздаю")
+                    self._reset_executor()
+                    raise
+            finally:
+                self._in_flight -= 1
+
+        self._record(task_name, report, time.time() - submitted_at)
+        return report["result"]
+
+    def _record(self, task_name: str, report: Dict, total_time: float):
+        """Сохраняет статистику по задаче"""
+        entry = self.stats.setdefault(task_name, {
+            "count": 0,
+            "cpu_time": 0.0,
+            "queue_wait": 0.0,
+            "max_queue_wait": 0.0,
+            "total_time": 0.0,
+        })
+        entry["count"] += 1
+        entry["cpu_time"] += report["cpu_time"]
+        entry["queue_wait"] += report["queue_wait"]
+        entry["max_queue_wait"] = max(entry["max_queue_wait"], report["queue_wait"])
+        entry["total_time"] += total_time
+
+        logger.info(
+            f"⚙️ {task_name}: CPU {report['cpu_time']:.2f}с, "
+            f"ожидание {report['queue_wait']:.2f}с, выполнение {report['run_time']:.2f}с (pid {report['pid']})"
+        )
+
+    def get_stats(self) -> Dict:
+        """Возвращает статистику пула"""
+        return {
+            "workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "in_flight": self._in_flight,
+            "tasks": {name: dict(entry) for name, entry in self.stats.items()},
+        }
+
+    def _reset_executor(self):
+        """Отбрасывает сломанный пул"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def shutdown(self):
+        """Останавливает пул (при завершении бота)"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+            logger.info("⚙️ Пул медиа-процессов остановлен")
+
+
+# Глобальный экземпляр
+media_pool = MediaProcessPool()
@@ -0,0 +1,424 @@
+"""
+Маршрутизация запросов к моделям генерации
+
+Бэкенд - пара (провайдер, модель). Для каждого запроса роутер выбирает
+бэкенд по живой статистике (медианная задержка и доля ошибок за последние
+ROUTER_STATS_WINDOW вызовов):
+- запрошенная модель всегда идет первой (провайдеры - по задержке), задержка
+  не переключает на другую модель;
+- эквивалентные модели из поля "failover" схемы (models/parameters) используются
+  только после ошибки или выключения запрошенной, если подогнанный запрос
+  сохраняет соотношение сторон и длительность (±ROUTER_FAILOVER_DURATION_TOLERANCE),
+  все запрошенные значения (звук, разрешение, seed...) и не дороже исходного
+  (дороже - только с ROUTER_FAILOVER_ALLOW_PRICIER);
+- бэкенд с долей ошибок выше ROUTER_BREAKER_ERROR_RATE выключается на
+  ROUTER_BREAKER_COOLDOWN секунд (идет последним);
+- при ошибке (E004, E6716, сеть) запрос уходит на следующий бэкенд;
+  ошибки содержимого (E005) и неверные параметры не переключаются;
+- для дешевых задач (оценка ≤ ROUTER_HEDGE_MAX_COST) через p95 задержки
+  (известный по ROUTER_HEDGE_MIN_SAMPLES успешным вызовам) в ту же модель у
+  другого провайдера отправляется параллельный запрос, побеждает первый ответ,
+  проигравший отменяется (в том числе предсказание на стороне Replicate).
+Одновременных вызовов провайдеров не больше ROUTER_MAX_CONCURRENCY на процесс:
+параллельные варианты и дубли встают в общую очередь, а не перегружают API.
+
+FakeProvider - локальный провайдер без сети (ROUTER_PROVIDERS=fake).
+"""
+import asyncio
+import logging
+import random
+import sys
+import time
+import uuid
+from collections import deque
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.config import (
+    ROUTER_STATS_WINDOW, ROUTER_BREAKER_ERROR_RATE, ROUTER_BREAKER_COOLDOWN,
+    ROUTER_FAILOVER_DURATION_TOLERANCE, ROUTER_FAILOVER_ALLOW_PRICIER, ROUTER_HEDGE_MAX_COST, ROUTER_HEDGE_MIN_DELAY,
+    ROUTER_HEDGE_MIN_SAMPLES,
+    ROUTER_MAX_CONCURRENCY, REPLICATE_POLL_INTERVAL
+)
+from models.registry import model_registry, ModelSpec, ModelValidationError
+from src.jobs import current_job, PREDICTIONS_CANCELLED
+from src.metrics import registry, replicate_error_code
+
+logger = logging.getLogger(__name__)
+
+# Ошибки, при которых другой бэкенд не поможет
+NON_FAILOVER_CODES = {"E005", "ModelValidationError"}
+
+# Оценка задержки бэкенда без статистики, секунды
+DEFAULT_LATENCY = {"video": 120.0, "image": 45.0}
+
+# Минимум вызовов для выключения бэкенда по доле ошибок
+BREAKER_MIN_CALLS = 5
+
+# Статусы завершенного предсказания Replicate
+FINAL_STATUSES = ("succeeded", "failed", "canceled")
+
+ROUTER_CALLS = registry.counter(
+    "router_backend_calls_total",
+    "Calls routed to each backend",
+    ("backend", "status")
+)
+ROUTER_FAILOVERS = registry.counter(
+    "router_failovers_total",
+    "Requests moved to another backend after an error",
+    ("from_backend", "to_backend")
+)
+ROUTER_HEDGES = registry.counter(
+    "router_hedges_total",
+    "Hedged requests and which attempt won",
+    ("backend", "winner")
+)
+
+
+class ReplicateProvider:
+    """
+    Replicate через API предсказаний
+
+    Предсказание создается и опрашивается асинхронно, его ID известен задаче
+    генерации (src.jobs): при отмене задачи или проигрыше hedge-запроса
+    предсказание отменяется на стороне Replicate.
+    """
+
+    name = "replicate"
+
+    def __init__(self, client, poll_interval: float = REPLICATE_POLL_INTERVAL):
+        self.client = client
+        self.poll_interval = poll_interval
+
+    async def _create(self, model_id: str, payload: Dict[str, Any]):
+        if ":" in model_id:
+            # owner/name:version - конкретная версия модели
+            return await self.client.predictions.async_create(version=model_id.split(":", 1)[1], input=payload)
+        return await self.client.predictions.async_create(model=model_id, input=payload)
+
+    async def run(self, model_id: str, payload: Dict[str, Any]) -> Any:
+        prediction = await self._create(model_id, payload)
+        cancelled = False
+
+        async def cancel():
+            nonlocal cancelled
+            if cancelled or prediction.status in FINAL_STATUSES:
+                return
+            cancelled = True
+            try:
+                await prediction.async_cancel()
+                PREDICTIONS_CANCELLED.inc()
+                logger.info(f"⏹ Предсказание {prediction.id} ({model_id}) отменено")
+            except Exception as e:
+                logger.warning(f"⚠️ Не удалось отменить предсказание {prediction.id}: {e}")
+
+        job = current_job()
+        if job is not None:
+            job.add_prediction(prediction.id, cancel)
+        try:
+            while prediction.status not in FINAL_STATUSES:
+                await asyncio.sleep(self.poll_interval)
+                await prediction.async_reload()
+        except asyncio.CancelledError:
+            # Отмена не должна прерваться повторной отменой задачи
+            await asyncio.shield(cancel())
+            raise
+        finally:
+            if job is not None:
+                job.remove_prediction(prediction.id)
+
+        if prediction.status == "failed":
+            raise RuntimeError(f"Prediction {prediction.id} failed: {prediction.error}")
+        if prediction.status == "canceled":
+            raise asyncio.CancelledError(f"Prediction {prediction.id} canceled")
+        return prediction.output
+
+
+class FakeProvider:
+    """Локальный провайдер для тестов: задержка и ошибки по заданной вероятности"""
+
+    name = "fake"
+
+    def __init__(self, latency: float = 0.5, error_rate: float = 0.0, error_code: str = "E004"):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_code = error_code
+        self.calls: List[Tuple[str, Dict]] = []
+
+    async def run(self, model_id: str, payload: Dict[str, Any]) -> Any:
+        self.calls.append((model_id, payload))
+        await asyncio.sleep(self.latency * random.uniform(0.5, 1.5))
+        if random.random() < self.error_rate:
+            raise RuntimeError(f"Prediction failed ({self.error_code}): fake provider")
+        extension = "mp4" if "duration" in payload else "jpg"
+        return f"https://fake.local/{model_id}/{uuid.uuid4().hex[:8]}.{extension}"
+
+
+class BackendStats:
+    """Скользящее окно результатов вызовов бэкенда"""
+
+    def __init__(self, window: int = ROUTER_STATS_WINDOW):
+        self.samples: deque = deque(maxlen=window)  # (ok, latency)
+        self.open_until = 0.0
+
+    def record(self, ok: bool, latency: float):
+        self.samples.append((ok, latency))
+        if len(self.samples) >= BREAKER_MIN_CALLS and self.error_rate() > ROUTER_BREAKER_ERROR_RATE:
+            if not self.is_open():
+                logger.warning(f"🔌 Бэкенд выключен на {ROUTER_BREAKER_COOLDOWN:.0f}с: доля ошибок {self.error_rate():.0%}")
+            self.open_until = time.monotonic() + ROUTER_BREAKER_COOLDOWN
+            # После паузы бэкенд снова получает шанс с чистой статистикой
+            self.samples.clear()
+
+    def is_open(self) -> bool:
+        return time.monotonic() < self.open_until
+
+    def error_rate(self) -> float:
+        if not self.samples:
+            return 0.0
+        return sum(1 for ok, _ in self.samples if not ok) / len(self.samples)
+
+    def latency(self, quantile: float, min_samples: int = 1) -> Optional[float]:
+        """Квантиль задержки успешных вызовов (None - их меньше min_samples)"""
+        latencies = sorted(latency for ok, latency in self.samples if ok)
+        if len(latencies) < max(1, min_samples):
+            return None
+        return latencies[min(len(latencies) - 1, int(quantile * len(latencies)))]
+
+
+class RouteResult:
+    """Результат маршрутизированного вызова"""
+
+    def __init__(self, output: Any, spec: ModelSpec, provider: str, payload: Dict, attempts: int):
+        self.output = output
+        self.spec = spec
+        self.provider = provider
+        self.payload = payload
+        self.attempts = attempts
+
+
+class ModelRouter:
+    """Выбор бэкенда, переключение при ошибках и hedging"""
+
+    def __init__(self, providers: List, max_concurrency: int = ROUTER_MAX_CONCURRENCY):
+        if not providers:
+            raise ValueError("Нужен хотя бы один провайдер")
+        self.providers = providers
+        self.stats: Dict[str, BackendStats] = {}
+        self._slots = asyncio.Semaphore(max_concurrency)
+
+    @staticmethod
+    def _backend_name(provider, spec: ModelSpec) -> str:
+        return f"{provider.name}:{spec.key}"
+
+    def _stats(self, backend: str) -> BackendStats:
+        if backend not in self.stats:
+            self.stats[backend] = BackendStats()
+        return self.stats[backend]
+
+    @staticmethod
+    def _adapt(spec: ModelSpec, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Подгоняет параметры под эквивалентную модель (ближайшее значение из enum)"""
+        adapted = dict(params)
+        for name, value in params.items():
+            enum = spec.fields.get(spec.roles.get(name, name), {}).get("enum")
+            if value is None or not enum or value in enum:
+                continue
+            if isinstance(value, (int, float)) and all(isinstance(v, (int, float)) for v in enum):
+                adapted[name] = min(enum, key=lambda v: (abs(v - value), -v))
+            else:
+                adapted[name] = spec.default(name)
+        return adapted
+
+    @staticmethod
+    def _lost_feature(requested: ModelSpec, params: Dict[str, Any], spec: ModelSpec, adapted: Dict[str, Any]) -> Optional[str]:
+        """Запрошенное значение, которое другая модель не выполнит (None - все сохраняется)"""
+        for name, value in params.items():
+            # False - отказ от функции (generate_audio=False), его сохраняет и модель без поля
+            if value is None or value is False or not requested.supports(name):
+                continue
+            if not spec.supports(name):
+                return f"{name}={value} не поддерживается"
+            # Длительность сравнивается с допуском в _equivalent
+            if name != "duration" and adapted.get(name) != value:
+                return f"{name} {value} -> {adapted.get(name)}"
+        return None
+
+    @staticmethod
+    def _equivalent(requested: ModelSpec, original: Dict[str, Any], spec: ModelSpec, payload: Dict[str, Any]) -> Optional[str]:
+        """Почему запрос к другой модели не равноценен исходному (None - равноценен)"""
+        for name in ("aspect_ratio", "duration"):
+            before = original.get(requested.roles.get(name, name))
+            after = payload.get(spec.roles.get(name, name))
+            if before is None:
+                continue
+            if name == "duration" and after is not None:
+                if abs(float(after) - float(before)) <= ROUTER_FAILOVER_DURATION_TOLERANCE:
+                    continue
+            elif after == before:
+                continue
+            return f"{name} {before} -> {after}"
+        if not ROUTER_FAILOVER_ALLOW_PRICIER and spec.cost(payload) > requested.cost(original):
+            return f"дороже (${spec.cost(payload):.2f} вместо ${requested.cost(original):.2f})"
+        return None
+
+    def _candidates(self, requested: ModelSpec, params: Dict[str, Any]) -> List[Tuple[Any, ModelSpec, Dict]]:
+        """
+        Бэкенды для запроса в порядке предпочтения: запрошенная модель,
+        затем равноценные эквивалентные модели; выключенные бэкенды - последними
+        """
+        original = requested.build(params)
+        options = [(requested, original, 0)]
+        for key in requested.failover:
+            spec = model_registry.get(key)
+            if spec is None:
+                continue
+            adapted = self._adapt(spec, params)
+            try:
+                payload = spec.build(adapted)
+            except ModelValidationError as e:
+                logger.debug("Модель %s не подходит для переключения: %s", key, e)
+                continue
+            reason = (
+                self._lost_feature(requested, params, spec, adapted)
+                or self._equivalent(requested, original, spec, payload)
+            )
+            if reason:
+                logger.debug("Модель %s не подходит для переключения: %s", key, reason)
+                continue
+            options.append((spec, payload, len(options)))
+
+        ranked = []
+        for spec, payload, order in options:
+            for provider in self.providers:
+                stats = self._stats(self._backend_name(provider, spec))
+                latency = stats.latency(0.5) or DEFAULT_LATENCY.get(spec.category, 60.0)
+                # Модель выбирается по порядку, задержка упорядочивает только провайдеров
+                score = latency * (1 + 4 * stats.error_rate())
+                ranked.append((stats.is_open(), order, score, provider, spec, payload))
+        ranked.sort(key=lambda item: item[:3])
+        return [(provider, spec, payload) for _, _, _, provider, spec, payload in ranked]
+
+    def _hedge_delay(self, backend: str) -> Optional[float]:
+        """Через сколько отправлять дубль (None - статистики мало, p95 неизвестен)"""
+        p95 = self._stats(backend).latency(0.95, min_samples=ROUTER_HEDGE_MIN_SAMPLES)
+        if p95 is None:
+            return None
+        return max(ROUTER_HEDGE_MIN_DELAY, p95)
+
+    def _is_small(self, spec: ModelSpec, payload: Dict[str, Any]) -> bool:
+        """Дешевая задача, для которой дубль запроса оправдан"""
+        return 0 < spec.cost(payload) <= ROUTER_HEDGE_MAX_COST
+
+    async def _call(self, provider, spec: ModelSpec, payload: Dict) -> Any:
+        """Один вызов бэкенда с учетом статистики"""
+        backend = self._backend_name(provider, spec)
+        async with self._slots:
+            started = time.perf_counter()
+            try:
+                output = await provider.run(spec.model_id, payload)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self._stats(backend).record(False, time.perf_counter() - started)
+                ROUTER_CALLS.inc(backend=backend, status="error")
+                raise
+        self._stats(backend).record(True, time.perf_counter() - started)
+        ROUTER_CALLS.inc(backend=backend, status="ok")
+        return output
+
+    async def _call_hedged(self, primary: Tuple, secondary: Tuple, delay: float) -> Tuple[Any, Tuple]:
+        """Основной вызов и дубль через delay секунд; побеждает первый успешный"""
+        provider, spec, payload = primary
+        backend = self._backend_name(provider, spec)
+        first = asyncio.create_task(self._call(*primary))
+        tasks = {first: primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                logger.info(f"⏱️ {backend}: нет ответа за p95, отправляю дубль в {self._backend_name(*secondary[:2])}")
+                tasks[asyncio.create_task(self._call(*secondary))] = secondary
+
+            last_error: Optional[BaseException] = None
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if len(tasks) > 1:
+                            ROUTER_HEDGES.inc(backend=backend, winner="primary" if task is first else "hedge")
+                        return task.result(), tasks[task]
+                    last_error = task.exception()
+            raise last_error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def run(self, model_key: str, params: Dict[str, Any], hedge: Optional[bool] = None) -> RouteResult:
+        """
+        Выполняет запрос генерации
+
+        Args:
+            model_key: Короткое имя или идентификатор модели
+            params: Общие параметры запроса (см. ModelSpec.build)
+            hedge: Дублировать запрос; по умолчанию - только для дешевых задач
+
+        Returns:
+            RouteResult с ответом и фактически использованной моделью
+
+        Raises:
+            ModelValidationError: Параметры не подходят запрошенной модели
+            Exception: Ошибка последнего бэкенда (с кодом Replicate в тексте)
+        """
+        requested = model_registry.get(model_key)
+        if requested is None:
+            raise ModelValidationError(f"{model_key}: модель не найдена в models/parameters")
+
+        candidates = self._candidates(requested, params)
+        if hedge is None:
+            hedge = self._is_small(*candidates[0][1:])
+
+        last_error: Optional[Exception] = None
+        for index, candidate in enumerate(candidates):
+            provider, spec, payload = candidate
+            if last_error is not None:
+                ROUTER_FAILOVERS.inc(
+                    from_backend=self._backend_name(*candidates[index - 1][:2]),
+                    to_backend=self._backend_name(provider, spec)
+                )
+                logger.warning(f"🔀 Переключаюсь на {self._backend_name(provider, spec)}")
+            # Дубль уходит только в ту же модель у другого провайдера и только при известном p95
+            secondary = next(
+                (other for other in candidates[index + 1:] if other[1] is spec and other[0] is not provider),
+                None
+            ) if hedge else None
+            delay = self._hedge_delay(self._backend_name(provider, spec)) if secondary else None
+            try:
+                if delay is not None:
+                    output, used = await self._call_hedged(candidate, secondary, delay)
+                    provider, spec, payload = used
+                else:
+                    output = await self._call(provider, spec, payload)
+                return RouteResult(output, spec, provider.name, payload, attempts=index + 1)
+            except Exception as e:
+                last_error = e
+                code = replicate_error_code(e)
+                logger.warning(f"⚠️ {self._backend_name(provider, spec)}: ошибка {code}")
+                if code in NON_FAILOVER_CODES:
+                    raise
+        raise last_error
+
+    def get_stats(self) -> Dict[str, Dict]:
+        """Статистика бэкендов для отладки"""
+        return {
+            backend: {
+                "calls": len(stats.samples),
+                "error_rate": round(stats.error_rate(), 3),
+                "p50": stats.latency(0.5),
+                "p95": stats.latency(0.95),
+                "open": stats.is_open(),
+            }
+            for backend, stats in self.stats.items()
+        }
@@ -4,16 +4,24 @@ import json
 import logging
 import io
 import base64
-import os
 import sys
+import uuid
 from pathlib import Path
 from typing import Dict, Optional, List
 
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 import aiohttp
-import replicate
-from src.config import REPLICATE_API_TOKEN
+from src.config import REPLICATE_API_TOKEN, INTERPOLATION_METHOD, PHOTO_VARIANTS
+from generators.http_utils import http_session
+from generators import media_jobs
+from generators.media_pool import media_pool
+from src.jobs import current_job
+from src.ledger import ledger
+from src.result_cache import result_cache
+from models.registry import model_registry, ModelValidationError
+from src.metrics import instrument_stage, record_replicate_error, record_transfer
+from src.retry_policy import REPLICATE_PHOTO
 
 logger = logging.getLogger(__name__)
 
@@ -21,18 +29,33 @@ logger = logging.getLogger(__name__)
 class PhotoGenerator:
     """Генератор фото по сценам с использованием google/nano-banana"""
     
-    def __init__(self):
-        """Инициализация генератора фото"""
+    def __init__(self, replicate_client=None, http_session: Optional[aiohttp.ClientSession] = None, router=None):
+        """
+        Инициализация генератора фото
+        
+        Args:
+            replicate_client: Общий клиент Replicate (см. src.clients)
+            http_session: Общая HTTP сессия для скачивания результатов
+            router: Роутер моделей (по умолчанию - только Replicate)
+        """
         if not REPLICATE_API_TOKEN:
             raise ValueError("❌ REPLICATE_API_TOKEN не установлен! Добавь в .env")
         
         self.api_token = REPLICATE_API_TOKEN
-        self.model = "google/nano-banana"  # Модель для генерации фото
+        self.spec = model_registry.get("nano_banana")  # Схема google/nano-banana из models/parameters
+        self.model = self.spec.model_id
         self.temp_images_dir = Path("temp_images")
         self.temp_images_dir.mkdir(exist_ok=True)
         
-        # ✅ Устанавливаю токен для replicate
-        os.environ["REPLICATE_API_TOKEN"] = REPLICATE_API_TOKEN
+        if replicate_client is None:
+            from replicate import Client
+            replicate_client = Client(api_token=REPLICATE_API_TOKEN)
+        self.replicate_client = replicate_client
+        self.http_session = http_session
+        if router is None:
+            from generators.model_router import ModelRouter, ReplicateProvider
+            router = ModelRouter([ReplicateProvider(replicate_client)])
+        self.router = router
         logger.info(f"✅ PhotoGenerator инициализирован с моделью: {self.model}")
         
     async def generate_photos_for_scenes(
@@ -117,23 +140,28 @@ class PhotoGenerator:
                 "error": str(e)
             }
     
+    # Повторы входят в длительность этапа и учитываются в pipeline_retries_total
+    @instrument_stage("generate_photo", model=lambda a: a["self"].model)
     async def _generate_single_photo(
         self,
         prompt: str,
         aspect_ratio: str = "16:9",
         reference_image_url: str = None,
         scene_index: int = 0,
-        retry_count: int = 0
+        variant: int = 0
     ) -> dict:
         """
         Генерирует одно фото через replicate API
         
+        Повторы и упрощение запроса (без референса, упрощенный или очищенный
+        промт) задает политика REPLICATE_PHOTO из src.retry_policy.
+        
         Args:
             prompt: Промт для генерации
             aspect_ratio: Соотношение сторон (16:9, 9:16, 1:1)
             reference_image_url: URL референса (опционально)
             scene_index: Индекс сцены
-            retry_count: Количество попыток (для автоматического retry)
+            variant: Номер варианта (для параллельных вариантов одной сцены)
             
         Returns:
             {"status": "success", "photo_url": "..."} или {"status": "error", "error": "..."}
@@ -143,40 +171,34 @@ class PhotoGenerator:
             # ✅ ВСЕГДА используем выбранный aspect_ratio (не match_input_image)
             # Это гарантирует, что фото генерируется в выбранном формате (16:9, 9:16, 1:1)
             # независимо от размера загруженного референса
-            determined_aspect_ratio = aspect_ratio
-            
-            input_params = {
+            # Payload проверяется по схеме models/parameters/nano_banana.json до запроса
+            params = {
                 "prompt": prompt,
-                "aspect_ratio": determined_aspect_ratio,  # ✅ Правильно для Nano-Banana
-                "output_format": "jpg"
+                "aspect_ratio": aspect_ratio,
+                "output_format": "jpg",
+                "reference_images": [reference_image_url] if reference_image_url else None
             }
+            input_params = self.spec.build(params)
             
-            # Если есть референс - добавляю его (для google/nano-banana используется параметр "image_input")
-            logger.info(f"🔍 DEBUG: reference_image_url = {reference_image_url}")
-            if reference_image_url:
-                input_params["image_input"] = [reference_image_url]  # ✅ Правильный параметр для nano-banana! (должен быть массив)
-                logger.info(f"   📸 Референс добавлен: {reference_image_url[:80]}...")
-                logger.info(f"   📐 Режим генерации: на основе референса")
-            else:
-                logger.warning(f"   ⚠️ reference_image_url пуст или None!")
-            
-            logger.info(f"🎬 Вызываю replicate для генерации фото (сцена {scene_index + 1})...")
-            logger.info(f"   📝 ПОЛНЫЙ ПРОМТ:\n{prompt}")
-            logger.info(f"   📐 Соотношение: {aspect_ratio}")
-            logger.info(f"📋 ФИНАЛЬНЫЕ ПАРАМЕТРЫ: {input_params}")
-            
-            # Вызываю replicate асинхронно (БЕЗ api_token параметра!)
-            output = await asyncio.to_thread(
-                replicate.run,
-                self.model,
-                input=input_params
+            log_extra = {"scene": scene_index + 1, "model": self.model}
+            logger.info(
+                "🎬 Генерация фото сцены %s (%s, %s)",
+                scene_index + 1, aspect_ratio, "с референсом" if reference_image_url else "без референса",
+                extra=log_extra
             )
+            logger.debug("📋 Payload: %s", input_params, extra={**log_extra, "event": "replicate.payload"})
+            
+            # Шаги упрощения запроса для повторов
+            degraders = {
+                "drop_reference": lambda p: {**p, "reference_images": None},
+                "simplify_prompt": lambda p: {**p, "prompt": self._simplify_prompt_for_api(p["prompt"])},
+                "sanitize": lambda p: {**p, "prompt": self._sanitize_prompt_for_safety(p["prompt"])},
+            }
+            output = await REPLICATE_PHOTO.run(self._request_photo, params, degraders)
             
             # Обработка результата
             photo_url = None
             
-            logger.info(f"📊 Тип результата от Replicate: {type(output)}")
-            
             # Результат может быть File объектом, список, или строка
             if hasattr(output, 'url'):
                 # ✅ File объект от Replicate
@@ -186,7 +208,6 @@ class PhotoGenerator:
                     photo_url = url_attr()
                 else:
                     photo_url = str(url_attr)
-                logger.info(f"✅ Получен File объект: {photo_url[:100]}...")
             elif isinstance(output, list) and len(output) > 0:
                 # ✅ Список File объектов или URLs
                 if hasattr(output[0], 'url'):
@@ -195,14 +216,11 @@ class PhotoGenerator:
                         photo_url = url_attr()
                     else:
                         photo_url = str(url_attr)
-                    logger.info(f"✅ Получен список File объектов: {photo_url[:100]}...")
                 else:
                     photo_url = str(output[0])
-                    logger.info(f"✅ Получен список URLs: {photo_url[:100]}...")
             elif isinstance(output, str):
                 # ✅ Строка с URL
                 photo_url = output
-                logger.info(f"✅ Получена строка URL: {photo_url[:100]}...")
             else:
                 logger.error(f"❌ Неожиданный формат: {type(output)}")
                 logger.error(f"   Содержимое: {str(output)[:200]}")
@@ -218,9 +236,10 @@ class PhotoGenerator:
                 }
             
             # Скачиваю фото локально
-            photo_path = await self._download_photo(photo_url, scene_index)
+            photo_path = await self._download_photo(photo_url, scene_index, variant)
             
-            logger.info(f"✅ Фото сгенерировано: {photo_url}")
+            logger.info("✅ Фото сцены %s сгенерировано", scene_index + 1, extra=log_extra)
+            logger.debug("   URL: %s", photo_url, extra={**log_extra, "event": "replicate.output"})
             
             return {
                 "status": "success",
@@ -228,129 +247,105 @@ class PhotoGenerator:
                 "photo_path": photo_path
             }
             
-        except Exception as e:
-            error_msg = str(e)
-            logger.error(f"❌ Ошибка генерации фото сцены {scene_index + 1}: {error_msg}")
-            
-            # ✅ Обработка различных ошибок API
-            if "E004" in error_msg and retry_count < 3:
-                # E004 - Service is temporarily unavailable
-                logger.warning(f"⚠️ Сервис недоступен (E004, попытка {retry_count + 1}/3) - пытаюсь еще раз...")
-                
-                # Постепенное увеличение времени ожидания
-                wait_time = 5 + (retry_count * 3)
-                logger.info(f"⏳ Жду {wait_time} сек перед повторной попыткой...")
-                await asyncio.sleep(wait_time)
-                
-                # На каждой попытке - пробуем упростить параметры
-                if retry_count < 1:
-                    # Попытка 1: как есть, но ждем
-                    return await self._generate_single_photo(
-                        prompt=prompt,
-                        aspect_ratio=aspect_ratio,
-                        reference_image_url=reference_image_url,
-                        scene_index=scene_index,
-                        retry_count=retry_count + 1
-                    )
-                elif retry_count < 2:
-                    # Попытка 2: без reference
-                    logger.info(f"🔄 Попытка 2: генерируем БЕЗ reference")
-                    return await self._generate_single_photo(
-                        prompt=prompt,
-                        aspect_ratio=aspect_ratio,
-                        reference_image_url=None,
-                        scene_index=scene_index,
-                        retry_count=retry_count + 1
-                    )
-                else:
-                    # Попытка 3: упрощаем промт
-                    logger.info(f"🔄 Попытка 3: упрощаю промт")
-                    simplified_prompt = self._simplify_prompt_for_api(prompt)
-                    return await self._generate_single_photo(
-                        prompt=simplified_prompt,
-                        aspect_ratio=aspect_ratio,
-                        reference_image_url=None,
-                        scene_index=scene_index,
-                        retry_count=retry_count + 1
-                    )
-            
-            elif "E005" in error_msg and retry_count < 2:
-                # E005 - Фильтр безопасности (sensitive content)
-                logger.warning(f"⚠️ Фильтр безопасности (E005) - пытаюсь с улучшенным промтом...")
-                
-                # Очищаю промт от "опасных" слов
-                sanitized_prompt = self._sanitize_prompt_for_safety(prompt)
-                logger.info(f"🔄 Переделаю с очищенным промтом: {sanitized_prompt[:80]}...")
-                
-                # Retry с очищенным промтом
-                return await self._generate_single_photo(
-                    prompt=sanitized_prompt,
-                    aspect_ratio=aspect_ratio,
-                    reference_image_url=reference_image_url,
-                    scene_index=scene_index,
-                    retry_count=retry_count + 1
-                )
-            
-            elif "E6716" in error_msg and retry_count < 3:
-                # E6716 - Unexpected error handling prediction (от Replicate API)
-                logger.warning(f"⚠️ Ошибка API (E6716, попытка {retry_count + 1}/3) - пытаюсь еще раз...")
-                
-                # На первой попытке retry - просто ждем и повторяем
-                if retry_count == 0:
-                    await asyncio.sleep(3)
-                    logger.info(f"🔄 Повторная попытка 1: без изменений")
-                    return await self._generate_single_photo(
-                        prompt=prompt,
-                        aspect_ratio=aspect_ratio,
-                        reference_image_url=reference_image_url,
-                        scene_index=scene_index,
-                        retry_count=retry_count + 1
-                    )
-                
-                # На второй попытке - пробуем без reference для упрощения
-                elif retry_count == 1:
-                    await asyncio.sleep(3)
-                    logger.info(f"🔄 Повторная попытка 2: генерируем БЕЗ reference для упрощения")
-                    # Повторяем без reference_image_url
-                    return await self._generate_single_photo(
-                        prompt=prompt,
-                        aspect_ratio="16:9",  # Упрощаем aspect_ratio тоже
-                        reference_image_url=None,  # Убираем reference
-                        scene_index=scene_index,
-                        retry_count=retry_count + 1
-                    )
-                
-                # На третьей попытке - упрощаем сам промт (убираем детали)
-                elif retry_count == 2:
-                    await asyncio.sleep(3)
-                    logger.info(f"🔄 Повторная попытка 3: упрощаю промт")
-                    simplified_prompt = self._simplify_prompt_for_api(prompt)
-                    logger.info(f"   Упрощенный промт: {simplified_prompt[:100]}...")
-                    return await self._generate_single_photo(
-                        prompt=simplified_prompt,
-                        aspect_ratio="16:9",
-                        reference_image_url=None,
-                        scene_index=scene_index,
-                        retry_count=retry_count + 1
-                    )
+        except ModelValidationError as e:
+            # Запрос отклонен локально - повторять с теми же параметрами бессмысленно
+            logger.error(f"❌ Неверные параметры фото сцены {scene_index + 1}: {e}")
+            return {
+                "status": "error",
+                "error": str(e),
+                "code": "INVALID_PARAMS"
+            }
             
+        except Exception as e:
+            logger.error(f"❌ Ошибка генерации фото сцены {scene_index + 1}: {e}")
             return {
                 "status": "error",
-                "error": error_msg
+                "error": str(e)
             }
     
-    async def _download_photo(self, photo_url: str, scene_index: int) -> str:
+    async def generate_photo_variants(
+        self,
+        prompt: str,
+        aspect_ratio: str = "16:9",
+        reference_image_url: str = None,
+        scene_index: int = 0,
+        count: int = PHOTO_VARIANTS,
+        scope: Optional[int] = None
+    ) -> dict:
+        """
+        Генерирует несколько вариантов фото сцены параллельно
+        
+        Сначала берутся невыбранные варианты того же запроса из src.result_cache,
+        недостающие генерируются одновременно (общий лимит - в роутере моделей).
+        
+        Args:
+            prompt: Промт для генерации
+            aspect_ratio: Соотношение сторон
+            reference_image_url: URL референса (опционально)
+            scene_index: Индекс сцены
+            count: Количество вариантов
+            scope: Чат пользователя - кэш вариантов у каждого чата свой
+            
+        Returns:
+            {"status": "success", "variants": [результаты _generate_single_photo],
+             "cache_key": "...", "from_cache": N} или {"status": "error", "error": "..."}
+        """
+        cache_key = result_cache.make_key(
+            "photo", self.model,
+            {"prompt": prompt, "aspect_ratio": aspect_ratio, "reference_image_url": reference_image_url},
+            scope
+        )
+        cached = result_cache.take(cache_key, count)
+        if cached:
+            saved_usd = ledger.estimate_cost(self.model, 1, "image")
+            for variant in cached:
+                ledger.record_cache_hit("generate_photo", model=self.model, saved_usd=saved_usd)
+                if variant.get("photo_path") and not Path(variant["photo_path"]).exists():
+                    variant["photo_path"] = None
+            logger.info(f"💾 Сцена {scene_index + 1}: {len(cached)} вариантов из кэша")
+        
+        results = await asyncio.gather(*(
+            self._generate_single_photo(
+                prompt=prompt,
+                aspect_ratio=aspect_ratio,
+                reference_image_url=reference_image_url,
+                scene_index=scene_index,
+                variant=len(cached) + i + 1
+            )
+            for i in range(count - len(cached))
+        ))
+        variants = cached + [result for result in results if result.get("status") == "success"]
+        
+        if not variants:
+            errors = [result.get("error", "Неизвестная ошибка") for result in results]
+            return {"status": "error", "error": errors[0] if errors else "Нет вариантов"}
+        
+        logger.info(f"✅ Сцена {scene_index + 1}: готово вариантов {len(variants)}/{count}")
+        return {"status": "success", "variants": variants, "cache_key": cache_key, "from_cache": len(cached)}
+    
+    async def _request_photo(self, params: Dict) -> object:
+        """Одна попытка генерации через роутер (дубль запроса, если ответ задерживается)"""
+        try:
+            route = await self.router.run(self.spec.key, params)
+        except Exception as e:
+            record_replicate_error("generate_photo", e)
+            raise
+        return route.output
+    
+    async def _download_photo(self, photo_url: str, scene_index: int, variant: int = 0) -> str:
         """Скачивает фото локально"""
         try:
-            import aiohttp
+            suffix = f"_v{variant}" if variant else ""
+            # Уникальное имя: новый вариант не перезаписывает файл варианта из кэша
+            photo_path = self.temp_images_dir / f"scene_{scene_index + 1}{suffix}_{uuid.uuid4().hex[:8]}.png"
             
-            photo_path = self.temp_images_dir / f"scene_{scene_index + 1}.png"
-            
-            async with aiohttp.ClientSession() as session:
+            async with http_session(self.http_session) as session:
                 async with session.get(photo_url) as resp:
                     if resp.status == 200:
+                        content = await resp.read()
+                        record_transfer("download", "replicate", len(content))
                         with open(photo_path, 'wb') as f:
-                            f.write(await resp.read())
+                            f.write(content)
                         logger.info(f"💾 Фото сохранено: {photo_path}")
                         return str(photo_path)
                     else:
@@ -556,21 +551,75 @@ class PhotoGenerator:
         start_photo_url: str,
         end_photo_url: str,
         num_frames: int = 3,
-        aspect_ratio: str = "16:9"
+        aspect_ratio: str = "16:9",
+        method: Optional[str] = None,
+        output_dir: Optional[str] = None
     ) -> list:
         """
         Генерирует промежуточные фреймы между двумя фото
         (для плавной анимации между сценами)
         
+        По умолчанию кадры строятся локально в пуле процессов (оптический поток
+        или кросс-фейд, см. generators.interpolation) и пишутся в рабочую папку
+        задачи. Способ "ai" - прежние запросы к модели, по одному на кадр.
+        
         Args:
-            start_photo_url: URL первого фото
-            end_photo_url: URL финального фото
+            start_photo_url: URL (или путь) первого фото
+            end_photo_url: URL (или путь) финального фото
             num_frames: Количество промежуточных фреймов
-            aspect_ratio: Соотношение сторон
+            aspect_ratio: Соотношение сторон (для способа ai)
+            method: flow, dissolve или ai (по умолчанию INTERPOLATION_METHOD)
+            output_dir: Папка для кадров (по умолчанию - рабочая папка задачи)
             
         Returns:
-            Список URL промежуточных фреймов
+            Кадры по порядку, включая первое и финальное фото:
+            локальные пути (flow, dissolve) или URL (ai)
         """
+        method = method or INTERPOLATION_METHOD
+        if method == "ai":
+            return await self._generate_intermediate_frames_ai(start_photo_url, end_photo_url, num_frames, aspect_ratio)
+        
+        logger.info(f"🎬 Строю {num_frames} промежуточных фреймов локально ({method})...")
+        try:
+            start_bytes, end_bytes = await asyncio.gather(
+                self._read_photo(start_photo_url),
+                self._read_photo(end_photo_url)
+            )
+            if output_dir is None:
+                job = current_job()
+                base_dir = job.workspace if job is not None else self.temp_images_dir
+                output_dir = str(base_dir / f"frames_{uuid.uuid4().hex[:8]}")
+            
+            result = await media_pool.run(
+                media_jobs.interpolate_frames, start_bytes, end_bytes, num_frames, output_dir, method,
+                task_name="interpolate_frames"
+            )
+            logger.info(f"✅ Промежуточные фреймы готовы: {len(result['frame_paths'])} кадров в {output_dir}")
+            return result["frame_paths"]
+        
+        except Exception as e:
+            logger.error(f"❌ Ошибка построения промежуточных фреймов: {e}")
+            return [start_photo_url, end_photo_url]
+    
+    async def _read_photo(self, source: str) -> bytes:
+        """Байты фото по URL или локальному пути"""
+        if not source.startswith(("http://", "https://")):
+            return await asyncio.to_thread(Path(source).read_bytes)
+        async with http_session(self.http_session) as session:
+            async with session.get(source) as resp:
+                resp.raise_for_status()
+                content = await resp.read()
+                record_transfer("download", "replicate", len(content))
+                return content
+    
+    async def _generate_intermediate_frames_ai(
+        self,
+        start_photo_url: str,
+        end_photo_url: str,
+        num_frames: int,
+        aspect_ratio: str
+    ) -> list:
+        """Промежуточные фреймы через модель (по запросу на кадр, 30-60 с каждый)"""
         logger.info(f"🎬 Генерирую {num_frames} промежуточных фреймов...")
         
         intermediate_frames = [start_photo_url]
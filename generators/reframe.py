@@ -0,0 +1,149 @@
+"""
+Локальная смена соотношения сторон фото (Pillow + NumPy)
+
+Смена формата - геометрическая операция, поэтому по умолчанию она выполняется
+локально в пуле процессов, без запроса к модели:
+    crop - умная обрезка: окно обрезки выбирается по карте энергии
+           (градиенты яркости), чтобы в кадре осталась самая детальная часть;
+    pad  - исходное фото целиком на размытом фоне из него же;
+    auto - crop, если после обрезки остается не меньше min_keep площади,
+           иначе pad.
+Дорисовка фона моделью (content-aware fill) остается отдельным платным шагом
+в photo_handler.
+"""
+from typing import Tuple
+
+# Сторона карты энергии: для выбора окна обрезки полного разрешения не нужно
+ENERGY_MAP_SIZE = 256
+
+# Длинная сторона результата: Telegram все равно сжимает фото до 2560px
+MAX_SIDE = 2560
+
+RATIOS = {
+    "16:9": (16, 9),
+    "9:16": (9, 16),
+    "1:1": (1, 1),
+    "4:3": (4, 3),
+    "3:4": (3, 4),
+}
+
+
+def parse_ratio(aspect_ratio: str) -> Tuple[int, int]:
+    """'16:9' -> (16, 9)"""
+    if aspect_ratio in RATIOS:
+        return RATIOS[aspect_ratio]
+    width, height = aspect_ratio.split(":")
+    return int(width), int(height)
+
+
+def crop_size(width: int, height: int, ratio: Tuple[int, int]) -> Tuple[int, int]:
+    """Наибольшее окно нужного соотношения внутри кадра"""
+    rw, rh = ratio
+    if width * rh > height * rw:
+        return round(height * rw / rh), height
+    return width, round(width * rh / rw)
+
+
+def pad_size(width: int, height: int, ratio: Tuple[int, int]) -> Tuple[int, int]:
+    """Наименьший холст нужного соотношения, вмещающий кадр"""
+    rw, rh = ratio
+    if width * rh > height * rw:
+        return width, round(width * rh / rw)
+    return round(height * rw / rh), height
+
+
+def energy_map(image):
+    """Карта энергии: модуль градиента яркости на уменьшенной копии"""
+    import numpy as np
+    from PIL import Image
+
+    small = image.convert("L")
+    small.thumbnail((ENERGY_MAP_SIZE, ENERGY_MAP_SIZE), Image.BILINEAR)
+    gray = np.asarray(small, dtype=np.float32)
+    gy, gx = np.gradient(gray)
+    return np.hypot(gx, gy)
+
+
+def best_offset(profile, window: int) -> int:
+    """Начало окна длины window с максимальной суммой профиля энергии"""
+    import numpy as np
+
+    if window >= len(profile):
+        return 0
+    cumulative = np.concatenate(([0.0], np.cumsum(profile)))
+    sums = cumulative[window:] - cumulative[:-window]
+    # При равной энергии (однотонный фон) предпочитаем центр кадра
+    center = (len(profile) - window) / 2
+    penalty = np.abs(np.arange(len(sums)) - center) * max(sums.max(), 1.0) * 1e-4
+    return int(np.argmax(sums - penalty))
+
+
+def smart_crop(image, ratio: Tuple[int, int]):
+    """Обрезка до соотношения ratio по окну с наибольшей энергией"""
+    width, height = image.size
+    crop_w, crop_h = crop_size(width, height, ratio)
+    energy = energy_map(image)
+    scale = energy.shape[1] / width
+
+    if crop_w < width:
+        window = max(1, round(crop_w * scale))
+        left = round(best_offset(energy.sum(axis=0), window) / scale)
+        left = min(max(left, 0), width - crop_w)
+        return image.crop((left, 0, left + crop_w, height))
+    if crop_h < height:
+        window = max(1, round(crop_h * scale))
+        top = round(best_offset(energy.sum(axis=1), window) / scale)
+        top = min(max(top, 0), height - crop_h)
+        return image.crop((0, top, width, top + crop_h))
+    return image
+
+
+def blurred_pad(image, ratio: Tuple[int, int], blur_radius: float = 0.04):
+    """Фото целиком на размытом и затемненном фоне из того же фото"""
+    from PIL import Image, ImageEnhance, ImageFilter, ImageOps
+
+    width, height = image.size
+    canvas_size = pad_size(width, height, ratio)
+    if max(canvas_size) > MAX_SIDE:
+        scale = MAX_SIDE / max(canvas_size)
+        image = image.resize((max(1, round(width * scale)), max(1, round(height * scale))), Image.LANCZOS)
+        width, height = image.size
+        canvas_size = pad_size(width, height, ratio)
+    # Фон размываем на уменьшенной копии - быстрее при том же результате
+    preview_scale = min(1.0, 512 / max(canvas_size))
+    preview_size = (max(1, round(canvas_size[0] * preview_scale)), max(1, round(canvas_size[1] * preview_scale)))
+    background = ImageOps.fit(image.convert("RGB"), preview_size, Image.BILINEAR)
+    background = background.filter(ImageFilter.GaussianBlur(max(preview_size) * blur_radius))
+    background = ImageEnhance.Brightness(background).enhance(0.7)
+    background = background.resize(canvas_size, Image.BILINEAR)
+
+    left = (canvas_size[0] - width) // 2
+    top = (canvas_size[1] - height) // 2
+    background.paste(image.convert("RGB"), (left, top))
+    return background
+
+
+def reframe(image, aspect_ratio: str, mode: str = "auto", min_keep: float = 0.6) -> Tuple[object, str]:
+    """
+    Приводит фото к соотношению сторон
+
+    Args:
+        image: PIL.Image
+        aspect_ratio: Целевое соотношение ("16:9", "9:16", "1:1"...)
+        mode: auto, crop или pad
+        min_keep: Для auto - минимальная доля площади, остающаяся после обрезки
+
+    Returns:
+        (новое изображение, примененный способ)
+    """
+    ratio = parse_ratio(aspect_ratio)
+    width, height = image.size
+    if mode == "auto":
+        crop_w, crop_h = crop_size(width, height, ratio)
+        mode = "crop" if crop_w * crop_h >= min_keep * width * height else "pad"
+
+    if mode == "crop":
+        return smart_crop(image, ratio), mode
+    if mode == "pad":
+        return blurred_pad(image, ratio), mode
+    raise ValueError(f"Неизвестный способ смены формата: {mode}")
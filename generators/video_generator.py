@@ -2,41 +2,57 @@
 import asyncio
 import json
 import logging
+import random
 import sys
 from pathlib import Path
-from typing import Optional, List, Dict
+from typing import Awaitable, Optional, List, Dict
 
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-import replicate
-from replicate import Client
-from openai import AsyncOpenAI
-from src.config import REPLICATE_API_TOKEN, GROK_API_KEY
+from src.config import REPLICATE_API_TOKEN, SCENE_PLAN_VARIANTS, VIDEO_DRAFT_MODEL
+from src.llm_gateway import llm_gateway
+from src.ledger import ledger
+from src.result_cache import result_cache
+from src.metrics import instrument_stage, record_replicate_error
+from src.retry_policy import REPLICATE_VIDEO
+from models.registry import model_registry, ModelValidationError
 from src.prompts_config import prompts_manager
 
 logger = logging.getLogger(__name__)
 
+# Верхняя граница seed (int32 - принимают все модели Replicate)
+SEED_MAX = 2 ** 31 - 1
+
 
 class VideoGenerator:
     """Класс для генерации видео через Replicate API"""
     
-    def __init__(self):
+    def __init__(self, replicate_client=None, llm=None, router=None):
+        """
+        Args:
+            replicate_client: Общий клиент Replicate (см. src.clients)
+            llm: LLM шлюз (по умолчанию src.llm_gateway.llm_gateway)
+            router: Роутер моделей (по умолчанию - только Replicate)
+        """
         self.replicate_token = REPLICATE_API_TOKEN
-        self.replicate_client = Client(api_token=REPLICATE_API_TOKEN)
         
-        # Инициализируем Groq API
-        self.grok_client = AsyncOpenAI(
-            api_key=GROK_API_KEY,
-            base_url="https://api.groq.com/openai/v1"
-        )
+        # Тяжелые SDK импортируются только если клиенты не переданы из реестра
+        if replicate_client is None:
+            from replicate import Client
+            replicate_client = Client(api_token=REPLICATE_API_TOKEN)
+        self.replicate_client = replicate_client
         
-        logger.info(f"✅ Groq API инициализирован (llama-3.3-70b-versatile)")
+        # Выбор бэкенда, переключение на эквивалентную модель при сбоях
+        if router is None:
+            from generators.model_router import ModelRouter, ReplicateProvider
+            router = ModelRouter([ReplicateProvider(replicate_client)])
+        self.router = router
         
-        # Модели
-        self.models = {
-            "kling": "kwaivgi/kling-v2.5-turbo-pro",
-            "veo": "google/veo-3.1-fast"
-        }
+        # Groq вызывается через общий LLM шлюз (таймауты, hedging, лимиты)
+        self.llm = llm or llm_gateway
+        
+        # Модели (короткое имя → идентификатор Replicate) из models/parameters
+        self.models = {key: spec.model_id for key, spec in model_registry.by_category("video").items()}
         
         # Параметры по умолчанию
         self.default_params = {
@@ -68,12 +84,10 @@ class VideoGenerator:
             
             # 🎯 Сначала улучшаем исходный промт
             try:
-                enhance_response = await self.grok_client.chat.completions.create(
-                    model="llama-3.3-70b-versatile",
+                enhanced_prompt = await self.llm.groq_chat(
                     messages=[{"role": "user", "content": f"Improve this video description to make it more vivid, specific, and suitable for AI video generation. Keep it concise (1-2 sentences):\n\n{prompt}"}],
                     temperature=0.5
                 )
-                enhanced_prompt = enhance_response.choices[0].message.content.strip()
                 logger.info(f"✨ Промт улучшен: {enhanced_prompt[:100]}...")
             except Exception as e:
                 logger.warning(f"⚠️ Не удалось улучшить промт: {e}, используем оригинал")
@@ -88,13 +102,10 @@ class VideoGenerator:
             # Используем Groq для разбиения промта на сцены
             full_message = f"{system_message}\n\nUSER: {user_message}"
             
-            response = await self.grok_client.chat.completions.create(
-                model="llama-3.3-70b-versatile",
+            response_text = await self.llm.groq_chat(
                 messages=[{"role": "user", "content": full_message}],
                 temperature=0.7
             )
-            
-            response_text = response.choices[0].message.content.strip()
             logger.info(f"🤖 Groq ответ получен, длина: {len(response_text)} символов")
             
             # Парсим JSON - ищем массив
@@ -255,13 +266,10 @@ class VideoGenerator:
             
             full_message = f"{system_prompt}\n\n{translation_request}"
             
-            response = await self.grok_client.chat.completions.create(
-                model="llama-3.3-70b-versatile",
+            response_text = await self.llm.groq_chat(
                 messages=[{"role": "user", "content": full_message}],
                 temperature=0.3
             )
-            
-            response_text = response.choices[0].message.content.strip()
             logger.info(f"🤖 Groq перевод ответ: {response_text[:150]}...")
             
             # Парсим переведенные сцены - удаляем markdown backticks
@@ -440,14 +448,11 @@ class VideoGenerator:
             Переведенный текст
         """
         try:
-            response = await self.grok_client.chat.completions.create(
-                model="llama-3.3-70b-versatile",
+            return await self.llm.groq_chat(
                 messages=[{"role": "user", "content": f"Translate to Russian accurately: {text}"}],
                 temperature=0.3
             )
             
-            return response.choices[0].message.content.strip()
-            
         except Exception as e:
             logger.warning(f"⚠️ Ошибка Groq при переводе: {e}")
             logger.warning(f"🔄 Использую встроенный словарь для перевода...")
@@ -483,8 +488,7 @@ Based on what you see in the image:
 
 Return ONLY the enhanced video prompt (2-3 sentences), nothing else."""
 
-            response = await self.grok_client.chat.completions.create(
-                model="llama-3.3-70b-versatile",
+            enhanced_prompt = await self.llm.groq_chat(
                 messages=[
                     {
                         "role": "user",
@@ -497,7 +501,6 @@ Return ONLY the enhanced video prompt (2-3 sentences), nothing else."""
                 temperature=0.7
             )
             
-            enhanced_prompt = response.choices[0].message.content.strip()
             logger.info(f"✅ Сцена {scene_number}: Промт улучшен через Vision анализ")
             logger.info(f"   Улучшенный промт: {enhanced_prompt[:100]}...")
             
@@ -508,6 +511,7 @@ Return ONLY the enhanced video prompt (2-3 sentences), nothing else."""
             logger.warning(f"   Используем оригинальный промт")
             return original_prompt
 
+    @instrument_stage("generate_scene", model=lambda a: a["model"])
     async def generate_scene(
         self,
         prompt: str,
@@ -519,7 +523,9 @@ Return ONLY the enhanced video prompt (2-3 sentences), nothing else."""
         require_image: bool = False,
         resolution: str = "1080p",
         generate_audio: bool = True,
-        negative_prompt: str = ""
+        negative_prompt: str = "",
+        seed: Optional[int] = None,
+        draft: bool = False
     ) -> Dict:
         """
         Генерирует одну сцену видео
@@ -535,120 +541,91 @@ Return ONLY the enhanced video prompt (2-3 sentences), nothing else."""
             resolution: Разрешение видео (только для Veo: 720p, 1080p)
             generate_audio: Генерировать ли звук (только для Veo)
             negative_prompt: Отрицательный промт (для Kling и Veo)
+            seed: Seed генерации (для моделей, которые его принимают, например Veo)
+            draft: Черновик - поверх параметров применяются draft_settings модели
             
         Returns:
             Dict с результатом или ошибкой
         """
+        log_extra = {"scene": scene_number, "model": model, "draft": draft}
         try:
-            # 🔴 КРИТИЧЕСКОЕ ЛОГИРОВАНИЕ В НАЧАЛЕ
-            logger.info(f"🎬 🎬 🎬 [GENERATE_SCENE ВЫЗВАНА] 🎬 🎬 🎬")
-            logger.info(f"   prompt = {prompt[:50]}...")
-            logger.info(f"   model = {model}")
-            logger.info(f"   start_image_url = {start_image_url}")
-            logger.info(f"   start_image_url type = {type(start_image_url).__name__}")
-            logger.info(f"   require_image = {require_image}")
-            logger.info(f"   require_image AND NOT start_image_url = {require_image and not start_image_url}")
-            
             # ❌ ОШИБКА: Если требуется изображение, но его нет - не генерируем
             if require_image and not start_image_url:
                 error_msg = f"❌ ОШИБКА: Для режима image-to-video обязательно нужно изображение! Загрузи фото перед генерацией."
-                logger.error(error_msg)
-                logger.error(f"   require_image={require_image}, start_image_url={start_image_url}")
+                logger.error(error_msg, extra=log_extra)
                 return {
                     "status": "error",
                     "error": error_msg,
                     "code": "MISSING_IMAGE"
                 }
             
-            model_id = self.models.get(model, self.models["kling"])
+            spec = model_registry.get(model) or model_registry.get("kling")
             
-            # Подготавливаем параметры в зависимости от модели
-            input_params = {
+            # Payload собирается по схеме модели: общие входы (start_image) переводятся
+            # в поля модели, неподдерживаемые параметры (resolution у Kling) отбрасываются
+            params = {
                 "prompt": prompt,
                 "duration": duration,
-                "aspect_ratio": aspect_ratio
+                "aspect_ratio": aspect_ratio,
+                "start_image": start_image_url,
+                "negative_prompt": negative_prompt or None,
+                "resolution": resolution,
+                "generate_audio": generate_audio,
+                "seed": seed,
             }
+            if draft:
+                params.update(spec.draft_settings)
+                duration = params["duration"]
+            try:
+                input_params = spec.build(params)
+            except ModelValidationError as e:
+                # Запрос не прошел бы проверку Replicate - не тратим время на очередь
+                logger.error("❌ Сцена %s: неверные параметры: %s", scene_number, e, extra=log_extra)
+                return {
+                    "status": "error",
+                    "error": str(e),
+                    "code": "INVALID_PARAMS",
+                    "model": model,
+                    "scene_number": scene_number
+                }
             
-            logger.info(f"🎬 Сцена {scene_number}: Подготавливаю параметры для {model}")
-            logger.info(f"   Промт: {prompt[:60]}...")
-            logger.info(f"   Параметры: duration={duration}s, aspect_ratio={aspect_ratio}")
-            logger.info(f"   IMAGE_URL получен: {start_image_url}")  # 👈 ДЛЯ ОТЛАДКИ
-            
-            # Добавляем специфичные параметры
-            if "kling" in model.lower():
-                input_params["negative_prompt"] = negative_prompt if negative_prompt else ""
-                if start_image_url:
-                    input_params["image"] = start_image_url  # 📌 Kling использует параметр "image"
-                    logger.info(f"   ✅ Используется image для связности: {start_image_url[:80]}...")
-                    logger.info(f"   ✓ Проверка: 'image' в input_params? {'image' in input_params}")
-                    logger.info(f"   ✓ input_params['image'] = {input_params.get('image', 'NOT FOUND')}")
-                else:
-                    logger.info(f"   ⚠️ image_url пуст или None - видео генерируется БЕЗ начального фрейма")
-            elif "veo" in model.lower():
-                # ✅ Veo 3.1 полная поддержка всех параметров
-                if start_image_url:
-                    input_params["image"] = start_image_url
-                    logger.info(f"   ✅ Veo: Используется image для анимации: {start_image_url[:80]}...")
-                else:
-                    logger.info(f"   ⚠️ Veo: image_url пуст - генерируется text-to-video")
-                
-                # Добавляем параметры Veo
-                input_params["resolution"] = resolution  # 720p или 1080p
-                input_params["generate_audio"] = generate_audio  # True/False
-                
-                if negative_prompt:
-                    input_params["negative_prompt"] = negative_prompt
-                    logger.info(f"   ❌ Veo: negative_prompt: {negative_prompt[:50]}...")
-                
-                logger.info(f"   🎬 Veo: resolution={resolution}, audio={generate_audio}")
+            logger.info(
+                "🎬 Сцена %s: запрос %s (%s, %ss, %s, %s)",
+                scene_number, "черновика" if draft else "генерации", spec.model_id, duration, aspect_ratio,
+                "image-to-video" if start_image_url else "text-to-video",
+                extra=log_extra
+            )
+            # Полный payload - только в DEBUG и выборочно (см. LOG_SAMPLE_RATES)
+            logger.debug("📋 Payload: %s", input_params, extra={**log_extra, "event": "replicate.payload"})
             
-            logger.info(f"🎬 Сцена {scene_number}: Отправляю запрос на Replicate API...")
-            logger.info(f"   Model ID: {model_id}")
-            logger.info(f"   📤 JSON параметры отправляются: {json.dumps(input_params, ensure_ascii=False, indent=2)}")  # 👈 ДЛЯ ОТЛАДКИ
-            logger.info(f"   🔍 Финальная проверка input_params перед API:")
-            logger.info(f"      - 'image' в params? {'image' in input_params}")
-            logger.info(f"      - 'prompt' в params? {'prompt' in input_params}")
-            logger.info(f"      - 'duration' в params? {'duration' in input_params}")
-            logger.info(f"      - 'aspect_ratio' в params? {'aspect_ratio' in input_params}")
+            # 🚀 РЕАЛЬНЫЙ API ВЫЗОВ (роутер может переключиться на эквивалентную модель,
+            # повтор после временной ошибки - по политике REPLICATE_VIDEO)
+            route = await REPLICATE_VIDEO.run(lambda p: self.router.run(spec.key, p), params)
             
-            # Используем синхронный replicate.run в потоке
-            logger.info(f"🔄 Вызываю replicate.run() с параметрами...")
-            logger.info(f"   input_params = {input_params}")
-            logger.info(f"=" * 80)
-            logger.info(f"📋 Model ID: {model_id}")
-            logger.info(f"📋 JSON payload:")
-            logger.info(json.dumps(input_params, ensure_ascii=False, indent=2))
-            logger.info(f"=" * 80)
-            
-            # 🚀 РЕАЛЬНЫЙ API ВЫЗОВ
-            loop = asyncio.get_event_loop()
-            output = await loop.run_in_executor(
-                None,
-                lambda: self.replicate_client.run(
-                    model_id,
-                    input=input_params
-                )
+            output_str = str(route.output) if route.output else "None"
+            logger.info(
+                "✅ Сцена %s: видео сгенерировано (%s:%s)", scene_number, route.provider, route.spec.key,
+                extra=log_extra
             )
-            
-            output_str = str(output) if output else "None"
-            logger.info(f"✅ Сцена {scene_number}: Видео сгенерировано!")
-            logger.info(f"   URL: {output_str[:80]}...")
-            logger.info(f"   Полный ответ Replicate: {output}")
+            logger.debug("   Ответ Replicate: %s", output_str, extra={**log_extra, "event": "replicate.output"})
             
             return {
                 "status": "success",
                 "video_url": output_str,
-                "model": model,
-                "duration": duration,
-                "scene_number": scene_number
+                "model": route.spec.key,
+                "duration": route.payload.get("duration", duration),
+                "provider": route.provider,
+                "scene_number": scene_number,
+                "seed": seed,
+                "draft": draft
             }
             
         except Exception as e:
-            logger.error(f"❌ Сцена {scene_number}: Ошибка генерации видео!")
-            logger.error(f"   Ошибка: {str(e)}")
-            logger.error(f"   Тип: {type(e).__name__}")
-            import traceback
-            logger.error(f"   Traceback: {traceback.format_exc()}")
+            code = record_replicate_error("generate_scene", e)
+            logger.error(
+                "❌ Сцена %s: ошибка генерации видео (%s): %s", scene_number, code, e,
+                exc_info=True, extra={**log_extra, "error_code": code}
+            )
             return {
                 "status": "error",
                 "error": str(e),
@@ -656,21 +633,58 @@ Return ONLY the enhanced video prompt (2-3 sentences), nothing else."""
                 "scene_number": scene_number
             }
 
+    async def enhance_prompt_variants(
+        self,
+        prompt: str,
+        num_scenes: int = 3,
+        duration_per_scene: int = 5,
+        count: int = SCENE_PLAN_VARIANTS,
+        scope: Optional[int] = None
+    ) -> Dict:
+        """
+        Несколько вариантов разбивки промта на сцены параллельно (scope - чат для кэша вариантов)
+        
+        Returns:
+            {"variants": [результаты enhance_prompt_with_gemini], "cache_key": "...", "from_cache": N}
+        """
+        cache_key = result_cache.make_key(
+            "scene_plan", "groq", {"prompt": prompt, "num_scenes": num_scenes, "duration": duration_per_scene}, scope
+        )
+        cached = result_cache.take(cache_key, count)
+        for _ in cached:
+            ledger.record_cache_hit("scene_plan", model="groq")
+        
+        results = await asyncio.gather(*(
+            self.enhance_prompt_with_gemini(prompt, num_scenes=num_scenes, duration_per_scene=duration_per_scene)
+            for _ in range(count - len(cached))
+        ), return_exceptions=True)
+        variants = cached + [result for result in results if isinstance(result, dict) and result.get("scenes")]
+        if not variants:
+            errors = [result for result in results if isinstance(result, Exception)]
+            if errors:
+                raise errors[0]
+        return {"variants": variants, "cache_key": cache_key, "from_cache": len(cached)}
+
     async def generate_multiple_scenes(
         self,
         scenes: List[Dict],
         model: str = "kling",
         start_image_url: Optional[str] = None,
-        scene_image_urls: Optional[List[str]] = None
+        scene_image_urls: Optional[List[str]] = None,
+        draft: bool = False,
+        prefetched: Optional[Dict[int, Awaitable]] = None
     ) -> List[Dict]:
         """
         Генерирует несколько сцен параллельно
         
         Args:
-            scenes: Список сцен с промтами
+            scenes: Список сцен с промтами (seed сцены передается модели)
             model: Модель для генерации
             start_image_url: URL начального фрейма (для первой сцены, если нет scene_image_urls)
             scene_image_urls: Список URLs изображений - по одному для каждой сцены (приоритет над start_image_url)
+            draft: Черновики (draft_settings модели)
+            prefetched: Уже запущенные генерации по индексу сцены (src.speculative) -
+                для этих сцен новый запрос не отправляется
             
         Returns:
             Список результатов генерации
@@ -696,14 +710,13 @@ Return ONLY the enhanced video prompt (2-3 sentences), nothing else."""
             if scene_image:
                 logger.info(f"📸 Сцена {i+1}: будет использовать загруженное фото")
             
-            task = self.generate_scene(
-                prompt=scene["prompt"],
-                model=model,
-                duration=scene.get("duration", 5),
-                aspect_ratio=scene.get("aspect_ratio", "16:9"),
-                start_image_url=scene_image,  # ✅ Передаем фото для ЭТОЙ сцены (не только первой!)
-                scene_number=i + 1
-            )
+            if prefetched and i in prefetched:
+                logger.info(f"🔮 Сцена {i+1}: результат спекулятивной генерации")
+                tasks.append(prefetched[i])
+                continue
+            
+            # ✅ Передаем фото для ЭТОЙ сцены (не только первой!)
+            task = self.generate_scene(**self.scene_params(scene, model, i, scene_image, draft))
             tasks.append(task)
         
         # Генерируем ВСЕ сцены параллельно (asyncio.gather)
@@ -727,6 +740,121 @@ Return ONLY the enhanced video prompt (2-3 sentences), nothing else."""
         logger.info(f"✅ Параллельная генерация завершена. Результаты: {len(processed_results)} сцен")
         return processed_results
 
+    @staticmethod
+    def scene_params(
+        scene: Dict,
+        model: str,
+        index: int,
+        start_image_url: Optional[str] = None,
+        draft: bool = False
+    ) -> Dict:
+        """Аргументы generate_scene для сцены сценария (по ним же сверяются спекулятивные запуски)"""
+        return {
+            "prompt": scene["prompt"],
+            "model": model,
+            "duration": scene.get("duration", 5),
+            "aspect_ratio": scene.get("aspect_ratio", "16:9"),
+            "start_image_url": start_image_url,
+            "scene_number": scene.get("scene_number", index + 1),
+            "seed": scene.get("seed"),
+            "draft": draft,
+        }
+
+    @staticmethod
+    def ensure_seed(scene: Dict) -> int:
+        """Seed сцены: назначается один раз, чтобы черновик и финал совпадали"""
+        if scene.get("seed") is None:
+            scene["seed"] = random.randint(0, SEED_MAX)
+        return scene["seed"]
+
+    @staticmethod
+    def estimate_scene_cost(params: Dict) -> float:
+        """Оценка стоимости generate_scene(**params) по прайсу модели"""
+        spec = model_registry.get(params.get("model", "kling"))
+        if spec is None:
+            return 0.0
+        if params.get("draft"):
+            return spec.draft_cost()
+        return ledger.estimate_cost(spec.model_id, params.get("duration") or 0, "second")
+
+    @staticmethod
+    def draft_model(model: str) -> str:
+        """Модель черновиков для финальной модели model (см. VIDEO_DRAFT_MODEL)"""
+        if VIDEO_DRAFT_MODEL == "cheapest":
+            spec = model_registry.cheapest_draft("video")
+            return spec.key if spec else model
+        return VIDEO_DRAFT_MODEL or model
+
+    def draft_plan(self, scenes: List[Dict], model: str = "kling") -> Optional[Dict]:
+        """
+        Как показывать сцены до финала
+        
+        Returns:
+            {"mode", "model", "cost", "final_cost", "same_seed"}:
+            mode "draft" - черновики дешевле финала (draft_settings, модель
+            draft_model); mode "preview" - черновик стоил бы не меньше финала,
+            поэтому сцены сразу генерируются в финальном качестве и одобренные
+            идут в видео как есть. None - черновики другой моделью не дешевле
+            финала, предлагать их незачем.
+        """
+        draft_model = self.draft_model(model)
+        final_cost = sum(
+            self.estimate_scene_cost(self.scene_params(scene, model, i)) for i, scene in enumerate(scenes)
+        )
+        draft_cost = sum(
+            self.estimate_scene_cost(self.scene_params(scene, draft_model, i, draft=True))
+            for i, scene in enumerate(scenes)
+        )
+        spec = model_registry.get(model)
+        plan = {
+            "mode": "draft",
+            "model": draft_model,
+            "cost": draft_cost,
+            "final_cost": final_cost,
+            # Финал повторяет черновик только у той же модели с полем seed
+            "same_seed": draft_model == model and spec is not None and spec.supports("seed"),
+        }
+        if draft_cost < final_cost:
+            return plan
+        if draft_model == model:
+            return {**plan, "mode": "preview", "cost": final_cost, "same_seed": False}
+        return None
+
+    async def generate_draft_scenes(
+        self,
+        scenes: List[Dict],
+        model: str = "kling",
+        scene_image_urls: Optional[List[str]] = None,
+        prefetched: Optional[Dict[int, Awaitable]] = None
+    ) -> List[Dict]:
+        """
+        Черновики всех сцен параллельно (дешевые настройки модели из реестра)
+        
+        Сценам без seed назначается случайный seed и записывается в сами сцены:
+        финальная генерация одобренных сцен через generate_multiple_scenes
+        повторяет промт и seed черновика.
+        
+        Args:
+            scenes: Список сцен с промтами (дополняется полем seed)
+            model: Модель финальной генерации
+            scene_image_urls: Фото для каждой сцены (image-to-video)
+            prefetched: Уже запущенные черновики по индексу сцены (src.speculative)
+            
+        Returns:
+            Список результатов generate_scene (draft=True)
+        """
+        for scene in scenes:
+            self.ensure_seed(scene)
+        draft_model = self.draft_model(model)
+        logger.info(f"📝 Черновики {len(scenes)} сцен через {draft_model} (финал - {model})")
+        return await self.generate_multiple_scenes(
+            scenes=scenes,
+            model=draft_model,
+            scene_image_urls=scene_image_urls,
+            draft=True,
+            prefetched=prefetched
+        )
+
     async def generate_photo(
         self,
         prompt: str,
@@ -1,15 +1,24 @@
 """Объединение видео с плавными переходами"""
 import asyncio
 import logging
-from typing import List, Optional
+import sys
+from typing import Dict, List, Optional
 from pathlib import Path
-import requests
-from moviepy.editor import (
-    VideoFileClip, concatenate_videoclips, CompositeVideoClip,
-    vfx, CompositeAudioClip
-)
-from PIL import Image
-import io
+
+import aiohttp
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.config import VIDEO_ENCODER_PROFILE
+from generators import media_jobs
+from generators.encoder_profiles import get_segment_params
+from generators.http_utils import http_session
+from generators.media_pool import media_pool
+from src.build_graph import file_hash
+from src.jobs import current_job
+from src.ledger import ledger
+from src.metrics import instrument_stage, record_transfer
+from src.segment_cache import segment_cache
 
 logger = logging.getLogger(__name__)
 
@@ -20,55 +29,78 @@ class VideoStitcher:
     # Параметры плавного перехода
     TRANSITION_DURATION = 0.5  # 0.5 секунды
     TRANSITION_TYPE = "cross_fade"  # cross_fade или dissolve
+    # TRANSITION_TYPE -> переход ffmpeg xfade
+    XFADE_TRANSITIONS = {"cross_fade": "fade", "dissolve": "dissolve"}
     
-    def __init__(self, temp_dir: str = "temp_videos", output_dir: str = "output_videos"):
+    def __init__(
+        self,
+        temp_dir: str = "temp_videos",
+        output_dir: str = "output_videos",
+        http_session: Optional[aiohttp.ClientSession] = None
+    ):
         self.temp_dir = Path(temp_dir)
         self.output_dir = Path(output_dir)
+        self.http_session = http_session
+        # Файлы, созданные этим экземпляром (temp_dir и output_dir общие для всех чатов)
+        self.created_files = set()
         
         # Создаем директории если не существуют
         self.temp_dir.mkdir(exist_ok=True)
         self.output_dir.mkdir(exist_ok=True)
 
+    @instrument_stage("download_video")
     async def download_video(self, url: str, filename: str) -> Optional[str]:
         """
         Скачивает видео по URL
         
         Args:
             url: URL видео
-            filename: Имя файла
+            filename: Имя файла, уникальное для задачи (при отмене удаляется)
             
         Returns:
             Путь к скачанному файлу или None
         """
+        filepath = self.temp_dir / filename
+        self.created_files.add(filepath)
+        job = current_job()
+        if job is not None:
+            # При отмене генерации файл удаляется вместе с рабочей папкой
+            # (filename должен быть уникальным для задачи)
+            job.track_file(filepath)
         try:
-            filepath = self.temp_dir / filename
-            
             logger.info(f"📥 Начинаю скачивание: {filename}")
             logger.info(f"   URL: {url[:80]}...")
             
-            response = requests.get(url, stream=True, timeout=60)
-            response.raise_for_status()
-            
-            # Получаем размер файла
-            total_size = int(response.headers.get('content-length', 0))
-            logger.info(f"   Размер: {total_size / (1024*1024):.2f} MB")
-            
-            downloaded = 0
-            with open(filepath, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
-                        downloaded += len(chunk)
-                        if total_size:
-                            progress = (downloaded / total_size) * 100
-                            if int(progress) % 20 == 0:  # Логируем каждые 20%
-                                logger.info(f"   Прогресс: {progress:.1f}%")
+            # Асинхронное скачивание: отмена задачи прерывает его между чанками
+            timeout = aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=60)
+            async with http_session(self.http_session) as session:
+                async with session.get(url, timeout=timeout) as response:
+                    response.raise_for_status()
+                    
+                    # Получаем размер файла
+                    total_size = int(response.headers.get('content-length', 0))
+                    logger.info(f"   Размер: {total_size / (1024*1024):.2f} MB")
+                    
+                    downloaded = 0
+                    next_report = 20
+                    with open(filepath, 'wb') as f:
+                        async for chunk in response.content.iter_chunked(256 * 1024):
+                            f.write(chunk)
+                            downloaded += len(chunk)
+                            if total_size and downloaded * 100 >= next_report * total_size:
+                                logger.info(f"   Прогресс: {downloaded * 100 / total_size:.0f}%")
+                                next_report += 20  # Логируем каждые 20%
             
             file_size = filepath.stat().st_size
+            record_transfer("download", "replicate", file_size)
             logger.info(f"✅ Видео скачано: {filename} ({file_size / (1024*1024):.2f} MB)")
             return str(filepath)
             
+        except asyncio.CancelledError:
+            filepath.unlink(missing_ok=True)
+            raise
         except Exception as e:
+            filepath.unlink(missing_ok=True)
             logger.error(f"❌ Ошибка скачивания видео {filename}")
             logger.error(f"   Ошибка: {str(e)}")
             logger.error(f"   Тип: {type(e).__name__}")
@@ -85,14 +117,13 @@ class VideoStitcher:
             Путь к фрейму или None
         """
         try:
-            video = VideoFileClip(video_path)
-            last_frame = video.get_frame(video.duration - 0.1)  # Почти последний кадр
-            
-            # Сохраняем фрейм
             frame_path = self.temp_dir / f"frame_{Path(video_path).stem}.jpg"
-            Image.fromarray((last_frame * 255).astype('uint8')).save(frame_path)
-            
-            video.close()
+            self.created_files.add(frame_path)
+            # Почти последний кадр; декодирование и сохранение - в пуле процессов
+            await media_pool.run(
+                media_jobs.extract_frame, video_path, -0.1, str(frame_path),
+                task_name="extract_frame"
+            )
             logger.info(f"✅ Фрейм извлечен: {frame_path.name}")
             return str(frame_path)
             
@@ -111,13 +142,12 @@ class VideoStitcher:
             Путь к фрейму или None
         """
         try:
-            video = VideoFileClip(video_path)
-            first_frame = video.get_frame(0.1)
-            
             frame_path = self.temp_dir / f"first_frame_{Path(video_path).stem}.jpg"
-            Image.fromarray((first_frame * 255).astype('uint8')).save(frame_path)
-            
-            video.close()
+            self.created_files.add(frame_path)
+            await media_pool.run(
+                media_jobs.extract_frame, video_path, 0.1, str(frame_path),
+                task_name="extract_frame"
+            )
             logger.info(f"✅ Первый фрейм извлечен: {frame_path.name}")
             return str(frame_path)
             
@@ -125,56 +155,34 @@ class VideoStitcher:
             logger.error(f"❌ Ошибка извлечения первого фрейма: {e}")
             return None
 
-    async def create_cross_fade_transition(
-        self,
-        clip1: VideoFileClip,
-        clip2: VideoFileClip,
-        duration: float = 0.5
-    ) -> CompositeVideoClip:
-        """
-        Создает переход между двумя видео (cross-fade)
-        
-        Args:
-            clip1: Первое видео
-            clip2: Второе видео
-            duration: Длительность перехода в секундах
-            
-        Returns:
-            Композитное видео с переходом
-        """
-        # Длительность перекрытия
-        overlap_duration = duration
-        
-        # Первое видео播放 полностью, но последние 'overlap_duration' секунд будут с фейдом
-        clip1_faded = clip1.set_opacity(1).fx(vfx.fadeout, overlap_duration)
-        
-        # Второе видео начинается раньше, чем заканчивается первое
-        clip2_faded = clip2.set_opacity(0).fx(vfx.fadein, overlap_duration)
-        clip2_delayed = clip2_faded.set_start(clip1.duration - overlap_duration)
-        
-        # Создаем композит
-        final_clip = CompositeVideoClip(
-            [clip1_faded, clip2_delayed],
-            size=clip1.size
-        )
-        
-        return final_clip
-
+    @instrument_stage("stitch_videos", model=lambda a: a["profile"] or VIDEO_ENCODER_PROFILE)
     async def stitch_videos(
         self,
         video_paths: List[str],
-        output_filename: str = "final_video.mp4",
+        output_filename: str,
         use_transitions: bool = True,
-        fps: int = 30
+        fps: int = 30,
+        profile: Optional[str] = None,
+        aspect_ratio: Optional[str] = None,
+        transition: Optional[str] = None,
+        cancel_marker: Optional[str] = None
     ) -> Optional[str]:
         """
         Объединяет несколько видео с плавными переходами
         
+        Видео собирается из сегментов src.segment_cache: кодируются только
+        сегменты, которых еще нет в кэше (новые клипы и новые пары соседей),
+        итог склеивается копированием потоков.
+        
         Args:
             video_paths: Список путей к видео
-            output_filename: Имя выходного файла
+            output_filename: Имя выходного файла, уникальное для задачи (при отмене удаляется)
             use_transitions: Использовать ли переходы
             fps: FPS выходного видео
+            profile: Профиль кодирования (по умолчанию VIDEO_ENCODER_PROFILE)
+            aspect_ratio: Соотношение сторон (размер кадра, CRF/битрейт)
+            transition: Переход ffmpeg xfade (по умолчанию по TRANSITION_TYPE)
+            cancel_marker: Свой маркер отмены склейки (в дополнение к маркеру задачи)
             
         Returns:
             Путь к объединенному видео или None
@@ -188,93 +196,45 @@ class VideoStitcher:
             for i, path in enumerate(video_paths, 1):
                 logger.info(f"   {i}. {Path(path).name}")
             
-            # Загружаем видео
-            clips = []
-            total_duration = 0
-            
-            for i, path in enumerate(video_paths):
-                try:
-                    logger.info(f"📽️ Загружаю видео {i+1}: {Path(path).name}...")
-                    clip = VideoFileClip(path)
-                    duration = clip.duration
-                    total_duration += duration
-                    clips.append(clip)
-                    logger.info(f"   ✅ Загружено: {duration:.2f} сек")
-                except Exception as e:
-                    logger.warning(f"⚠️ Не удалось загрузить {Path(path).name}: {e}")
-                    continue
+            output_path = self.output_dir / output_filename
+            self.created_files.add(output_path)
+            profile = profile or VIDEO_ENCODER_PROFILE
+            params = get_segment_params(profile, aspect_ratio, fps)
+            job = current_job()
+            markers = [marker for marker in (cancel_marker, job.cancel_marker if job is not None else None) if marker]
+            if job is not None:
+                job.track_file(output_path)
             
+            clips = await self.probe_clips(video_paths)
             if not clips:
                 logger.error("❌ Не удалось загрузить ни одного видео!")
                 return None
             
-            logger.info(f"✅ Загружено {len(clips)} видео (всего: {total_duration:.2f} сек)")
-            
-            # Объединяем с переходами
-            if use_transitions and len(clips) > 1:
-                logger.info(f"🎨 Применяю cross-fade переходы (0.5 сек)...")
-                final_clips = [clips[0]]
-                
-                for i in range(1, len(clips)):
-                    logger.info(f"   Переход {i}: {clips[i-1].duration:.2f}s → {clips[i].duration:.2f}s")
-                    # Создаем переход между видео
-                    transition = await self.create_cross_fade_transition(
-                        clips[i - 1],
-                        clips[i],
-                        self.TRANSITION_DURATION
-                    )
-                    
-                    # Добавляем второе видео после перехода
-                    final_clips.append(clips[i])
-                
-                # Объединяем с плавными переходами
-                logger.info(f"🔗 Объединяю видео с переходами...")
-                final_video = concatenate_videoclips(final_clips, method="compose")
-            else:
-                # Просто объединяем без переходов
-                logger.info(f"🔗 Объединяю видео без переходов...")
-                final_video = concatenate_videoclips(clips, method="chain")
-            
-            # Устанавливаем FPS
-            final_video = final_video.set_fps(fps)
-            final_duration = final_video.duration
-            logger.info(f"✅ Итоговое видео: {final_duration:.2f} сек ({fps} FPS)")
-            
-            # Сохраняем
-            output_path = self.output_dir / output_filename
-            logger.info(f"💾 Кодирую видео в {output_path}...")
-            logger.info(f"   Кодек: libx264, Аудио: aac")
-            
-            # Кодируем видео (может занять время)
-            loop = asyncio.get_event_loop()
-            try:
-                await loop.run_in_executor(
-                    None,
-                    lambda: final_video.write_videofile(
-                        str(output_path),
-                        verbose=False,
-                        logger=None,
-                        fps=fps,
-                        codec='libx264',
-                        audio_codec='aac',
-                        temp_audiofile='temp-audio.m4a',
-                        remove_temp=True
-                    )
-                )
-            except Exception as encode_error:
-                logger.error(f"❌ Ошибка кодирования: {encode_error}")
-                raise
+            transition = transition or self.XFADE_TRANSITIONS.get(self.TRANSITION_TYPE, "fade")
+            plan = self.plan_segments(clips, params, transition if use_transitions else None)
+            segment_paths = await self.prepare_segments(plan, markers)
             
-            # Закрываем клипы
-            for clip in clips:
-                clip.close()
-            final_video.close()
+            logger.info(
+                f"💾 Склеиваю {len(segment_paths)} сегментов в {output_path} "
+                f"(профиль {profile}, {params['width']}x{params['height']}, {fps} FPS)..."
+            )
+            await media_pool.run(
+                media_jobs.concat_segments, segment_paths, str(output_path), markers,
+                task_name="concat_segments"
+            )
+            segment_cache.evict(keep=segment_paths)
             
+            duration = sum(step["duration"] for step in plan)
             file_size = output_path.stat().st_size if output_path.exists() else 0
-            logger.info(f"✅ Видео готово: {output_path}")
+            logger.info(f"✅ Видео готово: {output_path} ({len(clips)} клипов, {duration:.2f} сек)")
             logger.info(f"   Размер: {file_size / (1024*1024):.2f} MB")
             return str(output_path)
             
+        except asyncio.CancelledError:
+            raise
+        except media_jobs.EncodeCancelled as e:
+            logger.info(f"⏹ Склейка {output_filename} прервана: {e}")
+            return None
         except Exception as e:
             logger.error(f"❌ Ошибка объединения видео!")
             logger.error(f"   Ошибка: {str(e)}")
@@ -283,11 +243,133 @@ class VideoStitcher:
             logger.error(f"   Traceback: {traceback.format_exc()}")
             return None
 
+    async def probe_clips(self, video_paths: List[str]) -> List[Dict]:
+        """
+        Длительность, звук и хэш содержимого клипов (битые клипы пропускаются)
+        
+        Returns:
+            [{"path", "duration", "has_audio", "hash"}] в порядке video_paths
+        """
+        async def probe(path: str) -> Dict:
+            info = await asyncio.to_thread(media_jobs.probe_clip, path)
+            return {"path": str(path), **info, "hash": await asyncio.to_thread(file_hash, path)}
+        
+        results = await asyncio.gather(*(probe(path) for path in video_paths), return_exceptions=True)
+        clips = []
+        for path, result in zip(video_paths, results):
+            if isinstance(result, BaseException):
+                logger.warning(f"⚠️ Не удалось загрузить {Path(path).name}: {result}")
+            elif result["duration"] <= 0:
+                logger.warning(f"⚠️ Пустое видео {Path(path).name}")
+            else:
+                clips.append(result)
+        return clips
+
+    def _margin(self, clip: Dict, fps: int, transition: Optional[str]) -> float:
+        """Края клипа, отданные под переходы (короткие клипы - короче, 0 - без перехода)"""
+        if not transition:
+            return 0.0
+        margin = min(self.TRANSITION_DURATION, clip["duration"] / 3)
+        return round(margin, 3) if margin * fps >= 2 else 0.0
+
+    def _range_step(self, kind: str, clip: Dict, start: float, duration: float, params: Dict) -> Dict:
+        """Сегмент из отрезка одного клипа"""
+        path = str(segment_cache.path(kind, segment_cache.make_key(clip["hash"], start, duration, params)))
+        return {
+            "kind": kind,
+            "path": path,
+            "duration": duration,
+            "job": media_jobs.normalize_segment,
+            "args": (clip["path"], path, params, start, duration, clip["has_audio"]),
+        }
+
+    def plan_segments(self, clips: List[Dict], params: Dict, transition: Optional[str]) -> List[Dict]:
+        """
+        Сегменты склейки по порядку
+        
+        У каждого клипа с обоих концов отрезаются края (TRANSITION_DURATION),
+        поэтому тело клипа зависит только от самого клипа и параметров
+        кодирования - оно переиспользуется при любом порядке сцен. Края соседних
+        клипов собираются в сегмент перехода (ключ - хэши обоих клипов и вид
+        перехода), края первого и последнего клипа - в отдельные короткие
+        сегменты. Перестановка или правка сцены перекодирует только ее тело
+        (при правке) и затронутые переходы.
+        
+        Returns:
+            [{"kind", "path", "duration", "job", "args"}]: job(*args, cancel_marker)
+            записывает сегмент в path
+        """
+        margins = [self._margin(clip, params["fps"], transition) for clip in clips]
+        plan = []
+        for i, clip in enumerate(clips):
+            margin = margins[i]
+            if i == 0 and margin:
+                plan.append(self._range_step("edge", clip, 0.0, margin, params))
+            plan.append(self._range_step("body", clip, margin, round(clip["duration"] - 2 * margin, 3), params))
+            if i == len(clips) - 1:
+                if margin:
+                    plan.append(self._range_step("edge", clip, round(clip["duration"] - margin, 3), margin, params))
+                continue
+            
+            following, following_margin = clips[i + 1], margins[i + 1]
+            tail_start = round(clip["duration"] - margin, 3)
+            if not (margin and following_margin):
+                # Переход невозможен (короткий клип) - края идут как есть
+                if margin:
+                    plan.append(self._range_step("edge", clip, tail_start, margin, params))
+                if following_margin:
+                    plan.append(self._range_step("edge", following, 0.0, following_margin, params))
+                continue
+            
+            key = segment_cache.make_key(
+                clip["hash"], following["hash"], transition, margin, following_margin, params
+            )
+            path = str(segment_cache.path("transition", key))
+            plan.append({
+                "kind": "transition",
+                "path": path,
+                "duration": margin + following_margin - min(margin, following_margin),
+                "job": media_jobs.transition_segment,
+                "args": (
+                    clip["path"], following["path"], path, params, transition,
+                    tail_start, margin, following_margin, clip["has_audio"], following["has_audio"]
+                ),
+            })
+        return plan
+
+    async def prepare_segments(self, plan: List[Dict], cancel_marker: Optional[media_jobs.CancelMarker] = None) -> List[str]:
+        """
+        Готовые сегменты берутся из кэша, недостающие кодируются параллельно
+        в пуле процессов (число одновременных ffmpeg ограничено пулом)
+        
+        Returns:
+            Пути сегментов в порядке plan
+        """
+        pending = {}
+        for step in plan:
+            if step["path"] in pending:
+                continue
+            if segment_cache.lookup(Path(step["path"])):
+                ledger.record_cache_hit(f"{step['kind']}_segment")
+            else:
+                pending[step["path"]] = step
+        
+        if pending:
+            logger.info(f"🎞️ Кодирую {len(pending)} из {len(plan)} сегментов")
+            await asyncio.gather(*(
+                media_pool.run(step["job"], *step["args"], cancel_marker, task_name=f"{step['kind']}_segment")
+                for step in pending.values()
+            ))
+        else:
+            logger.info(f"🎞️ Все {len(plan)} сегментов в кэше")
+        return [step["path"] for step in plan]
+
     async def cleanup_temp_files(self):
-        """Удаляет временные файлы"""
+        """Удаляет временные файлы и результаты склейки этого экземпляра (файлы других чатов не трогает)"""
         try:
-            for file in self.temp_dir.glob("*"):
-                file.unlink()
+            for file in self.created_files:
+                file.unlink(missing_ok=True)
+            self.created_files.clear()
             logger.info("✅ Временные файлы удалены")
         except Exception as e:
             logger.warning(f"⚠️ Ошибка при удалении временных файлов: {e}")
\ No newline at end of file
@@ -1,30 +1,34 @@
 """
 Логирование сессий в Airtable
 """
-import os
+import sys
 import json
 import logging
 from datetime import datetime
+from pathlib import Path
 from typing import Optional, Dict, Any
 from urllib.parse import quote
 import aiohttp
-from dotenv import load_dotenv
 
-load_dotenv()
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
 
-logger = logging.getLogger(__name__)
+from src.config import (
+    AIRTABLE_API_KEY, AIRTABLE_BASE_ID, AIRTABLE_TABLE_ID, AIRTABLE_VIDEO_TABLE_ID,
+    AIRTABLE_AI_PHOTO_TABLE_ID, AIRTABLE_ANIMATION_TABLE_ID, AIRTABLE_PHOTO_TABLE_ID
+)
+from src.metrics import instrument_stage
+from src.retry_policy import AIRTABLE
+from generators.http_utils import retrying_request
 
-AIRTABLE_API_KEY = os.getenv("AIRTABLE_API_KEY")
-AIRTABLE_BASE_ID = os.getenv("AIRTABLE_BASE_ID")
-AIRTABLE_TABLE_ID = os.getenv("AIRTABLE_TABLE_ID")
+logger = logging.getLogger(__name__)
 
 AIRTABLE_TABLE_IDS = {
-    "text": os.getenv("AIRTABLE_VIDEO_TABLE_ID", os.getenv("AIRTABLE_TABLE_ID")),
-    "text_photo": os.getenv("AIRTABLE_VIDEO_TABLE_ID", os.getenv("AIRTABLE_TABLE_ID")),
-    "text_photo_ai": os.getenv("AIRTABLE_AI_PHOTO_TABLE_ID"),
-    "animation": os.getenv("AIRTABLE_ANIMATION_TABLE_ID"),
-    "photo_edit": os.getenv("AIRTABLE_PHOTO_TABLE_ID"),
-    "photo": os.getenv("AIRTABLE_PHOTO_TABLE_ID"),
+    "text": AIRTABLE_VIDEO_TABLE_ID,
+    "text_photo": AIRTABLE_VIDEO_TABLE_ID,
+    "text_photo_ai": AIRTABLE_AI_PHOTO_TABLE_ID,
+    "animation": AIRTABLE_ANIMATION_TABLE_ID,
+    "photo_edit": AIRTABLE_PHOTO_TABLE_ID,
+    "photo": AIRTABLE_PHOTO_TABLE_ID,
 }
 
 def get_table_url(video_type: str) -> str:
@@ -60,6 +64,7 @@ class AirtableSessionLogger:
         if not self.enabled:
             logger.warning("⚠️ Airtable logging disabled: missing API key, Base ID, or Table ID")
     
+    @instrument_stage("airtable.log_session_start", when=lambda a: a["self"].enabled)
     async def log_session_start(
         self,
         user_id: int,
@@ -111,7 +116,7 @@ class AirtableSessionLogger:
                     ]
                 }
                 
-                async with session.post(table_url, json=data, headers=headers) as resp:
+                async with retrying_request(session, "POST", table_url, AIRTABLE, json=data, headers=headers) as resp:
                     response_text = await resp.text()
                     if resp.status in [200, 201]:
                         logger.info(f"✅ Session {session_id} logged to Airtable")
@@ -124,6 +129,7 @@ class AirtableSessionLogger:
             logger.error(f"❌ Error logging to Airtable: {e}")
             return False
     
+    @instrument_stage("airtable.update_session_parameters", when=lambda a: a["self"].enabled)
     async def update_session_parameters(
         self,
         session_id: str,
@@ -151,7 +157,7 @@ class AirtableSessionLogger:
                 filter_formula = f"{{Session ID}}='{session_id}'"
                 search_url = f"{table_url}?filterByFormula={quote(filter_formula)}"
                 
-                async with session.get(search_url, headers=headers) as resp:
+                async with retrying_request(session, "GET", search_url, AIRTABLE, headers=headers) as resp:
                     if resp.status != 200:
                         response_text = await resp.text()
                         logger.warning(f"⚠️ Search failed for session {session_id}: HTTP {resp.status}")
@@ -184,7 +190,7 @@ class AirtableSessionLogger:
                     update_data = {"fields": update_fields}
                     
                     update_url = f"{table_url}/{record_id}"
-                    async with session.patch(update_url, json=update_data, headers=headers) as update_resp:
+                    async with retrying_request(session, "PATCH", update_url, AIRTABLE, json=update_data, headers=headers) as update_resp:
                         if update_resp.status in [200, 201]:
                             logger.info(f"✅ Session {session_id} parameters updated in Airtable")
                             return True
@@ -195,6 +201,7 @@ class AirtableSessionLogger:
             logger.error(f"❌ Error updating parameters: {e}")
             return False
     
+    @instrument_stage("airtable.log_session_update", when=lambda a: a["self"].enabled)
     async def log_session_update(
         self,
         session_id: str,
@@ -217,7 +224,7 @@ class AirtableSessionLogger:
                 filter_formula = f"{{Session ID}}='{session_id}'"
                 search_url = f"{table_url}?filterByFormula={quote(filter_formula)}"
                 
-                async with session.get(search_url, headers=headers) as resp:
+                async with retrying_request(session, "GET", search_url, AIRTABLE, headers=headers) as resp:
                     if resp.status != 200:
                         response_text = await resp.text()
                         logger.warning(f"⚠️ Failed to find record for session {session_id}: HTTP {resp.status}")
@@ -241,7 +248,7 @@ class AirtableSessionLogger:
                     update_data = {"fields": mapped_fields}
                     
                     update_url = f"{table_url}/{record_id}"
-                    async with session.patch(update_url, json=update_data, headers=headers) as update_resp:
+                    async with retrying_request(session, "PATCH", update_url, AIRTABLE, json=update_data, headers=headers) as update_resp:
                         if update_resp.status in [200, 201]:
                             logger.info(f"✅ Session {session_id} updated in Airtable")
                             return True
@@ -254,6 +261,7 @@ class AirtableSessionLogger:
             logger.error(f"❌ Error updating session: {e}")
             return False
     
+    @instrument_stage("airtable.log_session_complete", when=lambda a: a["self"].enabled)
     async def log_session_complete(
         self,
         session_id: str,
@@ -279,7 +287,7 @@ class AirtableSessionLogger:
                 filter_formula = f"{{Session ID}}='{session_id}'"
                 search_url = f"{table_url}?filterByFormula={quote(filter_formula)}"
                 
-                async with session.get(search_url, headers=headers) as resp:
+                async with retrying_request(session, "GET", search_url, AIRTABLE, headers=headers) as resp:
                     if resp.status != 200:
                         response_text = await resp.text()
                         logger.warning(f"⚠️ Failed to find record for session {session_id}: HTTP {resp.status}")
@@ -315,7 +323,7 @@ class AirtableSessionLogger:
                     }
                     
                     update_url = f"{table_url}/{record_id}"
-                    async with session.patch(update_url, json=update_data, headers=headers) as update_resp:
+                    async with retrying_request(session, "PATCH", update_url, AIRTABLE, json=update_data, headers=headers) as update_resp:
                         update_response = await update_resp.text()
                         if update_resp.status in [200, 201]:
                             logger.info(f"✅ Session {session_id} updated in Airtable")
@@ -329,6 +337,7 @@ class AirtableSessionLogger:
             logger.error(f"❌ Error updating Airtable: {e}")
             return False
     
+    @instrument_stage("airtable.log_scene_artifacts", when=lambda a: a["self"].enabled)
     async def log_scene_artifacts(
         self,
         session_id: str,
@@ -352,7 +361,7 @@ class AirtableSessionLogger:
                 filter_formula = f"{{Session ID}}='{session_id}'"
                 search_url = f"{table_url}?filterByFormula={quote(filter_formula)}"
                 
-                async with session.get(search_url, headers=headers) as resp:
+                async with retrying_request(session, "GET", search_url, AIRTABLE, headers=headers) as resp:
                     if resp.status != 200:
                         response_text = await resp.text()
                         logger.warning(f"⚠️ Failed to find record for session {session_id}: HTTP {resp.status}")
@@ -378,7 +387,7 @@ class AirtableSessionLogger:
                     update_data = {"fields": update_fields}
                     
                     update_url = f"{table_url}/{record_id}"
-                    async with session.patch(update_url, json=update_data, headers=headers) as update_resp:
+                    async with retrying_request(session, "PATCH", update_url, AIRTABLE, json=update_data, headers=headers) as update_resp:
                         if update_resp.status in [200, 201]:
                             logger.info(f"✅ Scene artifacts logged for session {session_id}")
                             return True
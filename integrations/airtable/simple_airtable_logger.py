@@ -1,24 +1,27 @@
 """
 Логирование в простые Airtable таблицы (с полями Name и Notes)
 """
-import os
+import sys
 import logging
 from datetime import datetime
+from pathlib import Path
 from typing import Optional
 import aiohttp
-from dotenv import load_dotenv
 
-load_dotenv()
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
 
-logger = logging.getLogger(__name__)
+from src.config import (
+    AIRTABLE_API_KEY, AIRTABLE_BASE_ID,
+    AIRTABLE_ANIMATION_TABLE_ID, AIRTABLE_PHOTO_TABLE_ID, AIRTABLE_AI_PHOTO_TABLE_ID
+)
+from src.metrics import instrument_stage
 
-AIRTABLE_API_KEY = os.getenv("AIRTABLE_API_KEY")
-AIRTABLE_BASE_ID = os.getenv("AIRTABLE_BASE_ID")
+logger = logging.getLogger(__name__)
 
 SIMPLE_TABLE_IDS = {
-    "animation": os.getenv("AIRTABLE_ANIMATION_TABLE_ID"),
-    "photo": os.getenv("AIRTABLE_PHOTO_TABLE_ID"),
-    "photo_ai": os.getenv("AIRTABLE_AI_PHOTO_TABLE_ID"),
+    "animation": AIRTABLE_ANIMATION_TABLE_ID,
+    "photo": AIRTABLE_PHOTO_TABLE_ID,
+    "photo_ai": AIRTABLE_AI_PHOTO_TABLE_ID,
 }
 
 
@@ -38,6 +41,7 @@ class SimpleAirtableLogger:
         if not self.enabled:
             logger.warning("⚠️ Simple Airtable logging disabled: missing API key or Base ID")
     
+    @instrument_stage("airtable.log_record", when=lambda a: a["self"].enabled)
     async def log_record(
         self,
         table_type: str,
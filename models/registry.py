@@ -0,0 +1,207 @@
+"""
+Реестр моделей Replicate на основе models/parameters/*.json
+
+Схемы читаются один раз при старте, для каждой модели заранее собираются
+проверки полей (тип, enum, формат URI, обязательность). Payload собирается
+и проверяется локально - неверный запрос отклоняется до обращения к API,
+а не после ожидания в очереди Replicate.
+
+Чтобы добавить модель, достаточно положить JSON в models/parameters:
+    key        - короткое имя модели в боте (kling, veo, nano_banana)
+    model      - идентификатор на Replicate
+    category   - video или image
+    roles      - соответствие общих входов бота (start_image, end_image,
+                 reference_images) полям модели
+    failover   - эквивалентные модели для переключения при сбоях (key)
+    pricing    - цена (per_second, per_image)
+    properties - JSON Schema входа (или parameters в упрощенном формате)
+"""
+import json
+import logging
+import sys
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+logger = logging.getLogger(__name__)
+
+PARAMETERS_DIR = Path(__file__).parent / "parameters"
+
+_JSON_TYPES = {
+    "string": str,
+    "integer": int,
+    "number": (int, float),
+    "boolean": bool,
+    "array": list,
+    "object": dict,
+}
+
+
+class ModelValidationError(ValueError):
+    """Запрос не соответствует схеме модели"""
+
+
+def _is_uri(value: str) -> bool:
+    return value.startswith(("https://", "http://", "data:"))
+
+
+def _compile_field(name: str, spec: Dict) -> Callable[[Any], List[str]]:
+    """Собирает функцию проверки значения поля по его схеме"""
+    expected = _JSON_TYPES.get(spec.get("type"))
+    enum = spec.get("enum")
+    is_uri = spec.get("format") == "uri"
+    item_is_uri = spec.get("items", {}).get("format") == "uri"
+    nullable = spec.get("nullable", False)
+
+    def check(value: Any) -> List[str]:
+        if value is None:
+            return [] if nullable else [f"{name}: значение не может быть пустым"]
+        # bool - подкласс int, для integer/number его нужно исключить отдельно
+        if expected and (not isinstance(value, expected) or (expected is not bool and isinstance(value, bool))):
+            return [f"{name}: ожидается {spec.get('type')}, получено {type(value).__name__}"]
+        if enum is not None and value not in enum:
+            return [f"{name}: {value!r} не входит в {enum}"]
+        if is_uri and not _is_uri(value):
+            return [f"{name}: ожидается URL"]
+        if item_is_uri and any(not isinstance(item, str) or not _is_uri(item) for item in value):
+            return [f"{name}: все элементы должны быть URL"]
+        return []
+
+    return check
+
+
+class ModelSpec:
+    """Описание модели и собранный для нее построитель payload"""
+
+    def __init__(self, schema: Dict, source: str = ""):
+        self.source = source
+        self.key: str = schema.get("key") or Path(source).stem
+        self.model_id: str = schema["model"]
+        self.name: str = schema.get("model_name", self.model_id)
+        self.category: str = schema.get("category", "video")
+        self.pricing: Dict = schema.get("pricing", {})
+        self.roles: Dict[str, str] = schema.get("roles", {})
+        self.failover: List[str] = schema.get("failover", [])
+        # Самые дешевые значения полей для черновика (превью перед финалом)
+        self.draft_settings: Dict[str, Any] = schema.get("draft_settings", {})
+
+        if "properties" in schema:
+            self.fields: Dict[str, Dict] = schema["properties"]
+            self.required = set(schema.get("required", []))
+        else:
+            # Упрощенный формат: parameters с флагом required у поля
+            self.fields = schema.get("parameters", {})
+            self.required = {name for name, spec in self.fields.items() if spec.get("required")}
+
+        self.deprecated = {name for name, spec in self.fields.items() if spec.get("deprecated")}
+        self._checks = {name: _compile_field(name, spec) for name, spec in self.fields.items()}
+
+    def supports(self, field: str) -> bool:
+        """Есть ли у модели поле (или роль) с таким именем"""
+        return self.roles.get(field, field) in self.fields
+
+    def default(self, field: str) -> Any:
+        """Значение поля по умолчанию из схемы"""
+        return self.fields.get(self.roles.get(field, field), {}).get("default")
+
+    def cost(self, payload: Dict[str, Any]) -> float:
+        """Стоимость запроса по прайсу (для видео - за длительность из payload)"""
+        if "per_second" in self.pricing:
+            duration = payload.get(self.roles.get("duration", "duration")) or self.default("duration") or 0
+            return float(self.pricing["per_second"]) * float(duration)
+        return float(self.pricing.get("per_image", 0))
+
+    def draft_cost(self) -> float:
+        """Стоимость одного черновика по прайсу (для видео - за длительность черновика)"""
+        if "per_second" in self.pricing:
+            duration = self.draft_settings.get("duration") or self.default("duration") or 0
+            return float(self.pricing["per_second"]) * duration
+        return float(self.pricing.get("per_image", 0))
+
+    def build(self, params: Dict[str, Any], drop_unsupported: bool = True) -> Dict[str, Any]:
+        """
+        Собирает и проверяет payload
+
+        Args:
+            params: Параметры запроса; общие входы (start_image...) переводятся
+                в поля модели по roles, None пропускаются
+            drop_unsupported: Молча отбрасывать поля, которых у модели нет
+                (например resolution для Kling); иначе это ошибка
+
+        Returns:
+            Payload для replicate.run
+
+        Raises:
+            ModelValidationError: Запрос не пройдет проверку Replicate
+        """
+        payload: Dict[str, Any] = {}
+        errors: List[str] = []
+
+        for name, value in params.items():
+            if value is None:
+                continue
+            field = self.roles.get(name, name)
+            if field not in self.fields:
+                if not drop_unsupported:
+                    errors.append(f"{name}: модель {self.key} не поддерживает это поле")
+                continue
+            if field in self.deprecated:
+                errors.append(f"{field}: поле устарело, используйте роль из roles")
+                continue
+            errors.extend(self._checks[field](value))
+            payload[field] = value
+
+        for field in self.required:
+            if payload.get(field) in (None, ""):
+                errors.append(f"{field}: обязательное поле")
+
+        if errors:
+            raise ModelValidationError(f"{self.key}: " + "; ".join(errors))
+        return payload
+
+
+class ModelRegistry:
+    """Все модели из models/parameters (загружаются один раз)"""
+
+    def __init__(self, parameters_dir: Path = PARAMETERS_DIR):
+        self.parameters_dir = parameters_dir
+        self._specs: Optional[Dict[str, ModelSpec]] = None
+
+    def load(self) -> Dict[str, ModelSpec]:
+        """Читает и компилирует схемы (повторные вызовы ничего не делают)"""
+        if self._specs is None:
+            specs = {}
+            for path in sorted(self.parameters_dir.glob("*.json")):
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        spec = ModelSpec(json.load(f), source=path.name)
+                except Exception as e:
+                    logger.warning(f"⚠️ Схема модели {path.name} пропущена: {e}")
+                    continue
+                specs[spec.key] = spec
+            self._specs = specs
+            logger.info(f"📚 Реестр моделей: {', '.join(specs) or 'пусто'}")
+        return self._specs
+
+    def get(self, key_or_id: str) -> Optional[ModelSpec]:
+        """Модель по короткому имени или идентификатору Replicate"""
+        specs = self.load()
+        if key_or_id in specs:
+            return specs[key_or_id]
+        for spec in specs.values():
+            if spec.model_id == key_or_id:
+                return spec
+        return None
+
+    def by_category(self, category: str) -> Dict[str, ModelSpec]:
+        """Модели категории (video, image)"""
+        return {key: spec for key, spec in self.load().items() if spec.category == category}
+
+    def cheapest_draft(self, category: str = "video") -> Optional[ModelSpec]:
+        """Модель категории с самым дешевым черновиком"""
+        return min(self.by_category(category).values(), key=lambda spec: spec.draft_cost(), default=None)
+
+
+# Глобальный экземпляр
+model_registry = ModelRegistry()
@@ -0,0 +1,152 @@
+"""
+Граф сборки видео сессии для инкрементальной пересборки
+
+    сцена (аргументы generate_scene) -> клип -> нормализованный сегмент -> итоговое видео
+
+Каждый узел адресуется хэшем содержимого: сцена - хэшем аргументов генерации,
+клип - хэшем файла, сегменты - хэшами клипов и параметров кодирования (см.
+src.segment_cache), итог - хэшем списка клипов и профиля. После доставки видео
+граф остается на диске: правка одной сцены перегенерирует только ее клип,
+перекодирует только ее сегмент и соседние переходы, остальное склеивается
+копированием.
+"""
+import hashlib
+import json
+import logging
+import shutil
+import sys
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.config import BUILDS_DIR, BUILD_TTL, BUILD_MAX_SESSIONS
+
+logger = logging.getLogger(__name__)
+
+# Не влияют на результат генерации
+_KEY_IGNORED = {"scene_number"}
+
+
+def file_hash(path: str) -> str:
+    """SHA-256 содержимого файла"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class SessionBuild:
+    """Узлы сборки одного видео: сцены, их клипы и итог"""
+
+    def __init__(self, chat_id: int, root: Path, model: str, aspect_ratio: str):
+        self.chat_id = chat_id
+        self.model = model
+        self.aspect_ratio = aspect_ratio
+        self.dir = root / str(chat_id)
+        self.clips_dir = self.dir / "clips"
+        self.clips_dir.mkdir(parents=True, exist_ok=True)
+        # Аргументы generate_scene по порядку сцен
+        self.scenes: List[Dict] = []
+        # Ключ сцены -> {"path", "url", "hash"}
+        self.clips: Dict[str, Dict] = {}
+        self.final: Optional[Dict] = None
+        self.updated_at = time.time()
+
+    @staticmethod
+    def scene_key(params: Dict) -> str:
+        """Хэш аргументов генерации сцены"""
+        payload = {name: value for name, value in params.items() if name not in _KEY_IGNORED}
+        raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+    def clip_for(self, params: Dict) -> Optional[Dict]:
+        """Готовый клип сцены (None - сцену нужно генерировать)"""
+        clip = self.clips.get(self.scene_key(params))
+        if clip and Path(clip["path"]).exists():
+            return clip
+        return None
+
+    def stale(self, scenes: List[Dict]) -> List[int]:
+        """Индексы сцен без готового клипа"""
+        return [i for i, params in enumerate(scenes) if self.clip_for(params) is None]
+
+    def adopt_clip(self, params: Dict, path: str, url: Optional[str] = None) -> Dict:
+        """Переносит скачанный клип сцены в папку сборки"""
+        key = self.scene_key(params)
+        target = self.clips_dir / f"{key}.mp4"
+        shutil.move(path, target)
+        clip = {"path": str(target), "url": url, "hash": file_hash(str(target))}
+        self.clips[key] = clip
+        self.updated_at = time.time()
+        return clip
+
+    def adopt_final(self, key: str, path: str) -> Dict:
+        """Переносит итоговое видео в папку сборки (output_videos - общая для всех чатов)"""
+        target = self.dir / f"final_{key}.mp4"
+        if Path(path) != target:
+            shutil.move(path, target)
+        for old in self.dir.glob("final_*.mp4"):
+            if old != target:
+                old.unlink(missing_ok=True)
+        self.final = {"key": key, "path": str(target)}
+        self.updated_at = time.time()
+        return self.final
+
+    def clip_paths(self, scenes: List[Dict]) -> List[str]:
+        return [self.clip_for(params)["path"] for params in scenes]
+
+    def final_key(self, scenes: List[Dict], profile: str) -> str:
+        """Хэш итогового видео: клипы по порядку, формат и профиль"""
+        parts = [self.clip_for(params)["hash"] for params in scenes] + [self.aspect_ratio, profile]
+        return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()[:32]
+
+    def prune(self, scenes: List[Dict]):
+        """Удаляет клипы сцен, которых больше нет в сборке"""
+        keep = {self.scene_key(params) for params in scenes}
+        for key in [key for key in self.clips if key not in keep]:
+            Path(self.clips.pop(key)["path"]).unlink(missing_ok=True)
+
+
+class BuildRegistry:
+    """Последняя сборка каждого чата (на диске в BUILDS_DIR, вытесняются по сроку и числу)"""
+
+    def __init__(self, root: str = BUILDS_DIR, ttl: float = BUILD_TTL, max_sessions: int = BUILD_MAX_SESSIONS):
+        self.root = Path(root)
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._builds: "OrderedDict[int, SessionBuild]" = OrderedDict()
+
+    def _drop(self, chat_id: int):
+        build = self._builds.pop(chat_id, None)
+        if build is not None:
+            shutil.rmtree(build.dir, ignore_errors=True)
+
+    def _evict(self):
+        cutoff = time.time() - self.ttl
+        for chat_id in [chat_id for chat_id, build in self._builds.items() if build.updated_at < cutoff]:
+            self._drop(chat_id)
+        while len(self._builds) > self.max_sessions:
+            self._drop(next(iter(self._builds)))
+
+    def start(self, chat_id: int, model: str, aspect_ratio: str) -> SessionBuild:
+        """Новая сборка чата (предыдущая удаляется)"""
+        self._drop(chat_id)
+        build = SessionBuild(chat_id, self.root, model, aspect_ratio)
+        self._builds[chat_id] = build
+        self._evict()
+        return build
+
+    def get(self, chat_id: int) -> Optional[SessionBuild]:
+        self._evict()
+        build = self._builds.get(chat_id)
+        if build is not None:
+            self._builds.move_to_end(chat_id)
+        return build
+
+
+# Глобальный экземпляр
+session_builds = BuildRegistry()
@@ -0,0 +1,179 @@
+"""
+Реестр клиентов внешних API
+
+Клиенты Replicate, Groq и Gemini, общая keep-alive HTTP сессия и генераторы
+создаются один раз на процесс и переиспользуются всеми хэндлерами. При старте
+бота warm_up() заранее устанавливает TLS соединения, чтобы первый запрос
+пользователя не платил за рукопожатия.
+
+Хэндлеры и их вспомогательные функции импортируют глобальный экземпляр
+clients (генерации запускаются и вне хэндлеров - из фоновых задач).
+"""
+import asyncio
+import logging
+import sys
+from pathlib import Path
+from typing import Dict
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.config import REPLICATE_API_TOKEN, GROK_API_KEY, GEMINI_API_KEY, ROUTER_PROVIDERS
+
+logger = logging.getLogger(__name__)
+
+GROQ_BASE_URL = "https://api.groq.com/openai/v1"
+
+# Таймаут одного прогревочного запроса
+WARM_UP_TIMEOUT = 10
+
+
+class ClientRegistry:
+    """Общие клиенты и генераторы (создаются лениво, один раз на процесс)"""
+
+    def __init__(self):
+        self._replicate = None
+        self._groq = None
+        self._gemini_configured = False
+        self._gemini_models: Dict[str, object] = {}
+        self._http_session = None
+        self._model_router = None
+        self._video_generator = None
+        self._photo_generator = None
+        self._image_uploader = None
+
+    @property
+    def replicate(self):
+        """Клиент Replicate (общий пул соединений httpx)"""
+        if self._replicate is None:
+            from replicate import Client
+            self._replicate = Client(api_token=REPLICATE_API_TOKEN)
+        return self._replicate
+
+    @property
+    def groq(self):
+        """AsyncOpenAI клиент для Groq"""
+        if self._groq is None:
+            from openai import AsyncOpenAI
+            self._groq = AsyncOpenAI(api_key=GROK_API_KEY, base_url=GROQ_BASE_URL)
+        return self._groq
+
+    def gemini_model(self, model_name: str):
+        """Модель Gemini (genai.configure вызывается один раз)"""
+        if model_name not in self._gemini_models:
+            import google.generativeai as genai
+            if not self._gemini_configured:
+                genai.configure(api_key=GEMINI_API_KEY)
+                self._gemini_configured = True
+            self._gemini_models[model_name] = genai.GenerativeModel(model_name)
+        return self._gemini_models[model_name]
+
+    @property
+    def http_session(self):
+        """Общая aiohttp сессия (создается в warm_up, внутри event loop)"""
+        return self._http_session
+
+    async def _ensure_http_session(self):
+        """Создает общую keep-alive сессию"""
+        if self._http_session is None or self._http_session.closed:
+            import aiohttp
+            connector = aiohttp.TCPConnector(limit=100, ttl_dns_cache=300, keepalive_timeout=60)
+            self._http_session = aiohttp.ClientSession(connector=connector)
+        return self._http_session
+
+    @property
+    def model_router(self):
+        """Общий роутер моделей (статистика бэкендов одна на процесс)"""
+        if self._model_router is None:
+            from generators.model_router import ModelRouter, ReplicateProvider, FakeProvider
+            providers = []
+            for name in ROUTER_PROVIDERS:
+                if name == "replicate":
+                    providers.append(ReplicateProvider(self.replicate))
+                elif name == "fake":
+                    providers.append(FakeProvider())
+                else:
+                    logger.warning(f"⚠️ Неизвестный провайдер моделей: {name}")
+            self._model_router = ModelRouter(providers)
+        return self._model_router
+
+    @property
+    def video_generator(self):
+        """Общий VideoGenerator"""
+        if self._video_generator is None:
+            from generators.video_generator import VideoGenerator
+            self._video_generator = VideoGenerator(replicate_client=self.replicate, router=self.model_router)
+        return self._video_generator
+
+    @property
+    def photo_generator(self):
+        """Общий PhotoGenerator"""
+        if self._photo_generator is None:
+            from generators.photo_generator import PhotoGenerator
+            self._photo_generator = PhotoGenerator(
+                replicate_client=self.replicate,
+                http_session=self._http_session,
+                router=self.model_router
+            )
+        return self._photo_generator
+
+    @property
+    def image_uploader(self):
+        """Общий ImageUploader"""
+        if self._image_uploader is None:
+            from generators.image_utils import ImageUploader
+            self._image_uploader = ImageUploader(replicate_client=self.replicate, http_session=self._http_session)
+        return self._image_uploader
+
+    async def _warm(self, name: str, coro) -> bool:
+        """Выполняет прогревочный запрос с таймаутом"""
+        try:
+            await asyncio.wait_for(coro, timeout=WARM_UP_TIMEOUT)
+            logger.info(f"🔥 {name}: соединение прогрето")
+            return True
+        except Exception as e:
+            logger.warning(f"⚠️ {name}: прогрев не удался ({type(e).__name__}: {e})")
+            return False
+
+    async def warm_up(self):
+        """Создает клиенты и заранее открывает соединения к API"""
+        await self._ensure_http_session()
+
+        # Генераторы создаются здесь, чтобы получить уже готовую общую сессию
+        for name in ("video_generator", "photo_generator", "image_uploader"):
+            try:
+                getattr(self, name)
+            except Exception as e:
+                logger.warning(f"⚠️ {name} не создан при старте: {e}")
+
+        tasks = []
+        if REPLICATE_API_TOKEN:
+            # Синхронный клиент Replicate используется в потоках - греем его пул там же
+            tasks.append(self._warm(
+                "Replicate",
+                asyncio.to_thread(self.replicate.models.get, "google/nano-banana")
+            ))
+        if GROK_API_KEY:
+            tasks.append(self._warm("Groq", self.groq.models.list()))
+        if GEMINI_API_KEY:
+            tasks.append(self._warm(
+                "Gemini",
+                self.gemini_model("gemini-2.0-flash").count_tokens_async("ping")
+            ))
+
+        if tasks:
+            await asyncio.gather(*tasks)
+        logger.info("✅ Реестр клиентов готов")
+
+    async def close(self):
+        """Закрывает соединения при остановке бота"""
+        if self._http_session is not None and not self._http_session.closed:
+            await self._http_session.close()
+        if self._groq is not None:
+            try:
+                await self._groq.close()
+            except Exception as e:
+                logger.warning(f"⚠️ Не удалось закрыть клиент Groq: {e}")
+
+
+# Глобальный экземпляр
+clients = ClientRegistry()
@@ -1,5 +1,10 @@
-"""Конфигурация бота"""
+"""Конфигурация бота
+
+Единственное место, где читается .env - остальные модули импортируют значения отсюда.
+"""
 import os
+from pathlib import Path
+
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -10,4 +15,125 @@ GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 GROK_API_KEY = os.getenv("GROK_API_KEY")
 REPLICATE_API_TOKEN = os.getenv("REPLICATE_API_TOKEN")
 ELEVENLABS_API_KEY = os.getenv("ELEVENLABS_API_KEY")
-IMGBB_API_KEY = os.getenv("IMGBB_API_KEY")
\ No newline at end of file
+IMGBB_API_KEY = os.getenv("IMGBB_API_KEY")
+
+# Airtable (логирование сессий)
+AIRTABLE_API_KEY = os.getenv("AIRTABLE_API_KEY")
+AIRTABLE_BASE_ID = os.getenv("AIRTABLE_BASE_ID")
+AIRTABLE_TABLE_ID = os.getenv("AIRTABLE_TABLE_ID")
+AIRTABLE_VIDEO_TABLE_ID = os.getenv("AIRTABLE_VIDEO_TABLE_ID", AIRTABLE_TABLE_ID)
+AIRTABLE_AI_PHOTO_TABLE_ID = os.getenv("AIRTABLE_AI_PHOTO_TABLE_ID")
+AIRTABLE_ANIMATION_TABLE_ID = os.getenv("AIRTABLE_ANIMATION_TABLE_ID")
+AIRTABLE_PHOTO_TABLE_ID = os.getenv("AIRTABLE_PHOTO_TABLE_ID")
+
+# Пул процессов для CPU-тяжёлой обработки медиа (кодирование, декодирование фото)
+MEDIA_POOL_WORKERS = int(os.getenv("MEDIA_POOL_WORKERS", "0")) or max(1, min(4, (os.cpu_count() or 2) - 1))
+MEDIA_POOL_QUEUE_SIZE = int(os.getenv("MEDIA_POOL_QUEUE_SIZE", "8"))
+
+# Профиль кодирования итогового видео (preview, draft, final, premium)
+VIDEO_ENCODER_PROFILE = os.getenv("VIDEO_ENCODER_PROFILE", "final")
+
+# Приватный канал-хранилище: медиа сначала публикуются туда, дальше рассылаются по file_id
+MEDIA_STORAGE_CHAT_ID = os.getenv("MEDIA_STORAGE_CHAT_ID")
+
+# LLM шлюз (Groq, Gemini): таймаут запроса, число попыток, лимиты и задержка hedge-запроса
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))
+LLM_MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", "3"))
+GROQ_MAX_CONCURRENCY = int(os.getenv("GROQ_MAX_CONCURRENCY", "8"))
+GROQ_HEDGE_DELAY = float(os.getenv("GROQ_HEDGE_DELAY", "6"))
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "4"))
+GEMINI_HEDGE_DELAY = float(os.getenv("GEMINI_HEDGE_DELAY", "8"))
+
+# Мониторинг event loop: период пробника (с) и порог блокировки (мс)
+LOOP_MONITOR_INTERVAL = float(os.getenv("LOOP_MONITOR_INTERVAL", "0.1"))
+LOOP_LAG_THRESHOLD_MS = float(os.getenv("LOOP_LAG_THRESHOLD_MS", "250"))
+
+# Локальный HTTP эндпоинт метрик (/metrics, /debug/loop); 0 - выключен
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))
+
+# Логирование: уровень, формат (json или text) и доли сэмплирования частых событий
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "replicate.payload=0.05,replicate.output=0.2")
+
+# Журнал стоимости и времени генераций (SQLite)
+LEDGER_DB_PATH = os.getenv("LEDGER_DB_PATH", str(Path(__file__).parent.parent / "data" / "ledger.sqlite3"))
+
+# Маршрутизация моделей: провайдеры (replicate, fake), окно статистики, выключение
+# бэкенда по доле ошибок, допуск длительности при переключении на эквивалентную
+# модель (соотношение сторон должно совпадать), разрешение переключаться на более
+# дорогую модель, hedging дешевых задач и общий лимит одновременных вызовов провайдеров
+ROUTER_PROVIDERS = [p.strip() for p in os.getenv("ROUTER_PROVIDERS", "replicate").split(",") if p.strip()]
+ROUTER_STATS_WINDOW = int(os.getenv("ROUTER_STATS_WINDOW", "50"))
+ROUTER_BREAKER_ERROR_RATE = float(os.getenv("ROUTER_BREAKER_ERROR_RATE", "0.5"))
+ROUTER_BREAKER_COOLDOWN = float(os.getenv("ROUTER_BREAKER_COOLDOWN", "120"))
+ROUTER_FAILOVER_DURATION_TOLERANCE = float(os.getenv("ROUTER_FAILOVER_DURATION_TOLERANCE", "1"))
+ROUTER_FAILOVER_ALLOW_PRICIER = os.getenv("ROUTER_FAILOVER_ALLOW_PRICIER", "false").lower() in ("1", "true", "yes")
+ROUTER_HEDGE_MAX_COST = float(os.getenv("ROUTER_HEDGE_MAX_COST", "0.1"))
+ROUTER_HEDGE_MIN_DELAY = float(os.getenv("ROUTER_HEDGE_MIN_DELAY", "10"))
+ROUTER_HEDGE_MIN_SAMPLES = int(os.getenv("ROUTER_HEDGE_MIN_SAMPLES", "10"))
+ROUTER_MAX_CONCURRENCY = int(os.getenv("ROUTER_MAX_CONCURRENCY", "16"))
+
+# Повторы внешних вызовов: бюджет (доля повторов от запросов за окно, минимум
+# повторов в окне) и общий срок генерации фото и видео со всеми повторами (с)
+RETRY_BUDGET_RATIO = float(os.getenv("RETRY_BUDGET_RATIO", "0.2"))
+RETRY_BUDGET_MIN_RETRIES = int(os.getenv("RETRY_BUDGET_MIN_RETRIES", "5"))
+RETRY_BUDGET_WINDOW = float(os.getenv("RETRY_BUDGET_WINDOW", "60"))
+PHOTO_RETRY_DEADLINE = float(os.getenv("PHOTO_RETRY_DEADLINE", "300"))
+VIDEO_RETRY_DEADLINE = float(os.getenv("VIDEO_RETRY_DEADLINE", "1200"))
+
+# Отмена генераций: рабочие папки задач (маркер отмены для пула процессов),
+# сколько ждать остановки задачи после отмены и период опроса предсказаний Replicate
+JOBS_DIR = os.getenv("JOBS_DIR", str(Path(__file__).parent.parent / "temp_jobs"))
+JOB_CANCEL_GRACE = float(os.getenv("JOB_CANCEL_GRACE", "10"))
+REPLICATE_POLL_INTERVAL = float(os.getenv("REPLICATE_POLL_INTERVAL", "1"))
+
+# Альбомы (media group): Telegram присылает фото альбома отдельными сообщениями,
+# альбом считается собранным, если новых фото нет MEDIA_GROUP_WAIT секунд;
+# одновременные загрузки фото альбома на хостинг
+MEDIA_GROUP_WAIT = float(os.getenv("MEDIA_GROUP_WAIT", "1.0"))
+ALBUM_UPLOAD_CONCURRENCY = int(os.getenv("ALBUM_UPLOAD_CONCURRENCY", "5"))
+
+# Смена формата фото (photo_handler format_*): локально в пуле процессов.
+# auto - обрезка по карте энергии, если остается не меньше REFRAME_MIN_KEEP площади,
+# иначе фото на размытом фоне; crop / pad - всегда один способ; ai - дорисовка моделью
+REFRAME_MODE = os.getenv("REFRAME_MODE", "auto")
+REFRAME_MIN_KEEP = float(os.getenv("REFRAME_MIN_KEEP", "0.6"))
+
+# Промежуточные кадры между фото (PhotoGenerator.generate_intermediate_frames):
+# flow - оптический поток, dissolve - кросс-фейд (оба локально), ai - через модель
+INTERPOLATION_METHOD = os.getenv("INTERPOLATION_METHOD", "flow")
+
+# Варианты генерации: сколько фото сцены генерировать параллельно при «Переделать»
+# и сколько вариантов разбивки на сцены; кэш невыбранных вариантов (срок жизни
+# в секундах - ссылки Replicate живут около часа, и число ключей)
+PHOTO_VARIANTS = int(os.getenv("PHOTO_VARIANTS", "3"))
+SCENE_PLAN_VARIANTS = int(os.getenv("SCENE_PLAN_VARIANTS", "3"))
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", "3000"))
+RESULT_CACHE_MAX_KEYS = int(os.getenv("RESULT_CACHE_MAX_KEYS", "500"))
+
+# Черновики видео: превью всех сцен с draft_settings модели (низкое разрешение,
+# короткая длительность, без звука), финал - только для одобренных сцен с тем же
+# промтом и seed. VIDEO_DRAFT_MODEL: пусто - та же модель, что и финал (seed
+# сохраняет сходство), cheapest - самый дешевый черновик в реестре, либо ключ модели
+VIDEO_DRAFT_MODEL = os.getenv("VIDEO_DRAFT_MODEL", "")
+
+# Спекулятивная генерация: видео сцены запускается в фоне сразу после одобрения
+# (или если сцену не меняют SPECULATIVE_IDLE_DELAY секунд, 0 - только по одобрению)
+# и отменяется при правке; SPECULATIVE_BUDGET_USD - предел фоновых трат на чат (0 - выключено)
+SPECULATIVE_BUDGET_USD = float(os.getenv("SPECULATIVE_BUDGET_USD", "2.0"))
+SPECULATIVE_IDLE_DELAY = float(os.getenv("SPECULATIVE_IDLE_DELAY", "20"))
+
+# Инкрементальная пересборка (src.build_graph): клипы и сегменты доставленного
+# видео хранятся BUILD_TTL секунд (не больше BUILD_MAX_SESSIONS сессий), правка
+# сцены перегенерирует и перекодирует только ее
+BUILDS_DIR = os.getenv("BUILDS_DIR", str(Path(__file__).parent.parent / "temp_builds"))
+BUILD_TTL = float(os.getenv("BUILD_TTL", "86400"))
+BUILD_MAX_SESSIONS = int(os.getenv("BUILD_MAX_SESSIONS", "200"))
+
+# Кэш сегментов склейки: клипы сцен, нормализованные под профиль кодирования,
+# и сегменты переходов между соседними клипами; итог собирается копированием
+# потоков. Старые сегменты вытесняются, когда кэш больше SEGMENT_CACHE_MAX_MB
+SEGMENT_CACHE_DIR = os.getenv("SEGMENT_CACHE_DIR", str(Path(__file__).parent.parent / "temp_segments"))
+SEGMENT_CACHE_MAX_MB = int(os.getenv("SEGMENT_CACHE_MAX_MB", "2048"))
@@ -0,0 +1,339 @@
+"""
+Доставка готовых фото и видео в Telegram
+
+Сначала пользователь получает быстрое превью (ultrafast, 480p), которое
+кодируется параллельно с финальной версией, затем - видео в полном качестве.
+Отправленные фото и видео запоминаются в реестре медиа, повторная отправка
+идет по file_id без загрузки. Если задан MEDIA_STORAGE_CHAT_ID, медиа
+сначала публикуются в приватный канал-хранилище. Наборы фото уходят
+альбомами - один вызов sendMediaGroup на 10 фото.
+"""
+import asyncio
+import logging
+import sys
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from aiogram import types
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+
+from src.config import MEDIA_STORAGE_CHAT_ID
+from src.media_registry import media_registry
+from src.ledger import ledger
+
+logger = logging.getLogger(__name__)
+
+
+# Ограничения Telegram: фото в одном sendMediaGroup и длина подписи
+ALBUM_MAX_ITEMS = 10
+CAPTION_MAX_LENGTH = 1024
+
+
+def _album_caption(caption: Optional[str]) -> Optional[str]:
+    """Обрезает подпись до лимита Telegram"""
+    if caption and len(caption) > CAPTION_MAX_LENGTH:
+        return caption[:CAPTION_MAX_LENGTH - 1] + "…"
+    return caption
+
+
+def _is_url_fetch_error(error: TelegramBadRequest) -> bool:
+    """Telegram не смог скачать фото по URL (тогда имеет смысл загрузить файл)"""
+    text = str(error).lower()
+    return "http url" in text or "url content" in text
+
+
+def _extract_file_id(sent: types.Message) -> Optional[str]:
+    """Достает file_id из отправленного сообщения"""
+    if sent.photo:
+        return sent.photo[-1].file_id
+    media = sent.video or sent.animation or sent.document
+    return media.file_id if media else None
+
+
+class MediaDelivery:
+    """Доставка фото и видео с кешем file_id и превью-сначала для видео"""
+
+    PREVIEW_CAPTION = "👀 Превью в пониженном качестве\n⏳ Финальная версия уже кодируется..."
+
+    def __init__(self):
+        # Фоновое удаление превью прерванных доставок (ссылки держим до завершения)
+        self._discards = set()
+
+    @staticmethod
+    async def _discard_preview(preview_task: asyncio.Task, preview_marker: Path, preview_file: Path):
+        """Удаляет маркер и файл превью, когда его кодирование точно остановилось"""
+        await asyncio.gather(preview_task, return_exceptions=True)
+        preview_marker.unlink(missing_ok=True)
+        preview_file.unlink(missing_ok=True)
+
+    async def _artifact_keys(self, path: Optional[str], url: Optional[str]) -> List[str]:
+        """Ключи артефакта для реестра медиа"""
+        keys = []
+        if url:
+            keys.append(media_registry.url_key(url))
+        if path and Path(path).exists():
+            keys.append(await media_registry.file_key(path))
+        return keys
+
+    async def _upload_to_storage(self, bot, kind: str, source) -> Optional[str]:
+        """Публикует медиа в канал-хранилище и возвращает file_id"""
+        try:
+            if kind == "video":
+                stored = await bot.send_video(MEDIA_STORAGE_CHAT_ID, source, disable_notification=True)
+            else:
+                stored = await bot.send_photo(MEDIA_STORAGE_CHAT_ID, source, disable_notification=True)
+            return _extract_file_id(stored)
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось сохранить медиа в канал-хранилище: {e}")
+            return None
+
+    async def _send_media(
+        self,
+        message: types.Message,
+        kind: str,
+        path: Optional[str] = None,
+        url: Optional[str] = None,
+        caption: Optional[str] = None,
+        **kwargs
+    ) -> Optional[types.Message]:
+        """
+        Отправляет фото/видео: по file_id из реестра, иначе через канал-хранилище
+        или прямой загрузкой, после чего запоминает file_id
+        """
+        send = message.answer_video if kind == "video" else message.answer_photo
+        keys = await self._artifact_keys(path, url)
+
+        file_id = media_registry.find_file_id(keys)
+        if file_id:
+            try:
+                logger.info(f"♻️ Отправляю {kind} по file_id")
+                sent = await send(file_id, caption=caption, **kwargs)
+                ledger.record_cache_hit(f"telegram_{kind}")
+                return sent
+            except Exception as e:
+                logger.warning(f"⚠️ file_id больше не действителен, загружаю заново: {e}")
+
+        # Локальный файл надежнее URL: Telegram не нужно ничего скачивать
+        source = types.FSInputFile(path) if path and Path(path).exists() else url
+
+        if MEDIA_STORAGE_CHAT_ID:
+            file_id = await self._upload_to_storage(message.bot, kind, source)
+            if file_id:
+                if keys:
+                    await media_registry.remember(keys, file_id, kind)
+                return await send(file_id, caption=caption, **kwargs)
+
+        sent = await send(source, caption=caption, **kwargs)
+        sent_file_id = _extract_file_id(sent)
+        if sent_file_id and keys:
+            await media_registry.remember(keys, sent_file_id, kind)
+        return sent
+
+    async def send_video(
+        self,
+        message: types.Message,
+        video_path: Optional[str] = None,
+        caption: Optional[str] = None,
+        video_url: Optional[str] = None,
+        **kwargs
+    ) -> Optional[types.Message]:
+        """
+        Отправляет видео, используя file_id если файл уже отправлялся
+
+        Args:
+            message: Сообщение, в чат которого отправляем
+            video_path: Путь к локальному файлу
+            caption: Подпись
+            video_url: URL видео (например, черновик сцены с Replicate)
+        """
+        return await self._send_media(message, "video", path=video_path, url=video_url, caption=caption, **kwargs)
+
+    async def send_photo(
+        self,
+        message: types.Message,
+        photo_url: Optional[str] = None,
+        photo_path: Optional[str] = None,
+        caption: Optional[str] = None,
+        **kwargs
+    ) -> Optional[types.Message]:
+        """
+        Отправляет фото, используя file_id если фото уже отправлялось
+
+        Args:
+            message: Сообщение, в чат которого отправляем
+            photo_url: URL фото (например, результат Replicate)
+            photo_path: Локальная копия фото
+            caption: Подпись
+        """
+        return await self._send_media(message, "photo", path=photo_path, url=photo_url, caption=caption, **kwargs)
+
+    async def send_photo_album(self, message: types.Message, items: List[Dict]) -> List[types.Message]:
+        """
+        Отправляет фото альбомами (sendMediaGroup, до 10 фото в вызове)
+
+        Источник каждого фото: file_id из реестра, иначе уже размещенный URL,
+        иначе локальный файл. Если Telegram не смог скачать URL (ссылки Replicate
+        живут ограниченное время), альбом повторяется с локальными файлами.
+
+        Args:
+            message: Сообщение, в чат которого отправляем
+            items: [{"photo_url", "photo_path", "caption"}] в порядке показа
+
+        Returns:
+            Отправленные сообщения в том же порядке
+        """
+        sent_messages: List[types.Message] = []
+        for start in range(0, len(items), ALBUM_MAX_ITEMS):
+            chunk = items[start:start + ALBUM_MAX_ITEMS]
+            if len(chunk) == 1:
+                # Альбом из одного фото Telegram не принимает
+                item = chunk[0]
+                sent = await self.send_photo(
+                    message, photo_url=item.get("photo_url"), photo_path=item.get("photo_path"),
+                    caption=_album_caption(item.get("caption"))
+                )
+                sent_messages.extend([sent] if sent else [])
+                continue
+
+            keys = [await self._artifact_keys(item.get("photo_path"), item.get("photo_url")) for item in chunk]
+            cached = [media_registry.find_file_id(item_keys) for item_keys in keys]
+            sent = None
+            prefer_local = False
+            while sent is None:
+                try:
+                    sent = await message.answer_media_group(self._album_media(chunk, cached, prefer_local=prefer_local))
+                except TelegramRetryAfter as e:
+                    # Flood control: ждем и повторяем тот же запрос, а не шлем второй пакет
+                    logger.warning(f"⏳ Альбом уперся в лимит Telegram, жду {e.retry_after} с")
+                    await asyncio.sleep(e.retry_after)
+                except TelegramBadRequest as e:
+                    if prefer_local or not _is_url_fetch_error(e):
+                        raise
+                    logger.warning(f"⚠️ Альбом по URL не отправлен, загружаю файлы: {e}")
+                    cached = [None] * len(chunk)
+                    prefer_local = True
+
+            hits = sum(1 for file_id in cached if file_id)
+            for _ in range(hits):
+                ledger.record_cache_hit("telegram_photo")
+            for item_keys, file_id, sent_message in zip(keys, cached, sent):
+                new_file_id = _extract_file_id(sent_message)
+                if new_file_id and item_keys and not file_id:
+                    await media_registry.remember(item_keys, new_file_id, "photo")
+            sent_messages.extend(sent)
+            logger.info(f"🖼️ Альбом: {len(chunk)} фото одним запросом (из кэша file_id: {hits})")
+        return sent_messages
+
+    @staticmethod
+    def _album_media(chunk: List[Dict], cached: List[Optional[str]], prefer_local: bool) -> List[types.InputMediaPhoto]:
+        """Элементы альбома: file_id, URL или локальный файл"""
+        media = []
+        for item, file_id in zip(chunk, cached):
+            path, url = item.get("photo_path"), item.get("photo_url")
+            has_file = bool(path) and Path(path).exists()
+            if file_id:
+                source = file_id
+            elif url and not (prefer_local and has_file):
+                source = url
+            else:
+                source = types.FSInputFile(path)
+            media.append(types.InputMediaPhoto(media=source, caption=_album_caption(item.get("caption"))))
+        return media
+
+    async def stitch_and_deliver(
+        self,
+        message: types.Message,
+        stitcher,
+        video_paths: List[str],
+        caption: str,
+        output_filename: str,
+        aspect_ratio: Optional[str] = None,
+        status_message: Optional[types.Message] = None
+    ) -> Optional[str]:
+        """
+        Склеивает видео и отправляет сначала превью, затем финальную версию
+
+        Args:
+            message: Сообщение пользователя
+            stitcher: VideoStitcher задачи
+            video_paths: Пути к клипам сцен
+            caption: Подпись финального видео
+            output_filename: Имя итогового файла, уникальное для задачи (превью - по нему же)
+            aspect_ratio: Соотношение сторон
+            status_message: Сообщение-статус, удаляется перед отправкой финала
+
+        Returns:
+            Путь к финальному видео или None
+        """
+        preview_filename = f"{Path(output_filename).stem}_preview.mp4"
+        # Путь превью известен заранее: файл удаляется, даже если финал обогнал превью
+        preview_file = Path(stitcher.output_dir) / preview_filename
+        # Отмена задачи не останавливает кодирование в пуле - превью прерывается маркером
+        preview_marker = Path(stitcher.temp_dir) / f"{Path(output_filename).stem}_preview_{uuid.uuid4().hex[:8]}.cancel"
+
+        # Превью ставим в пул первым - оно кодируется в разы быстрее финала
+        preview_task = asyncio.create_task(stitcher.stitch_videos(
+            video_paths, output_filename=preview_filename,
+            profile="preview", aspect_ratio=aspect_ratio,
+            cancel_marker=str(preview_marker)
+        ))
+        final_task = asyncio.create_task(stitcher.stitch_videos(
+            video_paths, output_filename=output_filename,
+            aspect_ratio=aspect_ratio
+        ))
+
+        preview_message = None
+        try:
+            done, _ = await asyncio.wait({preview_task, final_task}, return_when=asyncio.FIRST_COMPLETED)
+
+            if final_task not in done and preview_task.result():
+                try:
+                    preview_message = await message.answer_video(
+                        types.FSInputFile(preview_task.result()),
+                        caption=self.PREVIEW_CAPTION
+                    )
+                    logger.info("👀 Превью отправлено, жду финальную версию")
+                except Exception as e:
+                    logger.warning(f"⚠️ Не удалось отправить превью: {e}")
+
+            final_path = await final_task
+        except BaseException:
+            preview_marker.touch()
+            final_task.cancel()
+            # Превью останавливается по маркеру на следующем шаге кодирования
+            discard = asyncio.create_task(self._discard_preview(preview_task, preview_marker, preview_file))
+            self._discards.add(discard)
+            discard.add_done_callback(self._discards.discard)
+            raise
+
+        # Финал готов раньше превью - кодирование превью больше не нужно
+        if not preview_task.done():
+            preview_marker.touch()
+
+        try:
+            if not final_path:
+                return None
+
+            if status_message:
+                try:
+                    await status_message.delete()
+                except Exception:
+                    pass
+
+            await self.send_video(message, final_path, caption=caption)
+
+            if preview_message:
+                try:
+                    await preview_message.delete()
+                except Exception as e:
+                    logger.warning(f"⚠️ Не удалось удалить превью: {e}")
+            return final_path
+        finally:
+            await self._discard_preview(preview_task, preview_marker, preview_file)
+
+
+# Глобальный экземпляр
+media_delivery = MediaDelivery()
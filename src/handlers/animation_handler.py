@@ -10,14 +10,17 @@ from typing import Optional
 
 sys.path.insert(0, str(Path(__file__).parent.parent.parent))
 
-import google.generativeai as genai
 from aiogram import Router, types
 from aiogram.client.bot import Bot
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from src.config import GEMINI_API_KEY
-from generators.image_utils import ImageUploader
+from src.clients import clients
+from src.llm_gateway import llm_gateway
+from src.log_setup import bind_context
+from src.ledger import ledger
+from src.jobs import cancellable, cancel_keyboard
 from integrations.airtable.airtable_logger import session_logger
 
 logger = logging.getLogger(__name__)
@@ -31,8 +34,6 @@ async def enhance_animation_prompt(prompt: str) -> str:
         return prompt
     
     try:
-        genai.configure(api_key=GEMINI_API_KEY)
-        
         system_prompt = """Ты эксперт по созданию видео промтов для AI моделей видеогенерации (Kling, Sora, Veo).
 Твоя задача - улучшить промт пользователя, добавив:
 1. Больше деталей о движении камеры и динамике
@@ -43,14 +44,12 @@ async def enhance_animation_prompt(prompt: str) -> str:
 
 Верни ТОЛЬКО улучшенный промт (на русском языке), без объяснений. Длина: 200-300 символов."""
         
-        model = genai.GenerativeModel("gemini-2.0-flash")
-        response = await asyncio.to_thread(
-            model.generate_content,
-            f"{system_prompt}\n\nУлучши этот промт для видео:\n{prompt}"
+        enhanced = await llm_gateway.gemini_generate(
+            f"{system_prompt}\n\nУлучши этот промт для видео:\n{prompt}",
+            model="gemini-2.0-flash"
         )
-        
-        enhanced = response.text.strip()
-        logger.info(f"✅ Промт улучшен Gemini:\nОригинал: {prompt}\nУлучшенный: {enhanced}")
+        logger.info("✅ Промт улучшен Gemini (%s → %s символов)", len(prompt), len(enhanced))
+        logger.debug("   Улучшенный промт: %s", enhanced)
         return enhanced
         
     except Exception as e:
@@ -87,6 +86,7 @@ async def start_animation(callback: types.CallbackQuery, state: FSMContext):
     user_id = callback.from_user.id
     session_id = f"animation_{uuid.uuid4().hex[:12]}"
     start_time = time.time()
+    bind_context(session_id=session_id)
     
     # Инициализация WorkflowTracker
     tracker = WorkflowTracker()
@@ -412,7 +412,7 @@ async def process_animation_image(message: types.Message, state: FSMContext):
             logger.info(f"   Telegram file_id: {message.photo[-1].file_id}")
             
             # Скачиваем фото с Telegram и загружаем на ImgBB
-            uploader = ImageUploader()
+            uploader = clients.image_uploader
             image_url = await uploader.process_telegram_photo(
                 message.bot,
                 message.photo[-1].file_id,
@@ -775,8 +775,9 @@ async def start_generation(callback: types.CallbackQuery, state: FSMContext):
     # Проверяем модель
     is_veo = "veo" in model.lower()
     
-    # Рассчитываем стоимость
-    price_per_second = 0.15 if is_veo else 0.07  # Veo: $0.15/сек, Kling: $0.07/сек
+    # Рассчитываем стоимость по прайсу из models/parameters
+    model_id = clients.video_generator.models.get(model, model)
+    price_per_second = ledger.price_per_second(model_id)
     total_cost = duration * price_per_second
     
     # Подготавливаем информацию о генерации
@@ -809,28 +810,14 @@ async def start_generation(callback: types.CallbackQuery, state: FSMContext):
         f"⏰ Это может занять 2-5 минут"
     )
     
-    await callback.message.answer(summary)
-    logger.info(f"🎬 Начало генерации видео: {model}")
-    logger.info(f"   📝 Промт: {prompt[:100]}")
-    logger.info(f"   ❌ Отр. промт: {negative_prompt[:100] if negative_prompt else 'N/A'}")
-    logger.info(f"   🖼️ Фото загружено: {image_url[:80] if image_url else 'Нет (text-to-video режим)'}...")
-    logger.info(f"   📺 Resolution: {resolution}")
-    logger.info(f"   🔊 Audio: {generate_audio}")
-    
-    # 🔴 ФИНАЛЬНАЯ ПРОВЕРКА перед отправкой в background task
-    logger.info(f"🔍 ФИНАЛЬНАЯ ПРОВЕРКА ПРИ СОЗДАНИИ TASK:")
-    logger.info(f"   ✓ user_id = {callback.from_user.id}")
-    logger.info(f"   ✓ model = {model}")
-    logger.info(f"   ✓ prompt = {prompt[:50]}...")
-    logger.info(f"   ✓ duration = {duration}")
-    logger.info(f"   ✓ aspect_ratio = {aspect_ratio}")
-    logger.info(f"   ✓ resolution = {resolution}")
-    logger.info(f"   ✓ generate_audio = {generate_audio}")
-    logger.info(f"   ✓ negative_prompt = {negative_prompt[:50] if negative_prompt else 'N/A'}...")
-    logger.info(f"   ✓ image_url = {image_url} (тип: {type(image_url).__name__}, длина: {len(image_url) if image_url else 'N/A'})")
+    await callback.message.answer(summary, reply_markup=cancel_keyboard())
+    logger.info(
+        "🎬 Начало генерации видео: %s, %ss, %s, %s",
+        model, duration, aspect_ratio, "image-to-video" if image_url else "text-to-video"
+    )
+    logger.debug("   Промт: %s | отр. промт: %s | resolution=%s audio=%s", prompt, negative_prompt, resolution, generate_audio)
     
     # ✅ Запускаем генерацию в фоновом режиме асинхронно (с фото или без)
-    logger.info(f"✅ ОТПРАВЛЯЮ TASK с image_url: {image_url}")
     asyncio.create_task(generate_video_async(
         callback.from_user.id,
         callback.bot,
@@ -848,6 +835,7 @@ async def start_generation(callback: types.CallbackQuery, state: FSMContext):
     await state.clear()
 
 
+@cancellable(chat_id=lambda a: a["user_id"])
 async def generate_video_async(
     user_id: int,
     bot: Bot,
@@ -863,8 +851,7 @@ async def generate_video_async(
 ):
     """Асинхронная генерация видео в фоновом режиме"""
     try:
-        from video_generator import VideoGenerator
-        from video_stitcher import VideoStitcher
+        from generators.video_stitcher import VideoStitcher
         from pathlib import Path
         from src.workflow_tracker import WorkflowTracker
         
@@ -875,8 +862,8 @@ async def generate_video_async(
         logger.info(f"📺 Resolution: {resolution}")
         logger.info(f"🔊 Generate audio: {generate_audio}")
         
-        generator = VideoGenerator()
-        stitcher = VideoStitcher()
+        generator = clients.video_generator
+        stitcher = VideoStitcher(http_session=clients.http_session)
         
         # 🔄 Инициализация WorkflowTracker
         tracker = WorkflowTracker()
@@ -12,11 +12,16 @@ sys.path.insert(0, str(Path(__file__).parent.parent.parent))
 from aiogram import Router, types, Bot
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, FSInputFile
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.filters import StateFilter
-from generators.video_generator import VideoGenerator
-from generators.photo_generator import PhotoGenerator
 from generators.video_stitcher import VideoStitcher
+from src.clients import clients
+from src.config import PHOTO_VARIANTS
+from src.delivery import media_delivery
+from src.jobs import cancellable, cancel_keyboard
+from src.result_cache import result_cache
+from src.speculative import speculative
+from src.log_setup import bind_context
 from integrations.airtable.airtable_logger import session_logger
 
 logger = logging.getLogger(__name__)
@@ -90,6 +95,7 @@ async def start_text_photo_ai_video(callback: types.CallbackQuery, state: FSMCon
     user_id = callback.from_user.id
     session_id = f"video_{uuid.uuid4().hex[:12]}"
     start_time = time.time()
+    bind_context(session_id=session_id)
     
     tracker = WorkflowTracker()
     
@@ -111,13 +117,11 @@ async def start_text_photo_ai_video(callback: types.CallbackQuery, state: FSMCon
     workflow_id = tracker.start_workflow(user_id, "📹 Создание видео (Текст + Фото + AI)", stages)
     
     # 📊 Логирование в Airtable
-    logger.info(f"🔍 DEBUG: Starting Airtable logging for text_photo_ai workflow with session_id={session_id}")
-    start_result = await session_logger.log_session_start(
+    await session_logger.log_session_start(
         user_id=user_id,
         session_id=session_id,
         video_type="text_photo_ai"
     )
-    logger.info(f"   Result: {start_result}")
     
     await state.update_data(workflow_id=workflow_id, session_id=session_id, start_time=start_time, video_type="text_photo_ai")
     
@@ -331,7 +335,7 @@ async def process_prompt(message: types.Message, state: FSMContext):
     )
     
     try:
-        generator = VideoGenerator()
+        generator = clients.video_generator
         
         # ✅ Gemini разбивает промт на сцены
         scenes_result = await generator.enhance_prompt_with_gemini(
@@ -361,12 +365,11 @@ async def process_prompt(message: types.Message, state: FSMContext):
         )
         
         # ✅ ШАГ 1: Генерируем ФОТО ПОСЛЕДОВАТЕЛЬНО С НАСЛЕДОВАНИЕМ
-        photo_gen = PhotoGenerator()
+        photo_gen = clients.photo_generator
         
         # Получаем URL референса из state, если был загружен
         reference_url = data.get("reference_url")
-        logger.info(f"🔍 DEBUG photo_ai_handler: reference_url = {reference_url}")
-        logger.info(f"🔍 DEBUG photo_ai_handler: все данные в state = {list(data.keys())}")
+        logger.debug("reference_url = %s, ключи state: %s", reference_url, list(data.keys()))
         if reference_url:
             logger.info(f"📸 Используем reference_url: {reference_url[:80]}...")
         else:
@@ -444,7 +447,7 @@ async def process_prompt(message: types.Message, state: FSMContext):
 
 
 async def show_all_scenes_and_photos_for_confirmation(message: types.Message, state: FSMContext):
-    """✅ НОВОЕ: Показывает КАЖДУЮ СЦЕНУ + её ФОТО вместе для подтверждения"""
+    """Показывает сцены и их фото альбомом и одно итоговое сообщение для подтверждения"""
     data = await state.get_data()
     scenes = data.get("scenes", [])
     enhanced_prompt = data.get("enhanced_prompt", "")
@@ -457,50 +460,28 @@ async def show_all_scenes_and_photos_for_confirmation(message: types.Message, st
     successful_photos_count = sum(1 for s in scenes if s.get("photo_url") or s.get("photo_path"))
     failed_photos_count = len(scenes) - successful_photos_count
     
-    # ✅ Показываем ИНФОРМАЦИЮ + ФОТО для каждой сцены
+    # Все фото - одним-двумя альбомами, описание сцены в подписи к фото
+    album = []
+    missing = []
     for i, scene in enumerate(scenes, 1):
-        # Формируем информацию сцены
-        scene_text = f"🎬 СЦЕНА {i}/{len(scenes)}\n"
-        scene_text += "─" * 40 + "\n"
-        scene_text += f"📝 Промт: {scene.get('prompt', 'N/A')}\n"
-        scene_text += f"⏱️ Длительность: {scene.get('duration', 5)} сек\n"
-        scene_text += f"🎨 Атмосфера: {scene.get('atmosphere', 'N/A')}"
-        
-        # Добавляем информацию об ошибке, если есть
-        if scene.get("photo_error"):
-            scene_text += f"\n❌ Ошибка: {scene.get('photo_error')[:100]}"
-        
-        # Отправляем информацию сцены
-        await message.answer(scene_text, parse_mode="Markdown")
-        
-        # Отправляем фотографию для этой сцены (если она есть)
-        photo_path = scene.get("photo_path")
-        photo_url = scene.get("photo_url")
-        
-        if photo_path or photo_url:
-            try:
-                if photo_path:
-                    # ✅ Используем FSInputFile для локальных файлов
-                    photo_input = FSInputFile(photo_path)
-                    await message.answer_photo(
-                        photo=photo_input,
-                        caption=f"🖼️ Фото для сцены {i} ✅"
-                    )
-                elif photo_url:
-                    await message.answer_photo(
-                        photo=photo_url,
-                        caption=f"🖼️ Фото для сцены {i} ✅"
-                    )
-            except Exception as e:
-                logger.warning(f"⚠️ Не смог отправить фото сцены {i}: {e}")
-                await message.answer(f"⚠️ Ошибка при отправке фото сцены {i}: {str(e)[:80]}")
-        else:
-            error_reason = scene.get('photo_error', 'Ошибка генерации')
-            await message.answer(
-                f"⚠️ Фото для сцены {i} не найдено\n\n"
-                f"Причина: {error_reason}"
-            )
-    
+        if not (scene.get("photo_url") or scene.get("photo_path")):
+            missing.append((i, scene.get("photo_error") or "Ошибка генерации"))
+            continue
+        caption = (
+            f"🎬 СЦЕНА {i}/{len(scenes)}\n"
+            f"📝 Промт: {scene.get('prompt', 'N/A')}\n"
+            f"⏱️ Длительность: {scene.get('duration', 5)} сек\n"
+            f"🎨 Атмосфера: {scene.get('atmosphere', 'N/A')}"
+        )
+        album.append({"photo_url": scene.get("photo_url"), "photo_path": scene.get("photo_path"), "caption": caption})
+
+    if album:
+        try:
+            await media_delivery.send_photo_album(message, album)
+        except Exception as e:
+            logger.warning(f"⚠️ Не смог отправить альбом фото сцен: {e}")
+            await message.answer(f"⚠️ Ошибка при отправке фото сцен: {str(e)[:80]}")
+
     # В конце показываем финальное сообщение с кнопками подтверждения
     final_text = "=" * 50 + "\n"
     
@@ -509,6 +490,8 @@ async def show_all_scenes_and_photos_for_confirmation(message: types.Message, st
     else:
         final_text += f"⚠️ СТАТУС: {successful_photos_count}/{len(scenes)} фото готовы\n"
         final_text += f"❌ Не удалось: {failed_photos_count} сцены\n"
+        for i, error_reason in missing:
+            final_text += f"   • Сцена {i}: {str(error_reason)[:100]}\n"
     
     final_text += "=" * 50 + "\n\n"
     final_text += "Подтверждаешь ли все сцены и фото для генерации видео?"
@@ -541,7 +524,7 @@ async def show_all_scenes_and_photos_for_confirmation(message: types.Message, st
             ]
         )
     
-    await message.answer(final_text, parse_mode="Markdown", reply_markup=keyboard)
+    await message.answer(final_text, reply_markup=keyboard)
 
 
 async def show_scene_for_confirmation(message: types.Message, state: FSMContext, scene_index: int):
@@ -623,7 +606,7 @@ async def regenerate_all_photos(callback: types.CallbackQuery, state: FSMContext
     await state.set_state(PhotoAIStates.processing_prompt)
     
     try:
-        photo_gen = PhotoGenerator()
+        photo_gen = clients.photo_generator
         
         # ✅ Используем новый API с правильными параметрами
         photos_result = await photo_gen.generate_photos_for_scenes(
@@ -783,7 +766,7 @@ async def regenerate_scenes(callback: types.CallbackQuery, state: FSMContext):
     )
     
     try:
-        generator = VideoGenerator()
+        generator = clients.video_generator
         num_scenes = _extract_num_scenes_from_prompt(prompt)
         
         scenes_result = await generator.enhance_prompt_with_gemini(
@@ -825,7 +808,7 @@ async def start_photo_generation_immediate(message: types.Message, state: FSMCon
     video_type = data.get("video_type")
     prompt = data.get("prompt", "")
     
-    logger.info(f"🔍 DEBUG photo_ai_handler (photo generation): session_id={session_id}, video_type={video_type}")
+    logger.debug("Генерация фото: session_id=%s, video_type=%s", session_id, video_type)
     
     if session_id:
         enhanced_prompt = data.get("enhanced_prompt", "")
@@ -849,7 +832,7 @@ async def start_photo_generation_immediate(message: types.Message, state: FSMCon
         logger.warning(f"⚠️ No session_id in state - Airtable logging skipped")
     
     try:
-        photo_gen = PhotoGenerator()
+        photo_gen = clients.photo_generator
         
         # ПОСЛЕДОВАТЕЛЬНАЯ генерация фото для всех сцен с наследованием
         logger.info(f"📸 Генерирую фото для {len(scenes)} сцен ПОСЛЕДОВАТЕЛЬНО...")
@@ -948,7 +931,7 @@ async def start_photo_generation(message: types.Message, state: FSMContext):
     await state.set_state(PhotoAIStates.generating_photos)
     
     try:
-        photo_gen = PhotoGenerator()
+        photo_gen = clients.photo_generator
         
         photos_result = await photo_gen.generate_photos_for_scenes(
             scenes=scenes,
@@ -1032,6 +1015,9 @@ async def show_photo_for_confirmation(message: types.Message, state: FSMContext,
         await show_photo_for_confirmation(message, state, next_index)
         return
     
+    # Пока фото рассматривают, видео сцены может начать генерироваться в фоне
+    await speculate_scene_video(message.chat.id, state, scene_index, idle=True)
+    
     prompt_full = scene.get('prompt', '')
     atmosphere = scene.get('atmosphere', 'N/A')
     
@@ -1070,8 +1056,10 @@ async def show_photo_for_confirmation(message: types.Message, state: FSMContext,
     
     try:
         if scene.get("photo_path"):
-            await message.answer_photo(
-                types.FSInputFile(scene["photo_path"]),
+            await media_delivery.send_photo(
+                message,
+                photo_url=scene.get("photo_url"),
+                photo_path=scene["photo_path"],
                 caption=scene_text,
                 reply_markup=keyboard,
                 parse_mode="Markdown"
@@ -1083,11 +1071,38 @@ async def show_photo_for_confirmation(message: types.Message, state: FSMContext,
         await message.answer(scene_text, reply_markup=keyboard, parse_mode="Markdown")
 
 
+def _scene_video_params(scene: dict, scene_index: int, aspect_ratio: str) -> dict:
+    """Аргументы generate_scene для видео сцены по ее фото"""
+    return {
+        "prompt": scene.get("prompt", ""),
+        "duration": 5,
+        "aspect_ratio": aspect_ratio,
+        "model": "kling",
+        "start_image_url": scene.get("photo_url"),  # Используем фото как начальный фрейм
+        "scene_number": scene_index + 1,
+    }
+
+
+async def speculate_scene_video(chat_id: int, state: FSMContext, scene_index: int, idle: bool = False):
+    """Фоновая генерация видео сцены по одобренному фото (src.speculative)"""
+    data = await state.get_data()
+    scenes_with_photos = data.get("scenes_with_photos", [])
+    if scene_index >= len(scenes_with_photos) or not scenes_with_photos[scene_index].get("photo_url"):
+        return
+    
+    generator = clients.video_generator
+    params = _scene_video_params(scenes_with_photos[scene_index], scene_index, data.get("aspect_ratio", "16:9"))
+    run = speculative.schedule_idle if idle else speculative.start
+    run(chat_id, f"photo_ai:{scene_index + 1}", params, lambda: generator.generate_scene(**params),
+        generator.estimate_scene_cost(params))
+
+
 @router.callback_query(lambda c: c.data.startswith("photo_ai_photo_approve_"))
 async def approve_photo(callback: types.CallbackQuery, state: FSMContext):
     """Подтверждение фото"""
     await callback.answer()
     scene_index = int(callback.data.replace("photo_ai_photo_approve_", ""))
+    await speculate_scene_video(callback.message.chat.id, state, scene_index)
     
     next_index = scene_index + 1
     await state.update_data(current_scene_index=next_index)
@@ -1106,6 +1121,7 @@ async def regenerate_photo(callback: types.CallbackQuery, state: FSMContext):
     """Регенерирование фото для конкретной сцены"""
     await callback.answer()
     scene_index = int(callback.data.replace("photo_ai_photo_regen_", ""))
+    speculative.cancel(callback.message.chat.id, f"photo_ai:{scene_index + 1}")
     
     data = await state.get_data()
     scenes_with_photos = data.get("scenes_with_photos", [])
@@ -1118,37 +1134,62 @@ async def regenerate_photo(callback: types.CallbackQuery, state: FSMContext):
         return
     
     scene = scenes_with_photos[scene_index]
+    # «Еще варианты» без выбора: показанные (уже оплаченные) варианты не теряются
+    shown = data.get("photo_variants")
+    await state.update_data(photo_variants=None)
     
     regenerating_msg = await callback.message.answer(
-        f"🎨 Регенерирую фото для сцены {scene_index + 1}...\n"
+        f"🎨 Генерирую {PHOTO_VARIANTS} варианта фото для сцены {scene_index + 1} одновременно...\n"
         f"⏳ Это может занять минуту..."
     )
     
     try:
-        photo_gen = PhotoGenerator()
+        photo_gen = clients.photo_generator
         
-        # Генерирую одно фото
+        # Несколько вариантов параллельно - пользователь выбирает лучший за один цикл
         prompt = scene.get('prompt', general_prompt)
-        result = await photo_gen._generate_single_photo(
+        result = await photo_gen.generate_photo_variants(
             prompt=prompt,
             aspect_ratio=aspect_ratio,
             reference_image_url=reference_url,
-            scene_index=scene_index
+            scene_index=scene_index,
+            count=PHOTO_VARIANTS,
+            scope=callback.message.chat.id
         )
         
         if result.get("status") == "success":
-            # Обновляю сцену с новым фото
-            scene["photo_url"] = result.get("photo_url")
-            scene["photo_path"] = result.get("photo_path")
-            
-            scenes_with_photos[scene_index] = scene
-            await state.update_data(scenes_with_photos=scenes_with_photos)
-            
+            variants = result["variants"]
             await regenerating_msg.delete()
             
-            # Показываю обновленное фото
-            await state.set_state(PhotoAIStates.confirming_photos)
-            await show_photo_for_confirmation(callback.message, state, scene_index)
+            if len(variants) == 1:
+                await apply_photo_variant(callback.message, state, scene_index, variants, 0, result["cache_key"])
+                return
+            
+            await state.update_data(photo_variants={
+                "scene_index": scene_index,
+                "variants": variants,
+                "cache_key": result["cache_key"],
+            })
+            await media_delivery.send_photo_album(callback.message, [
+                {
+                    "photo_url": variant.get("photo_url"),
+                    "photo_path": variant.get("photo_path"),
+                    "caption": f"Вариант {i}"
+                }
+                for i, variant in enumerate(variants, 1)
+            ])
+            await callback.message.answer(
+                f"🖼️ Сцена {scene_index + 1}: выбери лучший вариант",
+                reply_markup=InlineKeyboardMarkup(
+                    inline_keyboard=[
+                        [
+                            InlineKeyboardButton(text=f"✅ {i}", callback_data=f"photo_ai_pick_{scene_index}_{i - 1}")
+                            for i in range(1, len(variants) + 1)
+                        ],
+                        [InlineKeyboardButton(text="🔄 Еще варианты", callback_data=f"photo_ai_photo_regen_{scene_index}")]
+                    ]
+                )
+            )
         else:
             error = result.get("error", "Unknown error")
             await regenerating_msg.edit_text(f"❌ Ошибка: {error}")
@@ -1156,6 +1197,42 @@ async def regenerate_photo(callback: types.CallbackQuery, state: FSMContext):
     except Exception as e:
         logger.error(f"❌ Ошибка регенерации фото: {e}")
         await regenerating_msg.edit_text(f"❌ Ошибка: {str(e)[:100]}")
+    finally:
+        # В кэш - после генерации, иначе она сразу забрала бы их обратно
+        if shown:
+            result_cache.put(shown["cache_key"], shown["variants"])
+
+
+async def apply_photo_variant(message: types.Message, state: FSMContext, scene_index: int,
+                              variants: list, chosen: int, cache_key: str):
+    """Ставит выбранный вариант фото в сцену, остальные сохраняет в кэш вариантов"""
+    data = await state.get_data()
+    scenes_with_photos = data.get("scenes_with_photos", [])
+    scene = scenes_with_photos[scene_index]
+    scene["photo_url"] = variants[chosen].get("photo_url")
+    scene["photo_path"] = variants[chosen].get("photo_path")
+    scenes_with_photos[scene_index] = scene
+    
+    # Невыбранные варианты вернутся мгновенно при следующем «Переделать»
+    result_cache.put(cache_key, [variant for i, variant in enumerate(variants) if i != chosen])
+    await state.update_data(scenes_with_photos=scenes_with_photos, photo_variants=None)
+    
+    await state.set_state(PhotoAIStates.confirming_photos)
+    await show_photo_for_confirmation(message, state, scene_index)
+
+
+@router.callback_query(lambda c: c.data.startswith("photo_ai_pick_"))
+async def pick_photo_variant(callback: types.CallbackQuery, state: FSMContext):
+    """Выбор одного из параллельных вариантов фото"""
+    scene_index, chosen = map(int, callback.data.replace("photo_ai_pick_", "").split("_"))
+    data = await state.get_data()
+    pending = data.get("photo_variants") or {}
+    if pending.get("scene_index") != scene_index or chosen >= len(pending.get("variants", [])):
+        await callback.answer("❌ Варианты устарели, нажми «Переделать» еще раз", show_alert=True)
+        return
+    
+    await callback.answer(f"✅ Вариант {chosen + 1}")
+    await apply_photo_variant(callback.message, state, scene_index, pending["variants"], chosen, pending["cache_key"])
 
 
 @router.callback_query(lambda c: c.data.startswith("photo_ai_photo_edit_"))
@@ -1204,6 +1281,7 @@ async def process_photo_prompt_edit(message: types.Message, state: FSMContext):
         if scene_index < len(scenes_with_photos):
             scenes_with_photos[scene_index]['prompt'] = message.text
             await state.update_data(scenes_with_photos=scenes_with_photos)
+            speculative.cancel(message.chat.id, f"photo_ai:{scene_index + 1}")
             await message.answer(f"✅ Промт сцены {scene_index + 1} обновлен!")
     
     await state.set_state(PhotoAIStates.confirming_photos)
@@ -1233,7 +1311,7 @@ async def photo_edit_done(callback: types.CallbackQuery, state: FSMContext):
     )
     
     try:
-        photo_gen = PhotoGenerator()
+        photo_gen = clients.photo_generator
         
         # Генерирую одно фото с новым промтом
         prompt = scene.get('prompt', general_prompt)
@@ -1273,6 +1351,7 @@ async def approve_all_photos(callback: types.CallbackQuery, state: FSMContext):
     await start_video_generation_final(callback.message, state)
 
 
+@cancellable(chat_id=lambda a: a["message"].chat.id)
 async def start_video_generation_final(message: types.Message, state: FSMContext):
     """Финальная генерация видео на основе фото"""
     data = await state.get_data()
@@ -1286,17 +1365,27 @@ async def start_video_generation_final(message: types.Message, state: FSMContext
         f"  Сцен: {len(scenes_with_photos)}\n"
         f"  Длительность: {len(scenes_with_photos) * 5} сек\n"
         f"  Модель: Kling v2.5 Turbo Pro\n\n"
-        f"⏳ Генерирую видео для каждой сцены..."
+        f"⏳ Генерирую видео для каждой сцены...",
+        reply_markup=cancel_keyboard()
     )
     
     await state.set_state(PhotoAIStates.generating_video)
     
     try:
-        generator = VideoGenerator()
-        stitcher = VideoStitcher()
+        generator = clients.video_generator
+        stitcher = VideoStitcher(http_session=clients.http_session)
         
         video_paths = []
         
+        # Видео сцен, которые уже генерируются в фоне с теми же фото и промтом
+        chat_id = message.chat.id
+        prefetched = {}
+        for idx, scene in enumerate(scenes_with_photos):
+            task = speculative.take(chat_id, f"photo_ai:{idx + 1}", _scene_video_params(scene, idx, aspect_ratio))
+            if task is not None:
+                prefetched[idx] = task
+        speculative.clear(chat_id)
+        
         # Генерирую видео для каждой сцены с фото
         for idx, scene in enumerate(scenes_with_photos):
             scene_num = idx + 1
@@ -1304,7 +1393,8 @@ async def start_video_generation_final(message: types.Message, state: FSMContext
             
             await generating_msg.edit_text(
                 f"🎬 Генерирую видео ({scene_num}/{len(scenes_with_photos)})...\n\n"
-                f"Прогресс: {int(scene_num / len(scenes_with_photos) * 100)}%"
+                f"Прогресс: {int(scene_num / len(scenes_with_photos) * 100)}%",
+                reply_markup=cancel_keyboard()
             )
             
             photo_url = scene.get("photo_url")
@@ -1312,19 +1402,17 @@ async def start_video_generation_final(message: types.Message, state: FSMContext
                 logger.warning(f"⚠️ Нет фото для сцены {scene_num}, пропускаю")
                 continue
             
-            result = await generator.generate_scene(
-                prompt=scene.get("prompt", ""),
-                duration=5,
-                aspect_ratio=aspect_ratio,
-                model="kling",
-                start_image_url=photo_url  # Используем фото как начальный фрейм
-            )
+            if idx in prefetched:
+                logger.info(f"🔮 Сцена {scene_num}: результат спекулятивной генерации")
+                result = await prefetched[idx]
+            else:
+                result = await generator.generate_scene(**_scene_video_params(scene, idx, aspect_ratio))
             
             if result.get("status") == "success":
                 video_url = result.get("video_url")
                 video_path = await stitcher.download_video(
                     video_url,
-                    f"scene_{scene_num}.mp4"
+                    f"scene_{chat_id}_{scene_num}_{uuid.uuid4().hex[:8]}.mp4"
                 )
                 
                 if video_path:
@@ -1335,19 +1423,21 @@ async def start_video_generation_final(message: types.Message, state: FSMContext
         
         # Склеиваю видео
         if video_paths:
-            await generating_msg.edit_text("🎞️ Склеиваю видео...")
+            await generating_msg.edit_text("🎞️ Склеиваю видео...", reply_markup=cancel_keyboard())
             
-            final_video = await stitcher.stitch_videos(video_paths)
+            final_video = await media_delivery.stitch_and_deliver(
+                message,
+                stitcher,
+                video_paths,
+                caption="✅ Видео готово! Создано с помощью:\n"
+                        "• Google Nano-Banana (фото)\n"
+                        "• Kling v2.5 Turbo Pro (видео)",
+                output_filename=f"final_{chat_id}_{uuid.uuid4().hex[:12]}.mp4",
+                aspect_ratio=aspect_ratio,
+                status_message=generating_msg
+            )
             
             if final_video:
-                await generating_msg.delete()
-                
-                await message.answer_video(
-                    types.FSInputFile(final_video),
-                    caption="✅ Видео готово! Создано с помощью:\n"
-                            "• Google Nano-Banana (фото)\n"
-                            "• Kling v2.5 Turbo Pro (видео)"
-                )
                 
                 # 📊 Логирование URL видео сцен в Airtable
                 session_id = data.get("session_id")
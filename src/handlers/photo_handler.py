@@ -13,18 +13,17 @@ from aiogram import Router, types, Bot
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-from generators.photo_generator import PhotoGenerator
-from generators.image_utils import ImageUploader
-import google.generativeai as genai
-from src.config import GEMINI_API_KEY
+from src.clients import clients
+from src.llm_gateway import llm_gateway
+from src.delivery import media_delivery
+from src.config import REFRAME_MODE, REFRAME_MIN_KEEP
+from generators import media_jobs
+from generators.media_pool import media_pool
 from integrations.airtable.airtable_logger import session_logger
 
 router = Router()
 logger = logging.getLogger(__name__)
 
-# Конфигурация Gemini для перевода
-genai.configure(api_key=GEMINI_API_KEY)
-
 
 def has_cyrillic(text: str) -> bool:
     """Проверяет наличие кириллицы в тексте"""
@@ -39,8 +38,6 @@ async def translate_to_english(text: str) -> str:
     try:
         logger.info(f"🔄 Обнаружен русский текст, перевожу: {text[:50]}...")
         
-        model = genai.GenerativeModel('gemini-2.0-flash-exp')
-        
         prompt = f"""Translate this text from Russian to English. 
 Return ONLY the English translation, nothing else.
 
@@ -48,8 +45,8 @@ Text: {text}
 
 Translation:"""
         
-        response = model.generate_content(prompt)
-        translated = response.text.strip()
+        # Нативный async вызов через шлюз - event loop не блокируется
+        translated = await llm_gateway.gemini_generate(prompt, model='gemini-2.0-flash-exp')
         
         logger.info(f"✅ Перевод: {translated}")
         return translated
@@ -73,6 +70,7 @@ class PhotoStates(StatesGroup):
     editing_waiting_image = State()
     editing_choosing_category = State()
     editing_choosing_function = State()
+    editing_choosing_tier = State()  # Быстро (локально) или AI
     editing_waiting_prompt = State()
     editing_processing = State()
 
@@ -218,7 +216,7 @@ async def process_aspect_ratio(callback: types.CallbackQuery, state: FSMContext)
     
     # Запускаем генерацию
     try:
-        generator = PhotoGenerator()
+        generator = clients.photo_generator
         
         result = await generator._generate_single_photo(
             prompt=prompt,
@@ -236,8 +234,9 @@ async def process_aspect_ratio(callback: types.CallbackQuery, state: FSMContext)
             )
             
             # Отправляем фото
-            await callback.message.answer_photo(
-                photo=photo_url,
+            await media_delivery.send_photo(
+                callback.message,
+                photo_url=photo_url,
                 caption=f"🎨 Сгенерировано: {prompt[:100]}..."
             )
             
@@ -376,7 +375,7 @@ async def process_editing_image(message: types.Message, state: FSMContext, bot:
     status_msg = await message.answer("⏳ Проверяю качество фото...")
     
     try:
-        uploader = ImageUploader()
+        uploader = clients.image_uploader
         file_id = message.photo[-1].file_id
         
         # ✅ ШАГ 1: Скачиваем фото для валидации
@@ -387,7 +386,7 @@ async def process_editing_image(message: types.Message, state: FSMContext, bot:
             return
         
         # ✅ ШАГ 2: Валидация качества
-        validation = uploader.validate_photo_quality(photo_bytes)
+        validation = await uploader.validate_photo_quality(photo_bytes)
         
         # ❌ Критические ошибки - отклоняем фото
         if not validation["valid"]:
@@ -415,7 +414,8 @@ async def process_editing_image(message: types.Message, state: FSMContext, bot:
             await status_msg.edit_text("❌ Не удалось загрузить фото")
             return
         
-        await state.update_data(image_url=image_url)
+        # file_id нужен для локальной смены формата без повторного скачивания по URL
+        await state.update_data(image_url=image_url, image_file_id=file_id)
         await state.set_state(PhotoStates.editing_choosing_category)
         
         keyboard = InlineKeyboardMarkup(
@@ -546,7 +546,7 @@ async def choose_editing_function(callback: types.CallbackQuery, state: FSMConte
     await callback.answer()
     
     function = callback.data.replace("func_", "")
-    await state.update_data(function=function)
+    await state.update_data(function=function, force_ai=False)
     
     # Определяем, нужен ли дополнительный промт
     no_prompt_functions = [
@@ -555,7 +555,21 @@ async def choose_editing_function(callback: types.CallbackQuery, state: FSMConte
         "bokeh", "format_16_9", "format_9_16", "format_1_1"
     ]
     
-    if function in no_prompt_functions:
+    if function in LOCAL_FILTER_FUNCTIONS:
+        # Технические фильтры есть локально - даем выбрать скорость или AI
+        await state.set_state(PhotoStates.editing_choosing_tier)
+        await callback.message.edit_text(
+            f"🔧 {get_function_name(function)}\n\n"
+            f"⚡ Быстро - локальная обработка, 1-2 секунды\n"
+            f"🤖 AI - нейросеть {(await state.get_data()).get('model', 'google/nano-banana')}, 30-60 секунд",
+            reply_markup=InlineKeyboardMarkup(
+                inline_keyboard=[
+                    [InlineKeyboardButton(text="⚡ Быстро (локально)", callback_data="edit_tier_local")],
+                    [InlineKeyboardButton(text="🤖 AI", callback_data="edit_tier_ai")],
+                ]
+            )
+        )
+    elif function in no_prompt_functions:
         # Сразу запускаем обработку без промта
         await state.set_state(PhotoStates.editing_processing)
         await process_editing_without_prompt(callback, state)
@@ -620,6 +634,7 @@ async def skip_prompt_handler(callback: types.CallbackQuery, state: FSMContext):
         def __init__(self, callback):
             self.chat = callback.message.chat
             self.message_id = callback.message.message_id
+            self.bot = callback.bot
             self._callback = callback
             
         async def answer(self, text, **kwargs):
@@ -660,6 +675,7 @@ async def process_editing_without_prompt(callback: types.CallbackQuery, state: F
         def __init__(self, callback):
             self.chat = callback.message.chat
             self.message_id = callback.message.message_id
+            self.bot = callback.bot
             self._callback = callback
             
         async def answer(self, text, **kwargs):
@@ -672,6 +688,108 @@ async def process_editing_without_prompt(callback: types.CallbackQuery, state: F
     await execute_editing(fake_message, state)
 
 
+# Смена формата: функция -> соотношение сторон
+ASPECT_RATIO_FUNCTIONS = {
+    "format_16_9": "16:9",
+    "format_9_16": "9:16",
+    "format_1_1": "1:1"
+}
+
+# Функции с локальной реализацией: смена формата и технические фильтры (generators.image_filters)
+LOCAL_FILTER_FUNCTIONS = ("upscale", "denoise", "sharpen", "enhance_general")
+LOCAL_FUNCTIONS = tuple(ASPECT_RATIO_FUNCTIONS) + LOCAL_FILTER_FUNCTIONS
+
+
+async def execute_local_editing(message, state: FSMContext) -> bool:
+    """
+    Смена формата или технический фильтр локально в пуле процессов (без запроса к модели)
+    
+    Returns:
+        False, если локальная обработка невозможна и нужен путь через модель
+    """
+    data = await state.get_data()
+    function = data.get("function", "")
+    file_id = data.get("image_file_id")
+    if not file_id:
+        return False
+    
+    status_msg = await message.answer(f"⏳ {get_function_name(function)}...")
+    output_path = Path("temp_images") / f"edit_{uuid.uuid4().hex[:12]}.jpg"
+    try:
+        photo_bytes = await clients.image_uploader.download_telegram_photo(message.bot, file_id)
+        if not photo_bytes:
+            await status_msg.delete()
+            return False
+        
+        started = time.time()
+        if function in ASPECT_RATIO_FUNCTIONS:
+            result = await media_pool.run(
+                media_jobs.reframe_image, photo_bytes, ASPECT_RATIO_FUNCTIONS[function], str(output_path),
+                REFRAME_MODE, REFRAME_MIN_KEEP, task_name="reframe"
+            )
+            method = "обрезка по содержимому" if result["mode"] == "crop" else "фото на размытом фоне"
+            ai_button = "🪄 Дорисовать фон AI (30-60 сек)"
+        else:
+            result = await media_pool.run(
+                media_jobs.filter_image, photo_bytes, function, str(output_path), task_name="filter_image"
+            )
+            method = "быстрая обработка"
+            ai_button = "🤖 Сделать через AI (30-60 сек)"
+        logger.info(
+            f"⚡ {function} выполнено локально: "
+            f"{result['width']}x{result['height']} за {time.time() - started:.2f}с"
+        )
+        
+        await status_msg.delete()
+        await media_delivery.send_photo(
+            message,
+            photo_path=str(output_path),
+            caption=f"🎨 {get_function_name(function)} ({method})"
+        )
+    except Exception as e:
+        logger.error(f"❌ Ошибка локального редактирования: {e}")
+        return False
+    finally:
+        output_path.unlink(missing_ok=True)
+    
+    # Данные сессии оставляем: ту же функцию можно выполнить моделью отдельной кнопкой
+    await state.set_state(None)
+    await message.answer(
+        "✨ Хочешь отредактировать ещё?",
+        reply_markup=InlineKeyboardMarkup(
+            inline_keyboard=[
+                [InlineKeyboardButton(text=ai_button, callback_data="photo_edit_ai")],
+                [InlineKeyboardButton(text="🔄 Ещё раз", callback_data="photo_edit")],
+                [InlineKeyboardButton(text="🏠 Главное меню", callback_data="back_to_menu")],
+            ]
+        )
+    )
+    return True
+
+
+@router.callback_query(lambda c: c.data in ("edit_tier_local", "edit_tier_ai"), PhotoStates.editing_choosing_tier)
+async def choose_editing_tier(callback: types.CallbackQuery, state: FSMContext):
+    """Выбор между быстрой локальной обработкой и моделью"""
+    await callback.answer()
+    await state.update_data(force_ai=callback.data == "edit_tier_ai")
+    await state.set_state(PhotoStates.editing_processing)
+    await process_editing_without_prompt(callback, state)
+
+
+@router.callback_query(lambda c: c.data == "photo_edit_ai")
+async def edit_with_ai(callback: types.CallbackQuery, state: FSMContext):
+    """Повтор функции через модель после локального результата (платный шаг по запросу)"""
+    data = await state.get_data()
+    if data.get("function") not in LOCAL_FUNCTIONS or not data.get("image_url"):
+        await callback.answer("❌ Сессия истекла, загрузи фото заново", show_alert=True)
+        return
+    
+    await callback.answer()
+    await state.update_data(force_ai=True)
+    await state.set_state(PhotoStates.editing_processing)
+    await execute_editing(callback.message, state)
+
+
 async def execute_editing(message, state: FSMContext):
     """Выполнение редактирования фото"""
     data = await state.get_data()
@@ -680,6 +798,13 @@ async def execute_editing(message, state: FSMContext):
     image_url = data.get("image_url", "")
     model = data.get("model", "google/nano-banana")
     
+    # Смена формата - геометрия, модель нужна только для дорисовки фона;
+    # технические фильтры идут через модель, только если пользователь выбрал AI
+    if function in LOCAL_FUNCTIONS and not data.get("force_ai"):
+        if function in LOCAL_FILTER_FUNCTIONS or REFRAME_MODE != "ai":
+            if await execute_local_editing(message, state):
+                return
+    
     # Создаем промт на основе функции
     prompt = create_editing_prompt(function, user_prompt)
     
@@ -691,15 +816,10 @@ async def execute_editing(message, state: FSMContext):
     )
     
     try:
-        generator = PhotoGenerator()
+        generator = clients.photo_generator
         
         # Определяем aspect_ratio для технических функций
-        aspect_ratio_map = {
-            "format_16_9": "16:9",
-            "format_9_16": "9:16",
-            "format_1_1": "1:1"
-        }
-        aspect_ratio = aspect_ratio_map.get(function, "match_input_image")
+        aspect_ratio = ASPECT_RATIO_FUNCTIONS.get(function, "match_input_image")
         
         result = await generator._generate_single_photo(
             prompt=prompt,
@@ -717,8 +837,9 @@ async def execute_editing(message, state: FSMContext):
             )
             
             # Отправляем результат
-            await message.answer_photo(
-                photo=photo_url,
+            await media_delivery.send_photo(
+                message,
+                photo_url=photo_url,
                 caption=f"🎨 {get_function_name(function)}"
             )
             
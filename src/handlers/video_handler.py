@@ -14,9 +14,16 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.filters import StateFilter
-from generators.video_generator import VideoGenerator
 from generators.video_stitcher import VideoStitcher
-from generators.image_utils import ImageUploader
+from src.clients import clients
+from src.delivery import media_delivery
+from src.jobs import cancellable, cancel_keyboard
+from src.media_groups import media_groups
+from src.config import SCENE_PLAN_VARIANTS, VIDEO_ENCODER_PROFILE
+from src.result_cache import result_cache
+from src.speculative import speculative
+from src.build_graph import session_builds
+from src.ledger import ledger
 from integrations.airtable.airtable_logger import session_logger
 from integrations.airtable.airtable_video_update import update_video_parameters
 
@@ -36,7 +43,9 @@ class VideoStates(StatesGroup):
     text_processing_prompt = State()  # Gemini обработка промта
     text_confirming_scenes = State()  # Подтверждение сцен
     text_editing_scene = State()  # Редактирование отдельной сцены
+    text_reviewing_drafts = State()  # Просмотр черновиков сцен
     text_generating = State()  # Генерация видео
+    text_rebuild_editing = State()  # Правка сцены доставленного видео
     
     # Подпоток 2: Текст + Фото → Видео
     text_photo_choosing_model = State()  # Выбор модели AI
@@ -390,7 +399,7 @@ async def process_text_video_prompt(message: types.Message, state: FSMContext):
     )
     
     try:
-        generator = VideoGenerator()
+        generator = clients.video_generator
         
         scenes_result = await generator.enhance_prompt_with_gemini(
             prompt=message.text,
@@ -437,11 +446,14 @@ async def show_scene_for_confirmation(message: types.Message, state: FSMContext,
     scenes = data.get("scenes", [])
     
     if scene_index >= len(scenes):
-        await start_video_generation(message, state)
+        await offer_draft_mode(message, state)
         return
     
     scene = scenes[scene_index]
     
+    # Пока сцену читают, ее видео может начать генерироваться в фоне
+    await speculate_scene(message.chat.id, state, scene_index, idle=True)
+    
     prompt_text = scene['prompt']
     indented_prompt = "\n".join("    " + line for line in prompt_text.split("\n"))
     
@@ -480,6 +492,7 @@ async def approve_scene(callback: types.CallbackQuery, state: FSMContext):
     await callback.answer()
     
     scene_index = int(callback.data.replace("scene_approve_", ""))
+    await speculate_scene(callback.message.chat.id, state, scene_index)
     data = await state.get_data()
     scenes = data.get("scenes", [])
     
@@ -489,7 +502,7 @@ async def approve_scene(callback: types.CallbackQuery, state: FSMContext):
     if next_index < len(scenes):
         await show_scene_for_confirmation(callback.message, state, next_index)
     else:
-        await start_video_generation(callback.message, state)
+        await offer_draft_mode(callback.message, state)
 
 
 @router.callback_query(lambda c: c.data.startswith("scene_edit_"))
@@ -530,6 +543,7 @@ async def process_scene_edit(message: types.Message, state: FSMContext):
     if scene_index < len(scenes):
         scenes[scene_index]['prompt'] = message.text
         await state.update_data(scenes=scenes)
+        speculative.cancel(message.chat.id, f"text:{scene_index + 1}")
     
     await message.answer(f"✅ Сцена {scene_index + 1} обновлена!")
     await state.set_state(VideoStates.text_confirming_scenes)
@@ -553,35 +567,344 @@ async def regenerate_all_scenes(callback: types.CallbackQuery, state: FSMContext
     
     data = await state.get_data()
     prompt = data.get("prompt", "")
+    # «Еще варианты» без выбора: показанные разбивки не теряются
+    shown = data.get("scene_plan_variants")
+    await state.update_data(scene_plan_variants=None)
     
     await state.set_state(VideoStates.text_processing_prompt)
     
-    processing_msg = await callback.message.answer("⏳ Регенерирую все сцены...")
+    processing_msg = await callback.message.answer(f"⏳ Готовлю {SCENE_PLAN_VARIANTS} варианта разбивки на сцены...")
     
     try:
-        generator = VideoGenerator()
+        generator = clients.video_generator
         num_scenes = extract_num_scenes_from_prompt(prompt)
         
-        scenes_result = await generator.enhance_prompt_with_gemini(
-            prompt=prompt,
-            num_scenes=num_scenes
-        )
-        
-        await state.update_data(
-            scenes=scenes_result["scenes"],
-            enhanced_prompt=scenes_result["enhanced_prompt"],
-            current_scene_index=0
+        # Несколько разбивок параллельно - выбор за один цикл вместо серии регенераций
+        result = await generator.enhance_prompt_variants(
+            prompt=prompt, num_scenes=num_scenes, scope=callback.message.chat.id
         )
+        variants = result["variants"]
+        if not variants:
+            await processing_msg.edit_text("❌ Не удалось разбить промт на сцены, попробуй еще раз")
+            return
         
-        await state.set_state(VideoStates.text_confirming_scenes)
         await processing_msg.delete()
-        await show_scene_for_confirmation(callback.message, state, 0)
+        if len(variants) == 1:
+            await apply_scene_plan(callback.message, state, variants, 0, result["cache_key"])
+            return
+        
+        await state.update_data(scene_plan_variants={"variants": variants, "cache_key": result["cache_key"]})
+        text = "🔄 Варианты разбивки на сцены:\n"
+        for i, variant in enumerate(variants, 1):
+            text += f"\n{'─' * 30}\n📋 Вариант {i}\n"
+            for scene in variant["scenes"]:
+                text += f"  {scene.get('id', '•')}. {scene.get('prompt', '')[:120]}\n"
+        await callback.message.answer(
+            text[:4000],
+            reply_markup=InlineKeyboardMarkup(
+                inline_keyboard=[
+                    [
+                        InlineKeyboardButton(text=f"✅ {i}", callback_data=f"scenes_pick_{i - 1}")
+                        for i in range(1, len(variants) + 1)
+                    ],
+                    [InlineKeyboardButton(text="🔄 Еще варианты", callback_data="scenes_regenerate_all")]
+                ]
+            )
+        )
         
     except Exception as e:
         logger.error(f"❌ Ошибка регенерации: {e}")
         await processing_msg.edit_text(f"❌ Ошибка: {str(e)}")
+    finally:
+        # В кэш - после генерации, иначе она сразу забрала бы их обратно
+        if shown:
+            result_cache.put(shown["cache_key"], shown["variants"])
+
+
+async def apply_scene_plan(message: types.Message, state: FSMContext, variants: list, chosen: int, cache_key: str):
+    """Применяет выбранную разбивку на сцены, остальные сохраняет в кэш вариантов"""
+    speculative.clear(message.chat.id, prefix="text:")
+    result_cache.put(cache_key, [variant for i, variant in enumerate(variants) if i != chosen])
+    await state.update_data(
+        scenes=variants[chosen]["scenes"],
+        enhanced_prompt=variants[chosen]["enhanced_prompt"],
+        current_scene_index=0,
+        scene_plan_variants=None
+    )
+    await state.set_state(VideoStates.text_confirming_scenes)
+    await show_scene_for_confirmation(message, state, 0)
+
+
+@router.callback_query(lambda c: c.data.startswith("scenes_pick_"))
+async def pick_scene_plan(callback: types.CallbackQuery, state: FSMContext):
+    """Выбор одного из вариантов разбивки на сцены"""
+    chosen = int(callback.data.replace("scenes_pick_", ""))
+    pending = (await state.get_data()).get("scene_plan_variants") or {}
+    if chosen >= len(pending.get("variants", [])):
+        await callback.answer("❌ Варианты устарели, нажми «Регенерировать все» еще раз", show_alert=True)
+        return
+    
+    await callback.answer(f"✅ Вариант {chosen + 1}")
+    await apply_scene_plan(callback.message, state, pending["variants"], chosen, pending["cache_key"])
+
+
+async def speculate_scene(chat_id: int, state: FSMContext, scene_index: int, idle: bool = False):
+    """
+    Фоновая генерация видео сцены до конца подтверждения (src.speculative)
+    
+    Сцене сразу назначаются seed, номер и формат - ровно те параметры, с которыми
+    ее сгенерирует start_video_generation; правка сцены делает запуск недействительным.
+    Если для сцены будут предложены черновики дешевле финала, в фоне генерируется
+    только черновик и только после одобрения сцены (не по бездействию).
+    """
+    data = await state.get_data()
+    scenes = data.get("scenes", [])
+    if scene_index >= len(scenes):
+        return
+    
+    generator = clients.video_generator
+    model_key = data.get("model_key", "kling")
+    scene = scenes[scene_index]
+    generator.ensure_seed(scene)
+    scene["scene_number"] = scene_index + 1
+    scene["aspect_ratio"] = data.get("aspect_ratio", "16:9")
+    await state.update_data(scenes=scenes)
+    
+    # Тот же выбор, что предложит offer_draft_mode после подтверждения всех сцен
+    plan = generator.draft_plan(scenes, model_key)
+    if plan is not None and plan["mode"] == "draft":
+        if idle:
+            return
+        params = generator.scene_params(scene, plan["model"], scene_index, draft=True)
+    else:
+        params = generator.scene_params(scene, model_key, scene_index)
+    run = speculative.schedule_idle if idle else speculative.start
+    run(chat_id, f"text:{scene_index + 1}", params, lambda: generator.generate_scene(**params),
+        generator.estimate_scene_cost(params))
+
+
+def take_speculations(chat_id: int, scenes: list, model: str, draft: bool = False) -> dict:
+    """
+    Фоновые генерации сцен с теми же параметрами (по индексу в scenes);
+    остальные фоновые генерации чата отменяются
+    """
+    generator = clients.video_generator
+    prefetched = {}
+    for i, scene in enumerate(scenes):
+        params = generator.scene_params(scene, model, i, draft=draft)
+        task = speculative.take(chat_id, f"text:{params['scene_number']}", params)
+        if task is not None:
+            prefetched[i] = task
+    speculative.clear(chat_id)
+    if prefetched:
+        logger.info(f"🔮 Готовы или уже генерируются в фоне: {len(prefetched)}/{len(scenes)} сцен")
+    return prefetched
+
+
+async def offer_draft_mode(message: types.Message, state: FSMContext):
+    """После подтверждения сцен: сначала черновики (или превью) или сразу финал"""
+    data = await state.get_data()
+    scenes = data.get("scenes", [])
+    model_key = data.get("model_key", "kling")
+    plan = clients.video_generator.draft_plan(scenes, model_key)
+    
+    if plan is None:
+        # Черновики не дешевле финала - сразу финальная генерация
+        await start_video_generation(message, state)
+        return
+    
+    await state.update_data(draft_mode=plan["mode"])
+    if plan["mode"] == "draft":
+        seed_note = " с тем же промтом и seed" if plan["same_seed"] else " с тем же промтом"
+        text = (
+            f"📝 Черновики - быстрые превью всех сцен в низком качестве "
+            f"(~${plan['cost']:.2f}, финал всех сцен ~${plan['final_cost']:.2f}). "
+            f"В финальном качестве генерируются только одобренные сцены{seed_note}."
+        )
+        button = "📝 Сначала черновики"
+    else:
+        text = (
+            f"👀 Превью - все сцены сразу в финальном качестве (~${plan['cost']:.2f}). "
+            f"Одобренные сцены войдут в видео без повторной генерации, "
+            f"для остальных можно получить новые варианты."
+        )
+        button = "👀 Сначала посмотреть сцены"
+    
+    await message.answer(
+        f"🎬 Сцены готовы: {len(scenes)}\n\n{text}",
+        reply_markup=InlineKeyboardMarkup(
+            inline_keyboard=[
+                [InlineKeyboardButton(text=button, callback_data="video_drafts")],
+                [InlineKeyboardButton(text="🎬 Сразу финал", callback_data="video_final_all")],
+                [InlineKeyboardButton(text="⬅️ Отмена", callback_data="back_to_menu")]
+            ]
+        )
+    )
+
+
+@router.callback_query(lambda c: c.data == "video_final_all")
+async def generate_final_without_drafts(callback: types.CallbackQuery, state: FSMContext):
+    """Финальная генерация всех сцен без черновиков"""
+    await callback.answer()
+    await start_video_generation(callback.message, state)
+
+
+@router.callback_query(lambda c: c.data == "video_drafts")
+async def generate_drafts(callback: types.CallbackQuery, state: FSMContext):
+    """Черновики всех сцен"""
+    await callback.answer()
+    data = await state.get_data()
+    await start_draft_generation(callback.message, state, list(range(len(data.get("scenes", [])))), reseed=False)
 
 
+def draft_review_keyboard(scenes: list, approved: list) -> InlineKeyboardMarkup:
+    """Кнопки одобрения черновиков: по кнопке на сцену, финал, новые черновики"""
+    toggles = [
+        InlineKeyboardButton(
+            text=f"{'✅' if i in approved else '⬜'} {i + 1}",
+            callback_data=f"draft_toggle_{i}"
+        )
+        for i in range(len(scenes))
+    ]
+    rows = [toggles[i:i + 5] for i in range(0, len(toggles), 5)]
+    rows.append([InlineKeyboardButton(text=f"🎬 Финал ({len(approved)} сцен)", callback_data="draft_final")])
+    if len(approved) < len(scenes):
+        rows.append([InlineKeyboardButton(text="🔄 Новые черновики для неодобренных", callback_data="draft_redo")])
+    rows.append([InlineKeyboardButton(text="⬅️ Отмена", callback_data="back_to_menu")])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+
+@cancellable(chat_id=lambda a: a["message"].chat.id)
+async def start_draft_generation(message: types.Message, state: FSMContext, indices: list, reseed: bool = True):
+    """
+    Генерирует черновики сцен indices параллельно и показывает их на одобрение
+    
+    Seed каждой сцены сохраняется в состоянии: финал одобренных сцен повторяет
+    промт и seed черновика. reseed - новые черновики с новым seed.
+    В режиме превью (draft_mode "preview") сцены генерируются в финальном
+    качестве, результаты сохраняются в draft_clips и идут в финал как есть.
+    """
+    await state.set_state(VideoStates.text_generating)
+    data = await state.get_data()
+    scenes = data.get("scenes", [])
+    model_key = data.get("model_key", "kling")
+    aspect_ratio = data.get("aspect_ratio", "16:9")
+    approved = data.get("draft_approved", [])
+    preview = data.get("draft_mode") == "preview"
+    draft_clips = data.get("draft_clips", {})
+    
+    for scene in scenes:
+        scene["aspect_ratio"] = aspect_ratio
+    for i in indices:
+        if reseed:
+            scenes[i].pop("seed", None)
+            speculative.cancel(message.chat.id, f"text:{i + 1}")
+        scenes[i]["scene_number"] = i + 1
+    
+    status_msg = await message.answer(
+        f"📝 Генерирую превью {len(indices)} сцен параллельно...\n\n"
+        f"⏳ Финальное качество - примерно 5-7 минут"
+        if preview else
+        f"📝 Генерирую черновики {len(indices)} сцен параллельно...\n\n"
+        f"⏳ Низкое качество - примерно 1-3 минуты",
+        reply_markup=cancel_keyboard()
+    )
+    
+    try:
+        generator = clients.video_generator
+        selected = [scenes[i] for i in indices]
+        if preview:
+            prefetched = take_speculations(message.chat.id, selected, model_key)
+            results = await generator.generate_multiple_scenes(selected, model=model_key, prefetched=prefetched)
+            for i, result in zip(indices, results):
+                if result.get("status") == "success":
+                    draft_clips[i] = result
+                else:
+                    draft_clips.pop(i, None)
+        else:
+            # Черновики, начатые после одобрения сцен; фоновых финалов в этом режиме нет
+            prefetched = take_speculations(
+                message.chat.id, selected, generator.draft_model(model_key), draft=True
+            )
+            results = await generator.generate_draft_scenes(selected, model=model_key, prefetched=prefetched)
+        await state.update_data(scenes=scenes, draft_clips=draft_clips)
+        await status_msg.delete()
+        
+        for i, result in zip(indices, results):
+            if result.get("status") != "success":
+                await message.answer(f"❌ Черновик сцены {i + 1}: {result.get('error', 'ошибка')}")
+                continue
+            await media_delivery.send_video(
+                message,
+                video_url=result["video_url"],
+                caption=f"📝 {'Превью' if preview else 'Черновик'} сцены {i + 1}: {scenes[i]['prompt'][:200]}"
+            )
+        
+        await state.set_state(VideoStates.text_reviewing_drafts)
+        await message.answer(
+            "👀 Отметь сцены, которые идут в финал.\n"
+            "Неотмеченные сцены в финальное видео не попадут.",
+            reply_markup=draft_review_keyboard(scenes, approved)
+        )
+        
+    except Exception as e:
+        logger.error(f"❌ Ошибка генерации черновиков: {e}")
+        await status_msg.edit_text(f"❌ Ошибка генерации черновиков: {str(e)}\n\nПопробуй еще раз с /start")
+        await state.clear()
+
+
+@router.callback_query(lambda c: c.data.startswith("draft_toggle_"))
+async def toggle_draft(callback: types.CallbackQuery, state: FSMContext):
+    """Одобрение / снятие одобрения черновика сцены"""
+    await callback.answer()
+    index = int(callback.data.replace("draft_toggle_", ""))
+    data = await state.get_data()
+    scenes = data.get("scenes", [])
+    approved = set(data.get("draft_approved", []))
+    approved ^= {index}
+    approved = sorted(i for i in approved if i < len(scenes))
+    await state.update_data(draft_approved=approved)
+    await callback.message.edit_reply_markup(reply_markup=draft_review_keyboard(scenes, approved))
+
+
+@router.callback_query(lambda c: c.data == "draft_redo")
+async def redo_drafts(callback: types.CallbackQuery, state: FSMContext):
+    """Новые черновики (с новым seed) для неодобренных сцен"""
+    await callback.answer()
+    data = await state.get_data()
+    approved = data.get("draft_approved", [])
+    rejected = [i for i in range(len(data.get("scenes", []))) if i not in approved]
+    await callback.message.edit_reply_markup(reply_markup=None)
+    await start_draft_generation(callback.message, state, rejected)
+
+
+@router.callback_query(lambda c: c.data == "draft_final")
+async def generate_final_from_drafts(callback: types.CallbackQuery, state: FSMContext):
+    """Финальная генерация одобренных сцен с промтом и seed черновиков"""
+    data = await state.get_data()
+    approved = data.get("draft_approved", [])
+    if not approved:
+        await callback.answer("❌ Отметь хотя бы одну сцену", show_alert=True)
+        return
+    
+    await callback.answer()
+    await callback.message.edit_reply_markup(reply_markup=None)
+    scenes = data.get("scenes", [])
+    # Превью в финальном качестве не генерируются повторно
+    draft_clips = data.get("draft_clips", {}) if data.get("draft_mode") == "preview" else {}
+    await state.update_data(
+        scenes=[scenes[i] for i in approved],
+        final_clips={new: draft_clips[old] for new, old in enumerate(approved) if old in draft_clips}
+    )
+    await start_video_generation(callback.message, state)
+
+
+async def _ready(result: dict) -> dict:
+    """Готовый результат сцены в роли запущенной генерации (generate_multiple_scenes prefetched)"""
+    return result
+
+
+@cancellable(chat_id=lambda a: a["message"].chat.id)
 async def start_video_generation(message: types.Message, state: FSMContext):
     """Начинает генерацию видео всех сцен"""
     from src.workflow_tracker import WorkflowTracker
@@ -643,12 +966,13 @@ async def start_video_generation(message: types.Message, state: FSMContext):
         f"{'─' * 40}\n"
         f"🎯 Сцены для генерации:\n\n{scenes_list}\n\n"
         f"{'─' * 40}\n"
-        f"⚡ Генерирую сцены ПАРАЛЛЕЛЬНО (очень быстро!)..."
+        f"⚡ Генерирую сцены ПАРАЛЛЕЛЬНО (очень быстро!)...",
+        reply_markup=cancel_keyboard()
     )
     
     try:
-        generator = VideoGenerator()
-        stitcher = VideoStitcher()
+        generator = clients.video_generator
+        stitcher = VideoStitcher(http_session=clients.http_session)
         
         if session_id:
             await session_logger.log_session_update(
@@ -667,13 +991,24 @@ async def start_video_generation(message: types.Message, state: FSMContext):
             f"{'─' * 40}\n"
             f"⏳ Отправляю {len(scenes)} запросов на Replicate API...\n"
             f"⚡ Все сцены генерируются одновременно!\n"
-            f"Это займет примерно 5-7 минут..."
+            f"Это займет примерно 5-7 минут...",
+            reply_markup=cancel_keyboard()
         )
         
+        # Сцены, которые уже генерируются в фоне с теми же параметрами, не запрашиваем заново
+        chat_id = message.chat.id
+        prefetched = take_speculations(chat_id, scenes, model_key)
+        # Одобренные превью в финальном качестве идут в видео как есть
+        for i, result in data.get("final_clips", {}).items():
+            if i in prefetched:
+                prefetched[i].cancel()
+            prefetched[i] = _ready(result)
+        
         scene_results = await generator.generate_multiple_scenes(
             scenes=scenes,
             model=model_key,
-            start_image_url=None
+            start_image_url=None,
+            prefetched=prefetched
         )
         
         logger.info(f"✅ Параллельная генерация завершена: {len(scene_results)} результатов")
@@ -689,10 +1024,12 @@ async def start_video_generation(message: types.Message, state: FSMContext):
         
         await generating_msg.edit_text(
             "📥 Скачиваю видео сцен...\n\n"
-            "⏳ Это займет 1-2 минуты..."
+            "⏳ Это займет 1-2 минуты...",
+            reply_markup=cancel_keyboard()
         )
         
         video_paths = []
+        downloaded = {}
         download_tasks = []
         
         for i, result in enumerate(scene_results):
@@ -706,7 +1043,7 @@ async def start_video_generation(message: types.Message, state: FSMContext):
                 
                 task = stitcher.download_video(
                     video_url,
-                    f"scene_{i + 1}.mp4"
+                    f"scene_{message.chat.id}_{i + 1}_{uuid.uuid4().hex[:8]}.mp4"
                 )
                 download_tasks.append((i + 1, task))
         
@@ -722,6 +1059,7 @@ async def start_video_generation(message: types.Message, state: FSMContext):
                     logger.error(f"❌ Сцена {scene_num}: Ошибка скачивания: {result}")
                 elif result:
                     video_paths.append(result)
+                    downloaded[scene_num - 1] = result
                     logger.info(f"✅ Сцена {scene_num}: Видео скачано в {result}")
                 else:
                     logger.warning(f"⚠️ Сцена {scene_num}: Скачивание вернуло None")
@@ -758,33 +1096,28 @@ async def start_video_generation(message: types.Message, state: FSMContext):
         
         await generating_msg.edit_text(
             "🎬 Объединяю видео с плавными переходами...\n\n"
-            "⏳ Это займет пару минут..."
+            "⏳ Это займет пару минут...",
+            reply_markup=cancel_keyboard()
         )
         
-        final_video_path = await stitcher.stitch_videos(
+        # Превью уходит пользователю, пока кодируется финальная версия
+        final_video_path = await media_delivery.stitch_and_deliver(
+            message,
+            stitcher,
             video_paths,
-            output_filename="final_video.mp4",
-            use_transitions=True
+            caption="✅ Видео готово!\n\n🎬 С плавными переходами 0.5 сек",
+            output_filename=f"final_{message.chat.id}_{uuid.uuid4().hex[:12]}.mp4",
+            aspect_ratio=aspect_ratio,
+            status_message=generating_msg
         )
         
         if not final_video_path:
             raise Exception("Не удалось объединить видео")
         
-        # Обновление workflow - завершение этапа 7, начало этапа 8
+        # Завершение workflow - склейка и отправка выполнены
         if workflow_id:
             tracker = WorkflowTracker()
             tracker.update_stage(workflow_id, 7, "completed", {"final_video": final_video_path})
-            tracker.update_stage(workflow_id, 8, "running", {"step": "Отправка в Telegram"})
-        
-        await generating_msg.delete()
-        await message.answer_video(
-            types.FSInputFile(final_video_path),
-            caption="✅ Видео готово!\n\n🎬 С плавными переходами 0.5 сек"
-        )
-        
-        # Завершение workflow - успешно
-        if workflow_id:
-            tracker = WorkflowTracker()
             tracker.update_stage(workflow_id, 8, "completed", {"delivered": True})
             tracker.complete_workflow(workflow_id, final_video_path)
         
@@ -803,6 +1136,18 @@ async def start_video_generation(message: types.Message, state: FSMContext):
                 processing_time=processing_time
             )
         
+        # Клипы остаются в графе сборки: правка сцены пересоберет только ее
+        if len(downloaded) == len(scenes):
+            build = session_builds.start(chat_id, model_key, aspect_ratio)
+            build.scenes = [generator.scene_params(scene, model_key, i) for i, scene in enumerate(scenes)]
+            for i, params in enumerate(build.scenes):
+                build.adopt_clip(params, downloaded[i], scene_results[i].get("video_url"))
+            build.adopt_final(build.final_key(build.scenes, VIDEO_ENCODER_PROFILE), final_video_path)
+            await message.answer(
+                "✏️ Хочешь поменять сцену? Перегенерирую только ее, остальное останется как есть.",
+                reply_markup=rebuild_keyboard(build)
+            )
+        
         await stitcher.cleanup_temp_files()
         logger.info("✅ Генерация завершена успешно")
         
@@ -838,6 +1183,135 @@ async def start_video_generation(message: types.Message, state: FSMContext):
         await state.clear()
 
 
+def rebuild_keyboard(build) -> InlineKeyboardMarkup:
+    """Кнопки правки сцен доставленного видео"""
+    buttons = [
+        InlineKeyboardButton(text=f"✏️ Сцена {i + 1}", callback_data=f"rebuild_edit_{i}")
+        for i in range(len(build.scenes))
+    ]
+    rows = [buttons[i:i + 3] for i in range(0, len(buttons), 3)]
+    rows.append([InlineKeyboardButton(text="⬅️ В меню", callback_data="back_to_menu")])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+
+@router.callback_query(lambda c: c.data.startswith("rebuild_edit_"))
+async def edit_delivered_scene(callback: types.CallbackQuery, state: FSMContext):
+    """Правка сцены уже доставленного видео"""
+    scene_index = int(callback.data.replace("rebuild_edit_", ""))
+    build = session_builds.get(callback.message.chat.id)
+    if build is None or scene_index >= len(build.scenes):
+        await callback.answer("❌ Видео устарело, создай новое через /start", show_alert=True)
+        return
+    
+    await callback.answer()
+    await state.set_state(VideoStates.text_rebuild_editing)
+    await state.update_data(rebuild_index=scene_index)
+    await callback.message.answer(
+        f"✏️ Сцена {scene_index + 1}\n\n"
+        f"Текущий промт:\n{build.scenes[scene_index]['prompt']}\n\n"
+        f"Напиши новый промт - перегенерирую только эту сцену:",
+        reply_markup=InlineKeyboardMarkup(
+            inline_keyboard=[[InlineKeyboardButton(text="⬅️ Отмена", callback_data="back_to_menu")]]
+        )
+    )
+
+
+@router.message(VideoStates.text_rebuild_editing)
+async def process_delivered_scene_edit(message: types.Message, state: FSMContext):
+    """Новый промт сцены доставленного видео"""
+    data = await state.get_data()
+    scene_index = data.get("rebuild_index", 0)
+    await state.clear()
+    await start_incremental_render(message, {scene_index: message.text})
+
+
+@cancellable(chat_id=lambda a: a["message"].chat.id)
+async def start_incremental_render(message: types.Message, edits: dict):
+    """
+    Пересборка доставленного видео по графу сборки (src.build_graph)
+    
+    Генерируются только сцены, у которых изменились аргументы генерации,
+    перекодируются только их сегменты, итог склеивается копированием потоков.
+    
+    Args:
+        message: Сообщение пользователя
+        edits: Новые промты по индексу сцены
+    """
+    chat_id = message.chat.id
+    build = session_builds.get(chat_id)
+    if build is None:
+        await message.answer("❌ Видео устарело, создай новое через /start")
+        return
+    
+    scenes = [dict(params) for params in build.scenes]
+    for index, prompt in edits.items():
+        if index < len(scenes):
+            scenes[index]["prompt"] = prompt
+    stale = build.stale(scenes)
+    
+    status_msg = await message.answer(
+        f"🔁 Пересобираю видео: сцен к генерации {len(stale)} из {len(scenes)}...\n\n"
+        f"⏳ Остальные сцены берутся готовыми",
+        reply_markup=cancel_keyboard()
+    )
+    
+    try:
+        generator = clients.video_generator
+        stitcher = VideoStitcher(http_session=clients.http_session)
+        
+        results = await asyncio.gather(*(generator.generate_scene(**scenes[i]) for i in stale))
+        failed = [result for result in results if result.get("status") != "success"]
+        if failed:
+            raise Exception(f"Не удалось сгенерировать сцену {failed[0].get('scene_number', '?')}: {failed[0].get('error')}")
+        
+        await status_msg.edit_text("📥 Скачиваю новые сцены...", reply_markup=cancel_keyboard())
+        paths = await asyncio.gather(*(
+            stitcher.download_video(result["video_url"], f"rebuild_{chat_id}_{i + 1}_{uuid.uuid4().hex[:8]}.mp4")
+            for i, result in zip(stale, results)
+        ))
+        for i, result, path in zip(stale, results, paths):
+            if not path:
+                raise Exception(f"Не удалось скачать сцену {i + 1}")
+            build.adopt_clip(scenes[i], path, result["video_url"])
+        
+        # Готовые клипы - та же экономия, что и попадание в кэш
+        for i in set(range(len(scenes))) - set(stale):
+            ledger.record_cache_hit(
+                "generate_scene", model=scenes[i]["model"], saved_usd=generator.estimate_scene_cost(scenes[i])
+            )
+        
+        final_key = build.final_key(scenes, VIDEO_ENCODER_PROFILE)
+        if build.final and build.final["key"] == final_key and Path(build.final["path"]).exists():
+            final_path = build.final["path"]
+        else:
+            await status_msg.edit_text("🎬 Склеиваю видео...", reply_markup=cancel_keyboard())
+            # Сегменты неизмененных сцен и переходов между ними уже в кэше склейки
+            final_path = await stitcher.stitch_videos(
+                build.clip_paths(scenes),
+                output_filename=f"final_{chat_id}_{final_key[:12]}.mp4",
+                aspect_ratio=build.aspect_ratio
+            )
+            if not final_path:
+                raise Exception("Не удалось объединить видео")
+        
+        build.scenes = scenes
+        build.prune(scenes)
+        final_path = build.adopt_final(final_key, final_path)["path"]
+        
+        await status_msg.delete()
+        await media_delivery.send_video(
+            message,
+            final_path,
+            caption=f"✅ Видео обновлено! Перегенерировано сцен: {len(stale)} из {len(scenes)}"
+        )
+        await message.answer("✏️ Поменять еще сцену?", reply_markup=rebuild_keyboard(build))
+        
+    except Exception as e:
+        logger.error(f"❌ Ошибка пересборки: {e}")
+        await status_msg.edit_text(f"❌ Ошибка пересборки видео:\n\n{str(e)}\n\nМожно попробовать еще раз")
+        await message.answer("✏️ Выбери сцену", reply_markup=rebuild_keyboard(build))
+
+
 # ==================== ПОДПОТОК 2: ТЕКСТ + ФОТО → ВИДЕО ====================
 
 @router.callback_query(lambda c: c.data == "video_text_photo")
@@ -1076,7 +1550,7 @@ async def process_text_photo_prompt(message: types.Message, state: FSMContext):
     )
     
     try:
-        generator = VideoGenerator()
+        generator = clients.video_generator
         
         scenes_result = await generator.enhance_prompt_with_gemini(
             prompt=message.text,
@@ -1127,6 +1601,7 @@ async def show_text_photo_scene_for_photo(message: types.Message, state: FSMCont
         f"📐 Соотношение: {aspect_ratio}\n\n"
         f"{'─' * 40}\n"
         f"📸 Загрузи фото для этой сцены (JPG/PNG):"
+        + (f"\n💡 Можно отправить альбомом фото сразу для сцен {scene_index + 1}–{len(scenes)}" if scene_index + 1 < len(scenes) else "")
     )
     
     keyboard = InlineKeyboardMarkup(
@@ -1143,34 +1618,59 @@ async def show_text_photo_scene_for_photo(message: types.Message, state: FSMCont
 
 @router.message(VideoStates.text_photo_confirming_scene_photo)
 async def process_text_photo_scene_photo(message: types.Message, state: FSMContext):
-    """Обработка загруженного фото для сцены"""
+    """Обработка загруженного фото для сцены (или альбома фото для нескольких сцен подряд)"""
     if message.photo:
+        # Альбом приходит отдельными сообщениями: обрабатывает его первое сообщение
+        messages = await media_groups.collect(message)
+        if messages is None:
+            return
+        
         data = await state.get_data()
         scene_index = data.get("current_scene_index", 0)
         scenes = data.get("scenes", [])
         
+        # Фото альбома по порядку - следующим сценам без фото, лишние игнорируем
+        scene_photos = data.get("scene_photos", {})
+        targets = [i for i in range(scene_index, len(scenes)) if i not in scene_photos] or [scene_index]
+        photos = [m.photo[-1].file_id for m in messages if m.photo][:len(targets)]
+        indexes = targets[:len(photos)]
+        
         try:
-            uploader = ImageUploader()
-            image_url = await uploader.process_telegram_photo(
+            uploader = clients.image_uploader
+            image_urls = await uploader.process_telegram_photos(
                 message.bot,
-                message.photo[-1].file_id,
-                photo_name=f"scene_{scene_index + 1}"
+                photos,
+                photo_names=[f"scene_{i + 1}" for i in indexes]
             )
             
-            if image_url:
-                scene_photos = data.get("scene_photos", {})
-                scene_photos[scene_index] = image_url
-                
-                await state.update_data(scene_photos=scene_photos)
-                
-                logger.info(f"✅ Фото сцены {scene_index + 1} загружено: {image_url}")
-                
-                await message.answer(f"✅ Фото для сцены {scene_index + 1} загружено!")
-                await show_text_photo_scene_for_photo(message, state, scene_index + 1)
-                return
-            else:
+            uploaded, failed = [], []
+            for i, image_url in zip(indexes, image_urls):
+                if not image_url:
+                    failed.append(i)
+                    continue
+                scene_photos[i] = image_url
+                uploaded.append(i)
+                logger.info(f"✅ Фото сцены {i + 1} загружено: {image_url}")
+            
+            await state.update_data(scene_photos=scene_photos)
+            
+            if not uploaded:
                 await message.answer("❌ Ошибка при загрузке фото. Попробуй еще раз.")
                 return
+            
+            if len(uploaded) == 1:
+                await message.answer(f"✅ Фото для сцены {uploaded[0] + 1} загружено!")
+            else:
+                await message.answer(f"✅ Фото для сцен {', '.join(str(i + 1) for i in uploaded)} загружены!")
+            if failed:
+                await message.answer(
+                    f"⚠️ Не загрузились фото для сцен {', '.join(str(i + 1) for i in failed)} - "
+                    f"отправь их еще раз, остальные фото сохранены"
+                )
+            # Дальше - первая сцена без фото (загруженные фото альбома не запрашиваются повторно)
+            next_index = next((i for i in range(len(scenes)) if i not in scene_photos), len(scenes))
+            await show_text_photo_scene_for_photo(message, state, next_index)
+            return
                 
         except Exception as e:
             logger.error(f"❌ Ошибка загрузки фото: {e}")
@@ -1185,6 +1685,7 @@ async def process_text_photo_scene_photo(message: types.Message, state: FSMConte
     await message.answer("❌ Отправь фото для этой сцены или напиши /отмена")
 
 
+@cancellable(chat_id=lambda a: a["message"].chat.id)
 async def start_text_photo_video_generation(message: types.Message, state: FSMContext):
     """Начинает генерацию видео для режима Текст+Фото"""
     await state.set_state(VideoStates.text_photo_generating)
@@ -1213,12 +1714,13 @@ async def start_text_photo_video_generation(message: types.Message, state: FSMCo
         f"{'─' * 40}\n"
         f"🎯 Сцены для генерации:\n\n{scenes_list}\n\n"
         f"{'─' * 40}\n"
-        f"⚡ Генерирую видео для каждой сцены с её фото..."
+        f"⚡ Генерирую видео для каждой сцены с её фото...",
+        reply_markup=cancel_keyboard()
     )
     
     try:
-        generator = VideoGenerator()
-        stitcher = VideoStitcher()
+        generator = clients.video_generator
+        stitcher = VideoStitcher(http_session=clients.http_session)
         
         # 📊 Логирование параметров генерации в Airtable
         session_id = data.get("session_id")
@@ -1253,7 +1755,8 @@ async def start_text_photo_video_generation(message: types.Message, state: FSMCo
             f"{'─' * 40}\n"
             f"⏳ Отправляю {len(scenes)} запросов на Replicate API...\n"
             f"⚡ Все сцены генерируются одновременно!\n"
-            f"Это займет примерно 5-7 минут..."
+            f"Это займет примерно 5-7 минут...",
+            reply_markup=cancel_keyboard()
         )
         
         # Генерируем видео с фото для каждой сцены ПАРАЛЛЕЛЬНО
@@ -1282,7 +1785,8 @@ async def start_text_photo_video_generation(message: types.Message, state: FSMCo
         
         await generating_msg.edit_text(
             "📥 Скачиваю видео сцен...\n\n"
-            "⏳ Это займет 1-2 минуты..."
+            "⏳ Это займет 1-2 минуты...",
+            reply_markup=cancel_keyboard()
         )
         
         video_paths = []
@@ -1299,7 +1803,7 @@ async def start_text_photo_video_generation(message: types.Message, state: FSMCo
                 
                 task = stitcher.download_video(
                     video_url,
-                    f"scene_{i + 1}.mp4"
+                    f"scene_{message.chat.id}_{i + 1}_{uuid.uuid4().hex[:8]}.mp4"
                 )
                 download_tasks.append((i + 1, task))
         
@@ -1355,24 +1859,23 @@ async def start_text_photo_video_generation(message: types.Message, state: FSMCo
         
         await generating_msg.edit_text(
             "🎬 Объединяю видео с плавными переходами...\n\n"
-            "⏳ Это займет пару минут..."
+            "⏳ Это займет пару минут...",
+            reply_markup=cancel_keyboard()
         )
         
-        final_video_path = await stitcher.stitch_videos(
+        final_video_path = await media_delivery.stitch_and_deliver(
+            message,
+            stitcher,
             video_paths,
-            output_filename="final_video.mp4",
-            use_transitions=True
+            caption="✅ Видео готово!\n\n🎬 С плавными переходами 0.5 сек",
+            output_filename=f"final_{message.chat.id}_{uuid.uuid4().hex[:12]}.mp4",
+            aspect_ratio=aspect_ratio,
+            status_message=generating_msg
         )
         
         if not final_video_path:
             raise Exception("Не удалось объединить видео")
         
-        await generating_msg.delete()
-        await message.answer_video(
-            types.FSInputFile(final_video_path),
-            caption="✅ Видео готово!\n\n🎬 С плавными переходами 0.5 сек"
-        )
-        
         await stitcher.cleanup_temp_files()
         logger.info("✅ Генерация завершена успешно")
         
@@ -0,0 +1,195 @@
+"""
+Отмена запущенных генераций
+
+Каждая генерация регистрируется как задача чата (декоратор cancellable).
+Код пайплайна находит текущую задачу через current_job() и сообщает о ресурсах,
+которые нужно освобождать при отмене:
+    - предсказания Replicate (отменяются по ID, GPU перестает тратиться);
+    - файлы (скачанные сцены, результаты склейки) - удаляются;
+    - маркер отмены в рабочей папке задачи - его проверяет кодирование
+      в пуле процессов (media_jobs._run_ffmpeg) и прерывает ffmpeg.
+
+jobs.cancel(chat_id) отменяет дерево asyncio задач генерации, предсказания,
+кодирование и очищает рабочую папку.
+"""
+import asyncio
+import contextvars
+import functools
+import inspect
+import logging
+import shutil
+import sys
+import uuid
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional, Set
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+
+from src.config import JOBS_DIR, JOB_CANCEL_GRACE
+from src.log_setup import current_context
+from src.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+CANCEL_CALLBACK = "cancel_generation"
+
+JOBS_CANCELLED = registry.counter(
+    "jobs_cancelled_total",
+    "Generation jobs cancelled by users"
+)
+PREDICTIONS_CANCELLED = registry.counter(
+    "replicate_predictions_cancelled_total",
+    "Replicate predictions cancelled before completion"
+)
+
+_current_job: contextvars.ContextVar[Optional["Job"]] = contextvars.ContextVar("current_job", default=None)
+
+
+def current_job() -> Optional["Job"]:
+    """Задача генерации, в которой выполняется текущий код"""
+    return _current_job.get()
+
+
+def cancel_keyboard() -> InlineKeyboardMarkup:
+    """Кнопка отмены для сообщений о ходе генерации"""
+    return InlineKeyboardMarkup(
+        inline_keyboard=[[InlineKeyboardButton(text="⏹ Отменить", callback_data=CANCEL_CALLBACK)]]
+    )
+
+
+class Job:
+    """Запущенная генерация и ресурсы, которые нужно освободить при отмене"""
+
+    def __init__(self, chat_id: int, session_id: Optional[str], task: asyncio.Task):
+        self.chat_id = chat_id
+        self.session_id = session_id
+        self.id = session_id or uuid.uuid4().hex[:12]
+        self.task = task
+        self.cancelled = False
+        self.workspace = Path(JOBS_DIR) / self.id
+        self.predictions: Dict[str, Callable[[], Awaitable]] = {}
+        self.files: Set[Path] = set()
+
+    @property
+    def cancel_marker(self) -> str:
+        """Файл-флаг отмены для процессов пула (создается при отмене)"""
+        return str(self.workspace / ".cancel")
+
+    def add_prediction(self, prediction_id: str, cancel: Callable[[], Awaitable]):
+        """Регистрирует предсказание Replicate и функцию его отмены"""
+        self.predictions[prediction_id] = cancel
+
+    def remove_prediction(self, prediction_id: str):
+        self.predictions.pop(prediction_id, None)
+
+    def track_file(self, path) -> None:
+        """Файл задачи, удаляемый при отмене"""
+        if path:
+            self.files.add(Path(path))
+
+    def _touch_marker(self):
+        try:
+            self.workspace.mkdir(parents=True, exist_ok=True)
+            Path(self.cancel_marker).touch()
+        except OSError as e:
+            logger.warning(f"⚠️ Не удалось создать маркер отмены {self.cancel_marker}: {e}")
+
+    def cleanup(self):
+        """Удаляет файлы и рабочую папку задачи"""
+        for path in self.files:
+            try:
+                path.unlink(missing_ok=True)
+            except OSError as e:
+                logger.warning(f"⚠️ Не удалось удалить {path}: {e}")
+        self.files.clear()
+        shutil.rmtree(self.workspace, ignore_errors=True)
+
+
+class JobRegistry:
+    """Активные генерации по чатам (одна на чат)"""
+
+    def __init__(self):
+        self._jobs: Dict[int, Job] = {}
+
+    def get(self, chat_id: int) -> Optional[Job]:
+        return self._jobs.get(chat_id)
+
+    @asynccontextmanager
+    async def track(self, chat_id: int, session_id: Optional[str] = None) -> AsyncIterator[Job]:
+        """Регистрирует текущую asyncio задачу как генерацию чата"""
+        job = Job(chat_id, session_id or current_context().get("session_id"), asyncio.current_task())
+        previous = self._jobs.get(chat_id)
+        if previous is not None and not previous.task.done():
+            logger.info(f"ℹ️ Чат {chat_id}: запущена новая генерация, предыдущая продолжается")
+        self._jobs[chat_id] = job
+        token = _current_job.set(job)
+        try:
+            yield job
+        except asyncio.CancelledError:
+            if job.cancelled:
+                logger.info(f"⏹ Генерация {job.id} отменена")
+            raise
+        finally:
+            _current_job.reset(token)
+            if self._jobs.get(chat_id) is job:
+                del self._jobs[chat_id]
+            if not job.cancelled:
+                shutil.rmtree(job.workspace, ignore_errors=True)
+
+    async def cancel(self, chat_id: int) -> bool:
+        """
+        Отменяет генерацию чата
+
+        Returns:
+            True, если генерация была запущена и отменена
+        """
+        job = self._jobs.get(chat_id)
+        if job is None or job.task.done():
+            return False
+
+        job.cancelled = True
+        predictions = len(job.predictions)
+        logger.info(f"⏹ Отменяю генерацию {job.id}: предсказаний Replicate {predictions}")
+        # Маркер - до отмены задач: кодирование в пуле должно увидеть его сразу
+        job._touch_marker()
+        pending_predictions = list(job.predictions.values())
+        job.task.cancel()
+
+        # Предсказания отменяются и из дерева задач (ReplicateProvider), здесь - страховка
+        # для тех, чей вызов уже не успеет обработать отмену
+        if pending_predictions:
+            await asyncio.gather(*(cancel() for cancel in pending_predictions), return_exceptions=True)
+        await asyncio.wait({job.task}, timeout=JOB_CANCEL_GRACE)
+
+        job.cleanup()
+        JOBS_CANCELLED.inc()
+        return True
+
+
+def cancellable(chat_id: Callable[[Dict], int]):
+    """
+    Декоратор генерации, которую пользователь может отменить
+
+    Args:
+        chat_id: Функция от аргументов вызова (имя → значение), возвращающая ID чата
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            async with jobs.track(chat_id(bound.arguments)):
+                return await func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+# Глобальный экземпляр
+jobs = JobRegistry()
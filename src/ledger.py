@@ -0,0 +1,300 @@
+"""
+Учет стоимости и времени генераций
+
+Каждый завершенный этап пайплайна (см. src.metrics.instrument_stage) и каждое
+попадание в кэш записывается в append-only таблицу SQLite: сессия, пользователь,
+модель, статус, время выполнения, оплачиваемые единицы (секунды видео, фото),
+стоимость по прайсу из models/parameters, число повторов.
+
+Запись идет в отдельном потоке через очередь - event loop не ждет диск.
+Агрегаты: totals() по пользователю/сессии/модели/этапу, cache_savings().
+
+Отчет из консоли:
+    python -m src.ledger [--hours 24] [--by user_id]
+"""
+import argparse
+import asyncio
+import logging
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import closing
+from pathlib import Path
+from typing import Dict, List, Optional
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.config import LEDGER_DB_PATH
+from models.registry import model_registry
+from src.log_setup import current_context
+from src.metrics import add_stage_observer
+
+logger = logging.getLogger(__name__)
+
+GROUP_COLUMNS = ("user_id", "session_id", "model", "stage")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ledger (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts REAL NOT NULL,
+    session_id TEXT,
+    user_id INTEGER,
+    stage TEXT NOT NULL,
+    model TEXT,
+    status TEXT NOT NULL,
+    wall_time REAL NOT NULL DEFAULT 0,
+    units REAL NOT NULL DEFAULT 0,
+    unit TEXT,
+    cost_usd REAL NOT NULL DEFAULT 0,
+    retries INTEGER NOT NULL DEFAULT 0,
+    cache_hit INTEGER NOT NULL DEFAULT 0,
+    saved_usd REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS ledger_ts ON ledger (ts);
+CREATE INDEX IF NOT EXISTS ledger_user ON ledger (user_id, ts);
+CREATE INDEX IF NOT EXISTS ledger_session ON ledger (session_id);
+"""
+
+COLUMNS = (
+    "ts", "session_id", "user_id", "stage", "model", "status", "wall_time",
+    "units", "unit", "cost_usd", "retries", "cache_hit", "saved_usd"
+)
+
+
+def load_pricing() -> Dict[str, Dict]:
+    """
+    Прайс моделей из реестра (models/parameters/*.json)
+
+    Returns:
+        {model_id: {"per_second": ..., "per_image": ...}}
+    """
+    return {spec.model_id: spec.pricing for spec in model_registry.load().values() if spec.pricing}
+
+
+class Ledger:
+    """Append-only журнал стоимости и времени этапов"""
+
+    def __init__(self, db_path: str = LEDGER_DB_PATH):
+        self.db_path = Path(db_path)
+        self._pricing: Optional[Dict[str, Dict]] = None
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._writer: Optional[threading.Thread] = None
+        self._writer_lock = threading.Lock()
+        self._schema_ready = False
+
+    @property
+    def pricing(self) -> Dict[str, Dict]:
+        """Прайс моделей (читается при первом обращении)"""
+        if self._pricing is None:
+            self._pricing = load_pricing()
+        return self._pricing
+
+    def price_per_second(self, model_id: str) -> float:
+        """Цена секунды видео для модели (0 если нет в прайсе)"""
+        return float(self.pricing.get(model_id, {}).get("per_second", 0))
+
+    def estimate_cost(self, model_id: str, units: float, unit: str) -> float:
+        """Стоимость units единиц (second, image) по прайсу"""
+        price = self.pricing.get(model_id, {}).get(f"per_{unit}", 0)
+        return round(float(price) * units, 6)
+
+    def _connect(self) -> sqlite3.Connection:
+        """Соединение с журналом (схема и WAL создаются один раз на процесс)"""
+        if not self._schema_ready:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            with closing(sqlite3.connect(self.db_path)) as conn:
+                # journal_mode=WAL сохраняется в файле базы
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.executescript(SCHEMA)
+            self._schema_ready = True
+        return sqlite3.connect(self.db_path)
+
+    def _ensure_writer(self):
+        if self._writer is None or not self._writer.is_alive():
+            with self._writer_lock:
+                if self._writer is None or not self._writer.is_alive():
+                    self._writer = threading.Thread(target=self._write_loop, name="ledger-writer", daemon=True)
+                    self._writer.start()
+
+    def _write_loop(self):
+        """Поток записи: забирает накопившиеся записи пачкой и пишет одной транзакцией"""
+        conn = self._connect()
+        placeholders = ", ".join("?" for _ in COLUMNS)
+        sql = f"INSERT INTO ledger ({', '.join(COLUMNS)}) VALUES ({placeholders})"
+        try:
+            while True:
+                batch = [self._queue.get()]
+                while True:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                stop = None in batch
+                rows = [row for row in batch if row is not None]
+                if rows:
+                    try:
+                        with conn:
+                            conn.executemany(sql, rows)
+                    except Exception as e:
+                        logger.warning(f"⚠️ Не удалось записать {len(rows)} записей в журнал стоимости: {e}")
+                if stop:
+                    return
+        finally:
+            conn.close()
+
+    def record(
+        self,
+        stage: str,
+        model: str = "",
+        status: str = "ok",
+        wall_time: float = 0.0,
+        units: float = 0.0,
+        unit: str = "",
+        cost_usd: float = 0.0,
+        retries: int = 0,
+        cache_hit: bool = False,
+        saved_usd: float = 0.0,
+        session_id: Optional[str] = None,
+        user_id: Optional[int] = None
+    ):
+        """
+        Добавляет запись (неблокирующе). session_id/user_id по умолчанию
+        берутся из контекста логирования текущей задачи.
+        """
+        context = current_context()
+        row = (
+            time.time(),
+            session_id if session_id is not None else context.get("session_id"),
+            user_id if user_id is not None else context.get("user_id"),
+            stage, model, status, wall_time, units, unit, cost_usd,
+            retries, int(cache_hit), saved_usd,
+        )
+        self._ensure_writer()
+        self._queue.put(row)
+
+    def record_cache_hit(self, stage: str, model: str = "", saved_usd: float = 0.0, wall_time: float = 0.0):
+        """Учитывает попадание в кэш (saved_usd - сэкономленная стоимость)"""
+        self.record(stage, model=model, status="cache_hit", wall_time=wall_time, cache_hit=True, saved_usd=saved_usd)
+
+    def _on_stage(self, run: Dict):
+        """Наблюдатель этапов из src.metrics"""
+        arguments = run["arguments"]
+        # Роутер мог переключиться на другую модель - фактические значения в результате
+        result = run["result"] if isinstance(run["result"], dict) else {}
+        model_key = result.get("model") or run["model"]
+        model_id, units, unit = model_key, 0.0, ""
+        spec = model_registry.get(model_key) if model_key else None
+        if spec is not None:
+            # Оплачиваются секунды видео или штуки фото - по категории модели
+            model_id = spec.model_id
+            unit = "second" if spec.category == "video" else "image"
+            if run["status"] == "ok":
+                duration = result.get("duration") or arguments.get("duration") or 0
+                units = float(duration) if unit == "second" else 1.0
+        self.record(
+            run["stage"],
+            model=model_id,
+            status=run["status"],
+            wall_time=run["elapsed"],
+            units=units,
+            unit=unit,
+            cost_usd=self.estimate_cost(model_id, units, unit) if units else 0.0,
+            retries=run["retries"],
+        )
+
+    def close(self, timeout: float = 5.0):
+        """Дописывает очередь и останавливает поток записи"""
+        if self._writer is not None and self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join(timeout)
+        self._writer = None
+
+    # === Агрегаты ===
+
+    def query_totals(self, group_by: str = "model", since: Optional[float] = None, limit: int = 50) -> List[Dict]:
+        """
+        Суммы по группам, по убыванию стоимости
+
+        Args:
+            group_by: user_id, session_id, model или stage
+            since: Unix time начала периода
+            limit: Максимум строк
+        """
+        if group_by not in GROUP_COLUMNS:
+            raise ValueError(f"group_by должен быть одним из {GROUP_COLUMNS}")
+        sql = f"""
+            SELECT {group_by} AS key,
+                   COUNT(*) AS calls,
+                   SUM(status = 'error') AS errors,
+                   SUM(units) AS units,
+                   ROUND(SUM(cost_usd), 4) AS cost_usd,
+                   ROUND(SUM(wall_time), 2) AS wall_time,
+                   ROUND(AVG(wall_time), 2) AS avg_wall_time,
+                   SUM(retries) AS retries,
+                   SUM(cache_hit) AS cache_hits,
+                   ROUND(SUM(saved_usd), 4) AS saved_usd
+            FROM ledger
+            WHERE ts >= ?
+            GROUP BY {group_by}
+            ORDER BY cost_usd DESC, calls DESC
+            LIMIT ?
+        """
+        with closing(self._connect()) as conn:
+            conn.row_factory = sqlite3.Row
+            return [dict(row) for row in conn.execute(sql, (since or 0, limit))]
+
+    def query_cache_savings(self, since: Optional[float] = None) -> Dict:
+        """Сколько попаданий в кэш и сколько денег и времени они сэкономили"""
+        sql = """
+            SELECT stage, COUNT(*) AS hits, ROUND(SUM(saved_usd), 4) AS saved_usd
+            FROM ledger
+            WHERE cache_hit = 1 AND ts >= ?
+            GROUP BY stage
+        """
+        with closing(self._connect()) as conn:
+            conn.row_factory = sqlite3.Row
+            by_stage = [dict(row) for row in conn.execute(sql, (since or 0,))]
+        return {
+            "hits": sum(row["hits"] for row in by_stage),
+            "saved_usd": round(sum(row["saved_usd"] or 0 for row in by_stage), 4),
+            "by_stage": by_stage,
+        }
+
+    async def totals(self, group_by: str = "model", since: Optional[float] = None, limit: int = 50) -> List[Dict]:
+        """query_totals вне event loop"""
+        return await asyncio.to_thread(self.query_totals, group_by, since, limit)
+
+    async def cache_savings(self, since: Optional[float] = None) -> Dict:
+        """query_cache_savings вне event loop"""
+        return await asyncio.to_thread(self.query_cache_savings, since)
+
+
+# Глобальный экземпляр
+ledger = Ledger()
+add_stage_observer(ledger._on_stage)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Отчет по стоимости и времени генераций")
+    parser.add_argument("--hours", type=float, default=24.0, help="Период отчета в часах")
+    parser.add_argument("--by", choices=GROUP_COLUMNS, default="model", help="Группировка")
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    since = time.time() - args.hours * 3600
+    rows = ledger.query_totals(args.by, since, args.limit)
+    print(f"📊 Стоимость за {args.hours:g} ч по {args.by}")
+    print(f"{'key':<40} {'calls':>6} {'errors':>6} {'units':>8} {'cost $':>9} {'time s':>9} {'retries':>7}")
+    for row in rows:
+        print(
+            f"{str(row['key']):<40} {row['calls']:>6} {row['errors']:>6} {row['units'] or 0:>8g} "
+            f"{row['cost_usd'] or 0:>9.2f} {row['wall_time'] or 0:>9.1f} {row['retries']:>7}"
+        )
+    savings = ledger.query_cache_savings(since)
+    print(f"\n💾 Попаданий в кэш: {savings['hits']}, сэкономлено ${savings['saved_usd']:.2f}")
+
+
+if __name__ == "__main__":
+    main()
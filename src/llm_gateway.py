@@ -0,0 +1,185 @@
+"""
+Асинхронный шлюз к LLM (Groq и Gemini)
+
+Все текстовые запросы к LLM идут через этот модуль:
+- только нативные async API (AsyncOpenAI для Groq, generate_content_async для Gemini),
+  поэтому event loop не блокируется;
+- общий таймаут на запрос;
+- hedged retries: если ответ не пришел за hedge_delay, параллельно уходит
+  повторная попытка, побеждает первая успешная; упавшая попытка заменяется новой
+  после паузы, если это разрешает политика (класс ошибки, бюджет повторов, дедлайн)
+  из src.retry_policy;
+- семафор на провайдера ограничивает число одновременных запросов.
+"""
+import asyncio
+import logging
+import sys
+import time
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.config import (
+    LLM_TIMEOUT,
+    GROQ_MAX_CONCURRENCY, GROQ_HEDGE_DELAY,
+    GEMINI_MAX_CONCURRENCY, GEMINI_HEDGE_DELAY
+)
+from src.clients import clients
+from src.retry_policy import RetryPolicy, GROQ, GEMINI
+
+logger = logging.getLogger(__name__)
+
+GROQ_DEFAULT_MODEL = "llama-3.3-70b-versatile"
+GEMINI_DEFAULT_MODEL = "gemini-2.0-flash"
+
+
+class LLMGateway:
+    """Единая точка вызова LLM с таймаутами, hedging и лимитами"""
+
+    def __init__(self):
+        self._limits = {
+            "groq": asyncio.Semaphore(GROQ_MAX_CONCURRENCY),
+            "gemini": asyncio.Semaphore(GEMINI_MAX_CONCURRENCY),
+        }
+        self._hedge_delays = {
+            "groq": GROQ_HEDGE_DELAY,
+            "gemini": GEMINI_HEDGE_DELAY,
+        }
+        self._policies: Dict[str, RetryPolicy] = {
+            "groq": GROQ,
+            "gemini": GEMINI,
+        }
+
+    async def _call(
+        self,
+        provider: str,
+        request: Callable[[], Awaitable[str]],
+        timeout: float = LLM_TIMEOUT,
+        max_attempts: Optional[int] = None
+    ) -> str:
+        """
+        Выполняет запрос с hedging и общим таймаутом
+
+        Args:
+            provider: groq или gemini
+            request: Фабрика корутины одной попытки
+            timeout: Общий дедлайн запроса в секундах
+            max_attempts: Максимум попыток (включая hedge), по умолчанию - из политики
+
+        Returns:
+            Текст ответа (исключение последней попытки пробрасывается)
+        """
+        limit = self._limits[provider]
+        hedge_delay = self._hedge_delays[provider]
+        policy = self._policies[provider]
+        max_attempts = max_attempts or policy.max_attempts
+        loop = asyncio.get_running_loop()
+        started = time.monotonic()
+        deadline = loop.time() + timeout
+        retries_by_class: Dict[str, int] = {}
+
+        async def attempt(delay: float = 0.0) -> str:
+            if delay:
+                await asyncio.sleep(delay)
+            async with limit:
+                return await request()
+
+        policy.budget.on_request()
+        pending = {asyncio.create_task(attempt())}
+        launched = 1
+        last_error: Exception = asyncio.TimeoutError(f"{provider}: таймаут {timeout}с")
+
+        try:
+            while pending:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    raise asyncio.TimeoutError(f"{provider}: таймаут {timeout}с")
+
+                wait_time = min(hedge_delay, remaining) if launched < max_attempts else remaining
+                done, pending = await asyncio.wait(pending, timeout=wait_time, return_when=asyncio.FIRST_COMPLETED)
+
+                for task in done:
+                    if task.exception() is None:
+                        if launched > 1:
+                            logger.info(f"⚡ {provider}: ответ получен с попытки из {launched}")
+                        return task.result()
+                    last_error = task.exception()
+                    logger.warning(f"⚠️ {provider}: попытка не удалась ({type(last_error).__name__}: {last_error})")
+                    # Упавшую попытку заменяем, только если политика разрешает повтор
+                    if launched < max_attempts and not pending:
+                        decision = policy.allow_retry(last_error, launched, started, retries_by_class)
+                        if decision is None:
+                            raise last_error
+                        pending.add(asyncio.create_task(attempt(decision[1])))
+                        launched += 1
+
+                # Ответа нет - параллельный запрос, если хватает бюджета повторов
+                if not done and launched < max_attempts and policy.budget.try_spend():
+                    logger.info(f"⏱️ {provider}: нет ответа за {hedge_delay}с, отправляю параллельный запрос")
+                    pending.add(asyncio.create_task(attempt()))
+                    launched += 1
+
+            raise last_error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def groq_chat(
+        self,
+        messages: List[Dict],
+        temperature: float = 0.7,
+        model: str = GROQ_DEFAULT_MODEL,
+        timeout: float = LLM_TIMEOUT
+    ) -> str:
+        """
+        Chat completion через Groq
+
+        Args:
+            messages: Сообщения в формате OpenAI
+            temperature: Температура
+            model: Модель Groq
+
+        Returns:
+            Текст ответа без пробелов по краям
+        """
+        # Повторы делает шлюз, встроенные ретраи SDK отключаем
+        client = clients.groq.with_options(max_retries=0)
+
+        async def request() -> str:
+            response = await client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature
+            )
+            return response.choices[0].message.content.strip()
+
+        return await self._call("groq", request, timeout=timeout)
+
+    async def gemini_generate(
+        self,
+        prompt: str,
+        model: str = GEMINI_DEFAULT_MODEL,
+        timeout: float = LLM_TIMEOUT
+    ) -> str:
+        """
+        Генерация текста через Gemini (нативный async API)
+
+        Args:
+            prompt: Промт
+            model: Модель Gemini
+
+        Returns:
+            Текст ответа без пробелов по краям
+        """
+        gemini_model = clients.gemini_model(model)
+
+        async def request() -> str:
+            response = await gemini_model.generate_content_async(prompt)
+            return response.text.strip()
+
+        return await self._call("gemini", request, timeout=timeout)
+
+
+# Глобальный экземпляр
+llm_gateway = LLMGateway()
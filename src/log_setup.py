@@ -0,0 +1,189 @@
+"""
+Структурированное логирование
+
+- JSON записи (LOG_FORMAT=json) или привычный текст (LOG_FORMAT=text);
+- поля контекста session_id/user_id/scene берутся из contextvars, поэтому
+  попадают во все записи хэндлера и запущенных из него задач;
+- выборочное логирование частых событий: logger.info(..., extra={"event": "replicate.payload"})
+  пропускается с вероятностью из LOG_SAMPLE_RATES ("replicate.payload=0.05,...");
+- запись в поток вывода идет через QueueHandler/QueueListener в отдельном
+  потоке, event loop только кладет запись в очередь.
+"""
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Optional
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.config import LOG_LEVEL, LOG_FORMAT, LOG_SAMPLE_RATES
+
+# Поля контекста, которые добавляются в каждую запись
+CONTEXT_FIELDS = ("session_id", "user_id", "scene")
+
+_context_vars: Dict[str, contextvars.ContextVar] = {
+    name: contextvars.ContextVar(f"log_{name}", default=None) for name in CONTEXT_FIELDS
+}
+
+# Стандартные атрибуты LogRecord - все остальное считается полями из extra
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def bind_context(**fields):
+    """Устанавливает поля контекста для текущей задачи (и задач, созданных из нее)"""
+    for name, value in fields.items():
+        if name in _context_vars:
+            _context_vars[name].set(value)
+
+
+def current_context() -> Dict:
+    """Текущие значения полей контекста (без пустых)"""
+    return {name: var.get() for name, var in _context_vars.items() if var.get() is not None}
+
+
+@contextmanager
+def log_context(**fields):
+    """Временно устанавливает поля контекста (например, номер сцены)"""
+    tokens = [
+        (_context_vars[name], _context_vars[name].set(value))
+        for name, value in fields.items() if name in _context_vars
+    ]
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+def parse_sample_rates(spec: str) -> Dict[str, float]:
+    """Разбирает строку вида "event=0.1,other=0.5" """
+    rates = {}
+    for item in (spec or "").split(","):
+        if "=" not in item:
+            continue
+        event, rate = item.split("=", 1)
+        try:
+            rates[event.strip()] = max(0.0, min(1.0, float(rate)))
+        except ValueError:
+            continue
+    return rates
+
+
+class ContextFilter(logging.Filter):
+    """Копирует поля контекста в запись (выполняется в потоке вызывающего кода)"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        for name, var in _context_vars.items():
+            if not hasattr(record, name):
+                value = var.get()
+                if value is not None:
+                    setattr(record, name, value)
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускает долю записей события; предупреждения и ошибки не сэмплируются"""
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        event = getattr(record, "event", None)
+        if event is None or record.levelno >= logging.WARNING:
+            return True
+        rate = self.rates.get(event, 1.0)
+        return rate >= 1.0 or random.random() < rate
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна JSON строка на запись"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                data[key] = value
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            data["exc"] = record.exc_text
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Текстовый формат с полями контекста в квадратных скобках"""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s%(context)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        context = " ".join(
+            f"{name}={getattr(record, name)}" for name in CONTEXT_FIELDS if hasattr(record, name)
+        )
+        record.context = f" [{context}]" if context else ""
+        return super().format(record)
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler без форматирования в потоке вызова: msg % args собирается в фоновом потоке"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return copy.copy(record)
+
+
+def setup_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT, sample_rates: str = LOG_SAMPLE_RATES):
+    """
+    Настраивает корневой логгер: фильтры в потоке вызова, вывод - в фоновом потоке
+
+    Args:
+        level: Уровень логирования (INFO, DEBUG...)
+        fmt: json или text
+        sample_rates: Доли сэмплирования событий ("event=0.1,...")
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = LazyQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(parse_sample_rates(sample_rates)))
+    queue_handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    root.handlers.clear()
+    root.addHandler(queue_handler)
+    root.setLevel(level.upper())
+
+    # Библиотеки на DEBUG очень многословны
+    for noisy in ("aiogram.event", "httpx", "httpcore", "urllib3", "asyncio"):
+        logging.getLogger(noisy).setLevel(max(logging.INFO, root.level))
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+
+
+def shutdown_logging():
+    """Дописывает очередь и останавливает фоновый поток"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
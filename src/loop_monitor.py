@@ -0,0 +1,171 @@
+"""
+Мониторинг здоровья event loop
+
+- Пробник каждые LOOP_MONITOR_INTERVAL секунд засыпает и измеряет, насколько
+  позже запланированного он проснулся - это лаг loop (гистограмма).
+- Сторожевой поток следит за "сердцебиением" пробника. Если loop не отвечает
+  дольше порога, поток снимает стек потока loop прямо во время блокировки -
+  в стеке видно, какой синхронный вызов заморозил бота.
+- Медленные стеки пишутся в лог и доступны на /debug/loop (src.monitoring_server).
+"""
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from pathlib import Path
+from typing import Dict, List, Optional
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.config import LOOP_MONITOR_INTERVAL, LOOP_LAG_THRESHOLD_MS
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограммы лага, мс
+LAG_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+# Сколько последних блокировок хранить для /debug/loop
+MAX_STALLS = 20
+
+# Период сводки в debug-лог, секунды
+SUMMARY_INTERVAL = 60
+
+
+class LoopMonitor:
+    """Гистограмма лага event loop и детектор блокирующих вызовов"""
+
+    def __init__(self, interval: float = LOOP_MONITOR_INTERVAL, threshold_ms: float = LOOP_LAG_THRESHOLD_MS):
+        self.interval = interval
+        self.threshold = threshold_ms / 1000
+        self.bucket_counts = [0] * (len(LAG_BUCKETS_MS) + 1)
+        self.lag_sum_ms = 0.0
+        self.lag_count = 0
+        self.lag_max_ms = 0.0
+        # Последние MAX_STALLS блокировок со стеками; счетчик - за все время
+        self.stalls: deque = deque(maxlen=MAX_STALLS)
+        self.stalls_total = 0
+
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self._loop_thread_id: Optional[int] = None
+        self._heartbeat = time.monotonic()
+        self._captured_heartbeat: Optional[float] = None
+
+    def observe(self, lag_ms: float):
+        """Добавляет измерение лага в гистограмму"""
+        for i, bound in enumerate(LAG_BUCKETS_MS):
+            if lag_ms <= bound:
+                self.bucket_counts[i] += 1
+                break
+        else:
+            self.bucket_counts[-1] += 1
+        self.lag_sum_ms += lag_ms
+        self.lag_count += 1
+        self.lag_max_ms = max(self.lag_max_ms, lag_ms)
+
+    async def _probe(self):
+        """Пробник лага: сон на interval и замер опоздания"""
+        loop = asyncio.get_running_loop()
+        last_summary = loop.time()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            lag_ms = max(0.0, (loop.time() - started - self.interval) * 1000)
+            self._heartbeat = time.monotonic()
+            self.observe(lag_ms)
+
+            if lag_ms >= self.threshold * 1000:
+                logger.warning(f"🐢 Лаг event loop: {lag_ms:.0f} мс")
+
+            if loop.time() - last_summary >= SUMMARY_INTERVAL:
+                last_summary = loop.time()
+                snapshot = self.get_snapshot()
+                logger.debug(
+                    f"📈 Event loop: измерений {snapshot['count']}, средний лаг {snapshot['avg_ms']:.1f} мс, "
+                    f"максимум {snapshot['max_ms']:.0f} мс, блокировок {self.stalls_total}"
+                )
+
+    def _watch(self):
+        """Сторожевой поток: снимает стек потока loop во время блокировки"""
+        check_every = max(self.threshold / 2, 0.01)
+        while not self._stop_event.wait(check_every):
+            heartbeat = self._heartbeat
+            blocked_for = time.monotonic() - heartbeat - self.interval
+            if blocked_for < self.threshold or self._captured_heartbeat == heartbeat:
+                continue
+
+            # Один снимок на одну блокировку
+            self._captured_heartbeat = heartbeat
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            stack = "".join(traceback.format_stack(frame))
+            self.stalls.append({
+                "detected_at": time.time(),
+                "blocked_ms": round(blocked_for * 1000),
+                "stack": stack,
+            })
+            self.stalls_total += 1
+            logger.warning(f"🧊 Event loop заблокирован уже {blocked_for * 1000:.0f} мс, стек:\n{stack}")
+
+    def start(self):
+        """Запускает пробник и сторожевой поток (вызывать внутри event loop)"""
+        if self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stop_event.clear()
+        self._task = asyncio.create_task(self._probe())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+        logger.info(f"🩺 Мониторинг event loop запущен (порог {self.threshold * 1000:.0f} мс)")
+
+    async def stop(self):
+        """Останавливает мониторинг"""
+        self._stop_event.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def get_snapshot(self) -> Dict:
+        """Текущее состояние для debug-эндпоинта"""
+        return {
+            "count": self.lag_count,
+            "avg_ms": self.lag_sum_ms / self.lag_count if self.lag_count else 0.0,
+            "max_ms": self.lag_max_ms,
+            "threshold_ms": self.threshold * 1000,
+            "buckets": dict(zip([str(b) for b in LAG_BUCKETS_MS] + ["+Inf"], self.bucket_counts)),
+            "stalls_total": self.stalls_total,
+            "stalls": list(self.stalls),
+        }
+
+    def render_prometheus(self) -> List[str]:
+        """Гистограмма лага в текстовом формате Prometheus"""
+        lines = [
+            "# HELP event_loop_lag_seconds Event loop scheduling lag",
+            "# TYPE event_loop_lag_seconds histogram",
+        ]
+        cumulative = 0
+        for bound, count in zip(LAG_BUCKETS_MS, self.bucket_counts):
+            cumulative += count
+            lines.append(f'event_loop_lag_seconds_bucket{{le="{bound / 1000}"}} {cumulative}')
+        cumulative += self.bucket_counts[-1]
+        lines.append(f'event_loop_lag_seconds_bucket{{le="+Inf"}} {cumulative}')
+        lines.append(f"event_loop_lag_seconds_sum {self.lag_sum_ms / 1000}")
+        lines.append(f"event_loop_lag_seconds_count {self.lag_count}")
+        lines.append("# HELP event_loop_stalls_total Loop blocks longer than the threshold with captured stacks")
+        lines.append("# TYPE event_loop_stalls_total counter")
+        lines.append(f"event_loop_stalls_total {self.stalls_total}")
+        return lines
+
+
+# Глобальный экземпляр
+loop_monitor = LoopMonitor()
@@ -14,25 +14,50 @@ from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.fsm.context import FSMContext
 
 from src.config import BOT_TOKEN
-from src.handlers import video_handler, animation_handler, photo_handler, photo_ai_handler, settings_handler
-
-# Настройка логирования
-logging.basicConfig(level=logging.DEBUG)
+from generators.media_pool import media_pool
+from src.clients import clients
+from src.monitoring_server import monitoring_server
+from src.log_setup import setup_logging, shutdown_logging, bind_context
+from src.ledger import ledger
+from src.jobs import jobs, CANCEL_CALLBACK
+from src.speculative import speculative
+from models.registry import model_registry
+
+# Настройка логирования (JSON, уровень из LOG_LEVEL, запись в фоновом потоке)
+setup_logging()
 logger = logging.getLogger(__name__)
 
 
-
 # Инициализация
 storage = MemoryStorage()
 bot = Bot(token=BOT_TOKEN)
 dp = Dispatcher(storage=storage)
 
-# Регистрируем хэндлеры из отдельных модулей
-dp.include_router(video_handler.router)
-dp.include_router(animation_handler.router)
-dp.include_router(photo_handler.router)
-dp.include_router(photo_ai_handler.router)
-dp.include_router(settings_handler.router)
+
+async def log_context_middleware(handler, event, data):
+    """Добавляет user_id и session_id из FSM во все логи обработки события"""
+    user = data.get("event_from_user")
+    session_id = None
+    state = data.get("state")
+    if state is not None:
+        session_id = (await state.get_data()).get("session_id")
+    bind_context(user_id=user.id if user else None, session_id=session_id)
+    return await handler(event, data)
+
+
+dp.message.outer_middleware(log_context_middleware)
+dp.callback_query.outer_middleware(log_context_middleware)
+
+
+def register_routers():
+    """Регистрирует хэндлеры из отдельных модулей (импорт - только при запуске бота)"""
+    from src.handlers import video_handler, animation_handler, photo_handler, photo_ai_handler, settings_handler
+    
+    dp.include_router(video_handler.router)
+    dp.include_router(animation_handler.router)
+    dp.include_router(photo_handler.router)
+    dp.include_router(photo_ai_handler.router)
+    dp.include_router(settings_handler.router)
 
 
 def create_main_menu_keyboard():
@@ -64,10 +89,31 @@ async def cmd_start(message: types.Message):
     )
 
 
+@dp.callback_query(lambda c: c.data == CANCEL_CALLBACK)
+async def cancel_generation(callback: types.CallbackQuery, state: FSMContext):
+    """Отмена запущенной генерации: задачи, предсказания Replicate, кодирование, файлы"""
+    cancelled = await jobs.cancel(callback.message.chat.id)
+    speculative.clear(callback.message.chat.id)
+    await callback.answer("⏹ Генерация отменена" if cancelled else "Генерация уже завершена")
+    await state.clear()
+    
+    if cancelled:
+        try:
+            await callback.message.edit_reply_markup(reply_markup=None)
+        except Exception:
+            pass
+        await callback.message.answer(
+            "⏹ Генерация отменена.\n\n👋 Выбери, что ты хочешь сделать:",
+            reply_markup=create_main_menu_keyboard()
+        )
+
+
 @dp.callback_query(lambda c: c.data == "back_to_menu")
 async def back_to_menu(callback: types.CallbackQuery, state: FSMContext):
-    """Возврат в главное меню"""
+    """Возврат в главное меню (запущенная генерация отменяется)"""
     await callback.answer()
+    await jobs.cancel(callback.message.chat.id)
+    speculative.clear(callback.message.chat.id)
     await state.clear()
     
     keyboard = create_main_menu_keyboard()
@@ -93,8 +139,20 @@ async def cmd_help(message: types.Message):
 
 async def main():
     """Главная функция"""
+    register_routers()
+    # Схемы моделей проверяются при старте, а не на первом запросе пользователя
+    model_registry.load()
+    await monitoring_server.start()
+    await clients.warm_up()
     logger.info("🚀 Бот запущен...")
-    await dp.start_polling(bot)
+    try:
+        await dp.start_polling(bot)
+    finally:
+        await monitoring_server.stop()
+        await clients.close()
+        media_pool.shutdown()
+        ledger.close()
+        shutdown_logging()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,63 @@
+"""
+Сборка альбомов (media group) из входящих сообщений
+
+Telegram присылает альбом отдельными сообщениями с общим media_group_id,
+и aiogram обрабатывает их параллельно. Первое сообщение альбома ждет,
+пока поток сообщений не затихнет, и получает весь альбом; остальные
+сообщения альбома получают None и ничего не делают.
+"""
+import asyncio
+import logging
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from aiogram import types
+
+from src.config import MEDIA_GROUP_WAIT
+
+logger = logging.getLogger(__name__)
+
+
+class MediaGroupCollector:
+    """Буфер сообщений альбомов по media_group_id"""
+
+    def __init__(self, wait: float = MEDIA_GROUP_WAIT):
+        self.wait = wait
+        self._groups: Dict[str, List[types.Message]] = {}
+
+    async def collect(self, message: types.Message) -> Optional[List[types.Message]]:
+        """
+        Добавляет сообщение в альбом
+
+        Returns:
+            Все сообщения альбома по порядку (для первого сообщения альбома),
+            [message] для одиночного сообщения, None для остальных сообщений альбома
+        """
+        group_id = message.media_group_id
+        if not group_id:
+            return [message]
+
+        if group_id in self._groups:
+            self._groups[group_id].append(message)
+            return None
+
+        self._groups[group_id] = [message]
+        try:
+            # Ждем, пока не перестанут приходить новые сообщения альбома
+            received = 0
+            while received != len(self._groups[group_id]):
+                received = len(self._groups[group_id])
+                await asyncio.sleep(self.wait)
+        finally:
+            messages = self._groups.pop(group_id)
+
+        messages.sort(key=lambda m: m.message_id)
+        logger.info(f"🗂️ Альбом {group_id}: {len(messages)} сообщений")
+        return messages
+
+
+# Глобальный экземпляр
+media_groups = MediaGroupCollector()
@@ -0,0 +1,106 @@
+"""
+Реестр отправленных в Telegram медиа
+
+После первой отправки Telegram возвращает file_id - по нему тот же файл
+можно отправить повторно без загрузки. Реестр хранит соответствие
+"хеш артефакта → file_id" в JSON файле. Ключ артефакта - хеш содержимого
+локального файла или хеш URL для результатов, которые лежат в облаке.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+REGISTRY_FILE = Path(__file__).parent.parent / "data" / "media_registry.json"
+
+
+def _hash_file(path: str) -> str:
+    """SHA-256 содержимого файла (читается блоками)"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class MediaRegistry:
+    """Соответствие хешей артефактов и Telegram file_id"""
+
+    def __init__(self, registry_file: Path = REGISTRY_FILE):
+        self.registry_file = registry_file
+        self._entries: Optional[Dict[str, Dict]] = None
+        self._lock = asyncio.Lock()
+
+    def _load(self) -> Dict[str, Dict]:
+        """Загружает реестр с диска при первом обращении"""
+        if self._entries is None:
+            try:
+                if self.registry_file.exists():
+                    with open(self.registry_file, "r", encoding="utf-8") as f:
+                        self._entries = json.load(f)
+                else:
+                    self._entries = {}
+            except Exception as e:
+                logger.warning(f"⚠️ Не удалось загрузить реестр медиа: {e}")
+                self._entries = {}
+        return self._entries
+
+    def _write(self, entries: Dict[str, Dict]):
+        """Атомарно записывает реестр на диск"""
+        self.registry_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.registry_file.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entries, f, ensure_ascii=False, indent=2)
+        tmp_path.replace(self.registry_file)
+
+    async def file_key(self, path: str) -> str:
+        """Ключ артефакта по содержимому локального файла"""
+        return "sha256:" + await asyncio.to_thread(_hash_file, path)
+
+    @staticmethod
+    def url_key(url: str) -> str:
+        """Ключ артефакта по URL (URL результатов Replicate уникальны)"""
+        return "url:" + hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+    def find_file_id(self, keys: List[str]) -> Optional[str]:
+        """Возвращает file_id по первому известному ключу"""
+        for key in keys:
+            file_id = self.get_file_id(key)
+            if file_id:
+                return file_id
+        return None
+
+    def get_file_id(self, key: str) -> Optional[str]:
+        """Возвращает сохраненный file_id или None"""
+        entry = self._load().get(key)
+        return entry["file_id"] if entry else None
+
+    async def remember(self, keys: List[str], file_id: str, kind: str):
+        """
+        Сохраняет file_id артефакта
+
+        Args:
+            keys: Ключи артефакта (см. file_key, url_key)
+            file_id: Telegram file_id
+            kind: Тип медиа (video, photo)
+        """
+        async with self._lock:
+            entries = self._load()
+            if all(entries.get(key, {}).get("file_id") == file_id for key in keys):
+                return
+            for key in keys:
+                entries[key] = {"file_id": file_id, "kind": kind, "created_at": int(time.time())}
+            snapshot = dict(entries)
+            try:
+                await asyncio.to_thread(self._write, snapshot)
+            except Exception as e:
+                logger.warning(f"⚠️ Не удалось сохранить реестр медиа: {e}")
+
+
+# Глобальный экземпляр
+media_registry = MediaRegistry()
@@ -0,0 +1,342 @@
+"""
+Метрики пайплайна генерации в формате Prometheus
+
+Простые Counter, Gauge и Histogram с метками без внешних зависимостей.
+Экспортируются через src.monitoring_server (/metrics).
+
+Основной способ инструментирования - декоратор instrument_stage: он считает
+время выполнения этапа (гистограмма по stage/model/status) и число
+выполняющихся вызовов (gauge). Статус определяется по результату: функции
+пайплайна не бросают исключения, а возвращают None/False или словарь
+со "status": "error"; отмененный вызов (src.jobs) получает статус cancelled.
+Завершенные вызовы передаются наблюдателям
+(add_stage_observer) - так их учитывает src.ledger.
+"""
+import asyncio
+import contextvars
+import functools
+import inspect
+import re
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+# Границы корзин для длительности этапов, секунды (от загрузки фото до генерации видео)
+STAGE_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+REPLICATE_ERROR_RE = re.compile(r"\b(E\d{3,5})\b")
+
+# Счетчик повторов текущего вызова этапа (общий для вложенных вызовов в одной задаче)
+_current_retries: contextvars.ContextVar = contextvars.ContextVar("stage_retries", default=None)
+
+# Наблюдатели завершенных вызовов этапов
+_stage_observers: List[Callable[[Dict], None]] = []
+
+
+def _escape(value: str) -> str:
+    """Экранирует значение метки"""
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    """Форматирует набор меток {a="1",b="2"}"""
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    """Базовая метрика с метками"""
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        """Значения меток в порядке labelnames"""
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Монотонно растущий счетчик"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        for key, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    """Значение, которое может расти и уменьшаться"""
+
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    """Гистограмма распределения значений"""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = STAGE_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # ключ меток -> [счетчики корзин..., +Inf], сумма
+        self._counts: Dict[Tuple[str, ...], List[int]] = {}
+        self._sums: Dict[Tuple[str, ...], float] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        counts = self._counts.setdefault(key, [0] * (len(self.buckets) + 1))
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        else:
+            counts[-1] += 1
+        self._sums[key] = self._sums.get(key, 0.0) + value
+
+    def get_count(self, **labels) -> int:
+        return sum(self._counts.get(self._key(labels), []))
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        for key in sorted(self._counts):
+            counts = self._counts[key]
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, 'le="%s"' % bound)
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {self._sums[key]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Набор метрик процесса"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Метрика {metric.name} уже зарегистрирована")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = STAGE_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> List[str]:
+        """Все метрики в текстовом формате Prometheus"""
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return lines
+
+
+# Глобальный реестр
+registry = MetricsRegistry()
+
+STAGE_DURATION = registry.histogram(
+    "pipeline_stage_duration_seconds",
+    "Duration of generation pipeline stages",
+    ("stage", "model", "status")
+)
+STAGE_IN_FLIGHT = registry.gauge(
+    "pipeline_stage_in_flight",
+    "Pipeline stage calls currently running",
+    ("stage",)
+)
+REPLICATE_ERRORS = registry.counter(
+    "replicate_errors_total",
+    "Replicate API errors by error code",
+    ("stage", "code")
+)
+STAGE_RETRIES = registry.counter(
+    "pipeline_retries_total",
+    "Retries of pipeline stages by reason",
+    ("stage", "reason")
+)
+TRANSFER_BYTES = registry.counter(
+    "transfer_bytes_total",
+    "Bytes downloaded and uploaded by the pipeline",
+    ("direction", "target")
+)
+
+
+def replicate_error_code(error: Union[Exception, str]) -> str:
+    """Код ошибки Replicate (E004, E005, E6716...) или имя типа исключения"""
+    match = REPLICATE_ERROR_RE.search(str(error))
+    if match:
+        return match.group(1)
+    return type(error).__name__ if isinstance(error, Exception) else "unknown"
+
+
+def record_replicate_error(stage: str, error: Union[Exception, str]) -> str:
+    """Учитывает ошибку Replicate и возвращает ее код"""
+    code = replicate_error_code(error)
+    REPLICATE_ERRORS.inc(stage=stage, code=code)
+    return code
+
+
+def record_retry(stage: str, reason: str):
+    """Учитывает повтор этапа (в метрике и в счетчике текущего вызова)"""
+    STAGE_RETRIES.inc(stage=stage, reason=reason)
+    retries = _current_retries.get()
+    if retries is not None:
+        retries[0] += 1
+
+
+def add_stage_observer(callback: Callable[[Dict], None]):
+    """
+    Регистрирует наблюдателя завершенных вызовов этапов
+
+    callback получает словарь: stage, model, status, elapsed, retries, arguments, result
+    """
+    if callback not in _stage_observers:
+        _stage_observers.append(callback)
+
+
+def _notify_observers(run: Dict):
+    for callback in _stage_observers:
+        try:
+            callback(run)
+        except Exception:
+            # Учет не должен ломать пайплайн
+            pass
+
+
+def record_transfer(direction: str, target: str, size: Optional[int]):
+    """Учитывает переданные байты (direction: download/upload)"""
+    if size:
+        TRANSFER_BYTES.inc(size, direction=direction, target=target)
+
+
+def _result_status(result) -> str:
+    """ok/error по соглашениям пайплайна о возвращаемых значениях"""
+    if result is None or result is False:
+        return "error"
+    if isinstance(result, dict):
+        if result.get("status") == "error" or result.get("success") is False:
+            return "error"
+    return "ok"
+
+
+def instrument_stage(
+    stage: str,
+    model: Union[str, Callable[[Dict], str]] = "",
+    when: Optional[Callable[[Dict], bool]] = None
+):
+    """
+    Декоратор async функции этапа пайплайна
+
+    Args:
+        stage: Имя этапа (метка stage)
+        model: Метка model - строка или функция от аргументов вызова (имя → значение)
+        when: Условие от аргументов вызова; если False - вызов не учитывается
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        def bind(args, kwargs) -> Dict:
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            return bound.arguments
+
+        def resolve_model(arguments: Dict) -> str:
+            if not callable(model):
+                return model
+            try:
+                return str(model(arguments) or "")
+            except Exception:
+                return ""
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            try:
+                arguments = bind(args, kwargs)
+            except TypeError:
+                # Неверные аргументы - пусть ошибку выдаст сама функция
+                return await func(*args, **kwargs)
+            if when is not None and not when(arguments):
+                return await func(*args, **kwargs)
+
+            model_label = resolve_model(arguments)
+            status = "error"
+            result = None
+            retries = [0]
+            retries_token = _current_retries.set(retries)
+            STAGE_IN_FLIGHT.inc(stage=stage)
+            started = time.perf_counter()
+            try:
+                result = await func(*args, **kwargs)
+                status = _result_status(result)
+                return result
+            except asyncio.CancelledError:
+                status = "cancelled"
+                raise
+            finally:
+                elapsed = time.perf_counter() - started
+                _current_retries.reset(retries_token)
+                STAGE_IN_FLIGHT.dec(stage=stage)
+                STAGE_DURATION.observe(elapsed, stage=stage, model=model_label, status=status)
+                _notify_observers({
+                    "stage": stage,
+                    "model": model_label,
+                    "status": status,
+                    "elapsed": elapsed,
+                    "retries": retries[0],
+                    "arguments": arguments,
+                    "result": result,
+                })
+
+        return wrapper
+    return decorator
@@ -0,0 +1,75 @@
+"""
+Локальный HTTP эндпоинт мониторинга
+
+- /metrics - метрики в текстовом формате Prometheus
+- /debug/loop - состояние event loop и стеки последних блокировок (JSON)
+
+По умолчанию слушает только 127.0.0.1 (METRICS_HOST, METRICS_PORT).
+"""
+import logging
+import sys
+from pathlib import Path
+from typing import Optional
+
+from aiohttp import web
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.config import METRICS_HOST, METRICS_PORT
+from src.loop_monitor import loop_monitor
+from src.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+
+async def handle_metrics(request: web.Request) -> web.Response:
+    """Метрики в формате Prometheus"""
+    lines = registry.render() + loop_monitor.render_prometheus()
+    return web.Response(text="\n".join(lines) + "\n", content_type="text/plain")
+
+
+async def handle_debug_loop(request: web.Request) -> web.Response:
+    """Гистограмма лага и стеки блокировок"""
+    return web.json_response(loop_monitor.get_snapshot())
+
+
+class MonitoringServer:
+    """aiohttp сервер метрик, работает в том же event loop, что и бот"""
+
+    def __init__(self, host: str = METRICS_HOST, port: int = METRICS_PORT):
+        self.host = host
+        self.port = port
+        self._runner: Optional[web.AppRunner] = None
+
+    def create_app(self) -> web.Application:
+        """Создает приложение с маршрутами мониторинга"""
+        app = web.Application()
+        app.router.add_get("/metrics", handle_metrics)
+        app.router.add_get("/debug/loop", handle_debug_loop)
+        return app
+
+    async def start(self):
+        """Запускает мониторинг loop и HTTP сервер (если порт задан)"""
+        loop_monitor.start()
+        if not self.port:
+            logger.info("📊 Эндпоинт метрик выключен (METRICS_PORT=0)")
+            return
+        try:
+            self._runner = web.AppRunner(self.create_app(), access_log=None)
+            await self._runner.setup()
+            await web.TCPSite(self._runner, self.host, self.port).start()
+            logger.info(f"📊 Метрики: http://{self.host}:{self.port}/metrics")
+        except OSError as e:
+            logger.warning(f"⚠️ Не удалось запустить эндпоинт метрик: {e}")
+            self._runner = None
+
+    async def stop(self):
+        """Останавливает сервер и мониторинг"""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+        await loop_monitor.stop()
+
+
+# Глобальный экземпляр
+monitoring_server = MonitoringServer()
@@ -50,7 +50,19 @@ class PromptsManager:
     """Управление системными промтами"""
     
     def __init__(self):
-        self.prompts = self._load_prompts()
+        # Файл читается при первом обращении, а не при импорте модуля
+        self._prompts = None
+    
+    @property
+    def prompts(self) -> dict:
+        """Промты (загружаются с диска при первом обращении)"""
+        if self._prompts is None:
+            self._prompts = self._load_prompts()
+        return self._prompts
+    
+    @prompts.setter
+    def prompts(self, value: dict):
+        self._prompts = value
     
     def _load_prompts(self) -> dict:
         """Загрузить промты из файла или использовать дефолтные"""
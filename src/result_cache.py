@@ -0,0 +1,90 @@
+"""
+Кэш невыбранных вариантов генерации
+
+Когда пользователь выбирает один из нескольких параллельных вариантов,
+остальные кладутся сюда по ключу запроса (чат, вид, модель, параметры).
+Следующий запрос того же чата с теми же параметрами (например, «Переделать»
+после выбора) сначала забирает готовые варианты из кэша - мгновенно и без
+оплаты генерации. Другие пользователи чужие варианты не получают.
+Попадания учитываются в журнале стоимости (ledger.record_cache_hit).
+
+Результаты с URL Replicate живут ограниченное время, поэтому записи
+устаревают через RESULT_CACHE_TTL.
+"""
+import hashlib
+import json
+import logging
+import sys
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.config import RESULT_CACHE_TTL, RESULT_CACHE_MAX_KEYS
+
+logger = logging.getLogger(__name__)
+
+
+class ResultCache:
+    """Невыбранные результаты генерации по ключу запроса (в памяти процесса)"""
+
+    def __init__(self, ttl: float = RESULT_CACHE_TTL, max_keys: int = RESULT_CACHE_MAX_KEYS):
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self._entries: "OrderedDict[str, List[Tuple[float, Dict]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(kind: str, model: str, params: Dict[str, Any], scope: Any) -> str:
+        """Ключ запроса: чат (scope), вид результата, модель и параметры без пустых значений"""
+        payload = {name: value for name, value in params.items() if value is not None}
+        raw = json.dumps([scope, kind, model, payload], sort_keys=True, ensure_ascii=False, default=str)
+        return f"{kind}:{scope}:" + hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+    def _fresh(self, key: str) -> List[Tuple[float, Dict]]:
+        cutoff = time.time() - self.ttl
+        entries = [entry for entry in self._entries.get(key, []) if entry[0] >= cutoff]
+        if entries:
+            self._entries[key] = entries
+        else:
+            self._entries.pop(key, None)
+        return entries
+
+    def put(self, key: str, results: List[Dict]):
+        """Сохраняет результаты (старые ключи вытесняются при переполнении)"""
+        if not results:
+            return
+        entries = self._fresh(key)
+        entries.extend((time.time(), result) for result in results)
+        self._entries[key] = entries
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_keys:
+            self._entries.popitem(last=False)
+        logger.info(f"💾 Кэш вариантов: сохранено {len(results)} ({key})")
+
+    def take(self, key: str, count: int) -> List[Dict]:
+        """Забирает до count результатов (каждый выдается один раз)"""
+        entries = self._fresh(key)
+        taken, rest = entries[:count], entries[count:]
+        if rest:
+            self._entries[key] = rest
+        else:
+            self._entries.pop(key, None)
+        self.hits += len(taken)
+        self.misses += count - len(taken)
+        return [result for _, result in taken]
+
+    def get_stats(self) -> Dict[str, int]:
+        return {
+            "keys": len(self._entries),
+            "results": sum(len(entries) for entries in self._entries.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+# Глобальный экземпляр
+result_cache = ResultCache()
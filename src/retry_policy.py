@@ -0,0 +1,336 @@
+"""
+Политики повторов внешних вызовов (Replicate, Groq, Gemini, Airtable, ImgBB)
+
+Политика описывается декларативно:
+    max_attempts  - максимум попыток, включая первую
+    base_delay,
+    max_delay     - экспоненциальная задержка с jitter между попытками
+    deadline      - общий срок вызова со всеми повторами (с)
+    retry_on      - классы ошибок, которые повторяются без изменений
+    degrade       - шаги упрощения запроса по классу ошибки, например
+                    {"unavailable": (None, "drop_reference", "simplify_prompt")}:
+                    первый повтор как есть, второй без референса, третий
+                    с упрощенным промтом. Шаги реализует вызывающий код
+    budget        - общий бюджет повторов провайдера
+
+Бюджет ограничивает долю повторов от числа запросов за окно: когда провайдер
+деградирует, повторы не умножают нагрузку на него, а вызовы быстро завершаются
+ошибкой.
+"""
+import asyncio
+import logging
+import random
+import sys
+import time
+from collections import deque
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Optional, Sequence, Tuple
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.config import (
+    RETRY_BUDGET_RATIO, RETRY_BUDGET_MIN_RETRIES, RETRY_BUDGET_WINDOW,
+    PHOTO_RETRY_DEADLINE, VIDEO_RETRY_DEADLINE, LLM_TIMEOUT, LLM_MAX_ATTEMPTS
+)
+from src.metrics import registry, record_retry, replicate_error_code
+
+logger = logging.getLogger(__name__)
+
+RETRY_GIVEUPS = registry.counter(
+    "retry_giveups_total",
+    "Calls that stopped retrying, by policy and reason",
+    ("policy", "reason")
+)
+
+# Коды Replicate -> класс ошибки
+REPLICATE_ERROR_CLASSES = {
+    "E004": "unavailable",
+    "E005": "safety",
+    "E6716": "internal",
+}
+
+TRANSIENT_STATUSES = {408: "unavailable", 425: "unavailable", 429: "rate_limited",
+                      500: "internal", 502: "unavailable", 503: "unavailable", 504: "unavailable"}
+
+
+class HTTPStatusError(Exception):
+    """Неуспешный HTTP ответ, который стоит классифицировать (429, 5xx)"""
+
+    def __init__(self, status: int, message: str = ""):
+        super().__init__(f"HTTP {status}: {message[:200]}" if message else f"HTTP {status}")
+        self.status = status
+
+
+def _status_of(error: BaseException) -> Optional[int]:
+    """HTTP статус из исключений aiohttp, openai, google-api-core и HTTPStatusError"""
+    for attr in ("status", "status_code", "code"):
+        value = getattr(error, attr, None)
+        if isinstance(value, int) and 100 <= value < 600:
+            return value
+    return None
+
+
+def classify_error(error: BaseException) -> str:
+    """
+    Класс ошибки для политики повторов
+
+    Returns:
+        unavailable, rate_limited, internal, safety, invalid или unknown
+    """
+    code = replicate_error_code(error) if isinstance(error, Exception) else type(error).__name__
+    if code in REPLICATE_ERROR_CLASSES:
+        return REPLICATE_ERROR_CLASSES[code]
+
+    name = type(error).__name__
+    if name == "ModelValidationError":
+        return "invalid"
+    if "RateLimit" in name or "ResourceExhausted" in name:
+        return "rate_limited"
+
+    status = _status_of(error)
+    if status is not None:
+        if status in TRANSIENT_STATUSES:
+            return TRANSIENT_STATUSES[status]
+        if status >= 500:
+            return "internal"
+        return "invalid"
+
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return "unavailable"
+    if "Timeout" in name or "Connect" in name or "Disconnected" in name:
+        return "unavailable"
+    return "unknown"
+
+
+class RetryBudget:
+    """
+    Бюджет повторов провайдера за скользящее окно
+
+    Повтор разрешен, пока повторов меньше min_retries + ratio * запросов:
+    при массовых сбоях лишние повторы не отправляются.
+    """
+
+    def __init__(self, ratio: float = RETRY_BUDGET_RATIO, min_retries: int = RETRY_BUDGET_MIN_RETRIES,
+                 window: float = RETRY_BUDGET_WINDOW):
+        self.ratio = ratio
+        self.min_retries = min_retries
+        self.window = window
+        self._requests: deque = deque()
+        self._retries: deque = deque()
+
+    def _trim(self, now: float):
+        for events in (self._requests, self._retries):
+            while events and events[0] < now - self.window:
+                events.popleft()
+
+    def on_request(self):
+        """Учитывает первую попытку вызова"""
+        now = time.monotonic()
+        self._trim(now)
+        self._requests.append(now)
+
+    def try_spend(self) -> bool:
+        """Забирает повтор из бюджета (False - бюджет исчерпан)"""
+        now = time.monotonic()
+        self._trim(now)
+        if len(self._retries) >= self.min_retries + self.ratio * len(self._requests):
+            return False
+        self._retries.append(now)
+        return True
+
+    def get_stats(self) -> Dict[str, int]:
+        self._trim(time.monotonic())
+        return {"requests": len(self._requests), "retries": len(self._retries)}
+
+
+# Бюджеты общие для всех политик одного провайдера
+_budgets: Dict[str, RetryBudget] = {}
+
+
+def retry_budget(provider: str) -> RetryBudget:
+    """Бюджет повторов провайдера (создается при первом обращении)"""
+    if provider not in _budgets:
+        _budgets[provider] = RetryBudget()
+    return _budgets[provider]
+
+
+class RetryPolicy:
+    """Декларативная политика повторов одного вида вызова"""
+
+    DEFAULT_RETRY_ON = ("unavailable", "rate_limited", "internal")
+
+    def __init__(
+        self,
+        name: str,
+        budget: str,
+        max_attempts: int = 3,
+        base_delay: float = 1.0,
+        max_delay: float = 30.0,
+        deadline: Optional[float] = None,
+        retry_on: Sequence[str] = DEFAULT_RETRY_ON,
+        degrade: Optional[Dict[str, Sequence[Optional[str]]]] = None
+    ):
+        """
+        Args:
+            name: Имя этапа (метка в pipeline_retries_total)
+            budget: Провайдер, с которым делится бюджет повторов
+        """
+        self.name = name
+        self.budget_name = budget
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.retry_on = tuple(retry_on)
+        self.degrade = degrade or {}
+
+    @property
+    def budget(self) -> RetryBudget:
+        return retry_budget(self.budget_name)
+
+    def backoff(self, retry: int) -> float:
+        """Задержка перед повтором номер retry (1, 2...): экспонента с jitter"""
+        ceiling = min(self.max_delay, self.base_delay * 2 ** (retry - 1))
+        return random.uniform(ceiling / 2, ceiling)
+
+    def next_step(self, error_class: str, retries_by_class: Dict[str, int]) -> Optional[str]:
+        """
+        Что делать при ошибке класса error_class
+
+        Returns:
+            None - не повторять, "" - повторить как есть, иначе имя шага упрощения
+        """
+        steps = self.degrade.get(error_class, ())
+        done = retries_by_class.get(error_class, 0)
+        if done < len(steps):
+            return steps[done] or ""
+        if error_class in self.retry_on:
+            return ""
+        return None
+
+    def give_up(self, reason: str, error: BaseException):
+        RETRY_GIVEUPS.inc(policy=self.name, reason=reason)
+        logger.warning(f"⛔ {self.name}: повторы прекращены ({reason}): {error}")
+
+    def allow_retry(self, error: BaseException, attempt: int, started: float,
+                    retries_by_class: Dict[str, int]) -> Optional[Tuple[str, float]]:
+        """
+        Проверяет попытки, класс ошибки, дедлайн и бюджет
+
+        Args:
+            attempt: Номер завершившейся попытки (с 1)
+            started: time.monotonic() начала вызова
+
+        Returns:
+            (шаг упрощения, задержка) или None, если повторять нельзя
+        """
+        error_class = classify_error(error)
+        step = self.next_step(error_class, retries_by_class)
+        if step is None:
+            self.give_up(f"not_retryable:{error_class}", error)
+            return None
+        if attempt >= self.max_attempts:
+            self.give_up("attempts", error)
+            return None
+        delay = self.backoff(attempt)
+        if self.deadline is not None and time.monotonic() - started + delay >= self.deadline:
+            self.give_up("deadline", error)
+            return None
+        if not self.budget.try_spend():
+            self.give_up("budget", error)
+            return None
+
+        retries_by_class[error_class] = retries_by_class.get(error_class, 0) + 1
+        record_retry(self.name, error_class)
+        logger.warning(
+            f"🔁 {self.name}: {error_class} ({replicate_error_code(error)}), "
+            f"попытка {attempt + 1}/{self.max_attempts} через {delay:.1f}с"
+            + (f", шаг: {step}" if step else "")
+        )
+        return step, delay
+
+    async def run(
+        self,
+        func: Callable[..., Awaitable[Any]],
+        params: Optional[Dict[str, Any]] = None,
+        degraders: Optional[Dict[str, Callable[[Dict[str, Any]], Dict[str, Any]]]] = None
+    ) -> Any:
+        """
+        Выполняет вызов с повторами
+
+        Args:
+            func: Корутина одной попытки; получает params, если они заданы
+            params: Параметры запроса, которые упрощают шаги degrade
+            degraders: Реализации шагов degrade {имя: params -> params}
+
+        Returns:
+            Результат первой успешной попытки
+
+        Raises:
+            Exception: Ошибка последней попытки
+        """
+        started = time.monotonic()
+        retries_by_class: Dict[str, int] = {}
+        attempt = 0
+        self.budget.on_request()
+
+        while True:
+            attempt += 1
+            try:
+                call = func(params) if params is not None else func()
+                if self.deadline is not None:
+                    remaining = self.deadline - (time.monotonic() - started)
+                    return await asyncio.wait_for(call, timeout=max(remaining, 0.001))
+                return await call
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                decision = self.allow_retry(e, attempt, started, retries_by_class)
+                if decision is None:
+                    raise
+                step, delay = decision
+
+            if step:
+                degrader = (degraders or {}).get(step)
+                if degrader is not None and params is not None:
+                    params = degrader(dict(params))
+            await asyncio.sleep(delay)
+
+
+# === Политики ===
+
+# Фото сцены: упрощение запроса по шагам, как раньше делали рекурсивные повторы
+REPLICATE_PHOTO = RetryPolicy(
+    "generate_photo",
+    budget="replicate",
+    max_attempts=4,
+    base_delay=3.0,
+    max_delay=20.0,
+    deadline=PHOTO_RETRY_DEADLINE,
+    degrade={
+        "unavailable": (None, "drop_reference", "simplify_prompt"),
+        "internal": (None, "drop_reference", "simplify_prompt"),
+        "safety": ("sanitize",),
+    }
+)
+
+# Видео сцены: генерация дорогая, поэтому один повтор (переключение моделей - в роутере)
+REPLICATE_VIDEO = RetryPolicy(
+    "generate_scene",
+    budget="replicate",
+    max_attempts=2,
+    base_delay=5.0,
+    max_delay=30.0,
+    deadline=VIDEO_RETRY_DEADLINE,
+)
+
+REPLICATE_UPLOAD = RetryPolicy("upload.replicate", budget="replicate", max_attempts=3, base_delay=1.0, max_delay=8.0, deadline=60)
+
+IMGBB_UPLOAD = RetryPolicy("upload.imgbb", budget="imgbb", max_attempts=3, base_delay=1.0, max_delay=8.0, deadline=120)
+
+# Логирование не должно задерживать пайплайн: короткие паузы и общий срок
+AIRTABLE = RetryPolicy("airtable", budget="airtable", max_attempts=4, base_delay=0.5, max_delay=8.0, deadline=30)
+
+# LLM: повторы и hedge-запросы выполняет llm_gateway в пределах этих лимитов
+GROQ = RetryPolicy("llm.groq", budget="groq", max_attempts=LLM_MAX_ATTEMPTS, base_delay=0.5, max_delay=4.0, deadline=LLM_TIMEOUT)
+GEMINI = RetryPolicy("llm.gemini", budget="gemini", max_attempts=LLM_MAX_ATTEMPTS, base_delay=0.5, max_delay=4.0, deadline=LLM_TIMEOUT)
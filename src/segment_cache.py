@@ -0,0 +1,98 @@
+"""
+Кэш нормализованных сегментов склейки (на диске)
+
+Итоговое видео собирается из сегментов трех видов:
+
+    body_<ключ>.mp4       - клип сцены без краев под переходы, перекодированный
+                            под профиль (размер, fps, аудио);
+    edge_<ключ>.mp4       - край первого или последнего клипа;
+    transition_<ключ>.mp4 - переход между концом клипа A и началом клипа B.
+
+Ключ - хэш содержимого клипов и параметров кодирования, поэтому сегмент
+кодируется один раз, а повторная склейка (правка одной сцены, повторная
+доставка) лишь копирует потоки (media_jobs.concat_segments); при другом
+порядке сцен кодируются только короткие сегменты новых переходов.
+Давно не использованные сегменты вытесняются, когда кэш больше
+SEGMENT_CACHE_MAX_MB.
+"""
+import hashlib
+import json
+import logging
+import os
+import sys
+from pathlib import Path
+from typing import Dict, Iterable
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.config import SEGMENT_CACHE_DIR, SEGMENT_CACHE_MAX_MB
+
+logger = logging.getLogger(__name__)
+
+
+class SegmentCache:
+    """Сегменты склейки по ключу содержимого (вытеснение по времени использования)"""
+
+    def __init__(self, root: str = SEGMENT_CACHE_DIR, max_bytes: int = SEGMENT_CACHE_MAX_MB * 1024 * 1024):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        """Хэш частей ключа (хэши клипов, вид перехода, параметры кодирования)"""
+        raw = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+    def path(self, kind: str, key: str) -> Path:
+        self.root.mkdir(parents=True, exist_ok=True)
+        return self.root / f"{kind}_{key}.mp4"
+
+    def lookup(self, path: Path) -> bool:
+        """Есть ли готовый сегмент (время использования обновляется)"""
+        if path.exists():
+            os.utime(path)
+            self.hits += 1
+            return True
+        self.misses += 1
+        return False
+
+    def evict(self, keep: Iterable[Path] = ()):
+        """Удаляет давно не использованные сегменты сверх лимита (кроме keep)"""
+        if not self.root.exists():
+            return
+        keep = {Path(path) for path in keep}
+        files = []
+        for path in self.root.glob("*.mp4"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in files)
+        removed = 0
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            if path in keep:
+                continue
+            path.unlink(missing_ok=True)
+            total -= size
+            removed += 1
+        if removed:
+            logger.info(f"🧹 Кэш сегментов: удалено {removed}, занято {total / 1024 / 1024:.0f} МБ")
+
+    def get_stats(self) -> Dict[str, int]:
+        segments = list(self.root.glob("*.mp4")) if self.root.exists() else []
+        return {
+            "segments": len(segments),
+            "bytes": sum(path.stat().st_size for path in segments if path.exists()),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+# Глобальный экземпляр
+segment_cache = SegmentCache()
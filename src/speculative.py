@@ -0,0 +1,148 @@
+"""
+Спекулятивная генерация во время подтверждения сцен
+
+Пока пользователь читает и подтверждает сцены по одной, генерация уже
+одобренной сцены (или сцены, которую долго не меняют) запускается в фоне.
+Запуск запоминает параметры генерации: финальный шаг забирает готовый
+результат, только если сцена не изменилась, иначе фоновая задача отменяется
+(вместе с предсказанием Replicate). Деньги на спекуляцию ограничены
+SPECULATIVE_BUDGET_USD на чат: в бюджет входят незабранные запуски,
+использованные результаты из него возвращаются.
+"""
+import asyncio
+import logging
+import sys
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.config import SPECULATIVE_BUDGET_USD, SPECULATIVE_IDLE_DELAY
+
+logger = logging.getLogger(__name__)
+
+
+class Speculation:
+    """Фоновая генерация одной сцены"""
+
+    def __init__(self, params: Dict[str, Any], cost_usd: float):
+        self.params = params
+        self.cost_usd = cost_usd
+        self.started = False
+        self.task: Optional[asyncio.Task] = None
+
+
+class SpeculativeRunner:
+    """Фоновые генерации по чатам (в памяти процесса)"""
+
+    def __init__(self, budget_usd: float = SPECULATIVE_BUDGET_USD, idle_delay: float = SPECULATIVE_IDLE_DELAY):
+        self.budget_usd = budget_usd
+        self.idle_delay = idle_delay
+        self._entries: Dict[int, Dict[str, Speculation]] = {}
+        self._spent: Dict[int, float] = {}
+        self.stats = {"started": 0, "used": 0, "cancelled": 0, "over_budget": 0}
+
+    def start(
+        self,
+        chat_id: int,
+        key: str,
+        params: Dict[str, Any],
+        factory: Callable[[], Awaitable[Any]],
+        cost_usd: float,
+        delay: float = 0.0
+    ) -> bool:
+        """
+        Запускает генерацию в фоне (через delay секунд)
+
+        Args:
+            chat_id: Чат пользователя
+            key: Ключ сцены в сценарии (например, "text:2")
+            params: Параметры генерации - по ним проверяется, что сцена не изменилась
+            factory: Функция без аргументов, возвращающая корутину генерации
+            cost_usd: Оценка стоимости генерации
+            delay: Задержка запуска (порог бездействия пользователя)
+
+        Returns:
+            True, если генерация запущена или уже идет с теми же параметрами
+        """
+        if self.budget_usd <= 0:
+            return False
+        existing = self._entries.get(chat_id, {}).get(key)
+        if existing is not None:
+            if existing.params == params and (existing.started or delay > 0):
+                return True
+            # Сцена изменилась или ее одобрили раньше порога бездействия
+            self.cancel(chat_id, key)
+
+        if self._spent.get(chat_id, 0.0) + cost_usd > self.budget_usd:
+            self.stats["over_budget"] += 1
+            logger.info(f"💸 Спекуляция {key} пропущена: бюджет ${self.budget_usd:.2f} исчерпан")
+            return False
+
+        entry = Speculation(params, cost_usd)
+        entry.task = asyncio.create_task(self._run(entry, factory, delay, key))
+        self._entries.setdefault(chat_id, {})[key] = entry
+        self._spent[chat_id] = self._spent.get(chat_id, 0.0) + cost_usd
+        return True
+
+    async def _run(self, entry: Speculation, factory: Callable[[], Awaitable[Any]], delay: float, key: str):
+        if delay > 0:
+            await asyncio.sleep(delay)
+        entry.started = True
+        self.stats["started"] += 1
+        logger.info(f"🔮 Спекулятивная генерация {key} запущена")
+        return await factory()
+
+    def schedule_idle(self, chat_id: int, key: str, params: Dict[str, Any],
+                      factory: Callable[[], Awaitable[Any]], cost_usd: float) -> bool:
+        """Запуск, если сцену не изменят за порог бездействия SPECULATIVE_IDLE_DELAY"""
+        if self.idle_delay <= 0:
+            return False
+        return self.start(chat_id, key, params, factory, cost_usd, delay=self.idle_delay)
+
+    def take(self, chat_id: int, key: str, params: Dict[str, Any]) -> Optional[asyncio.Task]:
+        """
+        Забирает фоновую генерацию, если она запущена с теми же параметрами
+
+        Returns:
+            Задача с результатом генерации или None (тогда генерировать заново)
+        """
+        entry = self._entries.get(chat_id, {}).get(key)
+        if entry is None:
+            return None
+        if entry.params != params or not entry.started:
+            self.cancel(chat_id, key)
+            return None
+        self._entries[chat_id].pop(key)
+        self._spent[chat_id] -= entry.cost_usd
+        self.stats["used"] += 1
+        logger.info(f"🔮 Спекуляция {key} использована")
+        return entry.task
+
+    def cancel(self, chat_id: int, key: str):
+        """Отменяет фоновую генерацию сцены (сцена изменилась)"""
+        entry = self._entries.get(chat_id, {}).pop(key, None)
+        if entry is None:
+            return
+        entry.task.cancel()
+        if entry.started:
+            # Начатое предсказание могли успеть оплатить - бюджет не возвращаем
+            self.stats["cancelled"] += 1
+            logger.info(f"⏹ Спекуляция {key} отменена")
+        else:
+            self._spent[chat_id] -= entry.cost_usd
+
+    def clear(self, chat_id: int, prefix: str = ""):
+        """Отменяет фоновые генерации чата (с ключом на prefix); без prefix - и бюджет"""
+        for key in [key for key in self._entries.get(chat_id, {}) if key.startswith(prefix)]:
+            self.cancel(chat_id, key)
+        if not prefix:
+            self._entries.pop(chat_id, None)
+            self._spent.pop(chat_id, None)
+
+    def get_stats(self) -> Dict[str, int]:
+        return {**self.stats, "running": sum(len(entries) for entries in self._entries.values())}
+
+
+# Глобальный экземпляр
+speculative = SpeculativeRunner()